@@ -192,7 +192,7 @@ function FSMCall:get_playnode_audiofile(current_node)
     if current_node.audiofile_id then
         --Get audio path
         local current_audio = self.db.list_audio[tonumber(current_node.audiofile_id)]
-        local filetoplay = UPLOAD_DIR..current_audio.audio_file
+        local filetoplay = playback_audiofile(current_audio.audio_file)
         self.debugger:msg("DEBUG", "Prepare StreamFile : "..filetoplay)
         return filetoplay
     else
@@ -284,8 +284,8 @@ function FSMCall:getdigitnode(current_node)
     end
     --Get Invalid Audio
     if current_node.invalid_audiofile_id then
-        invalid_audiofile = UPLOAD_DIR..
-            self.db.list_audio[tonumber(current_node.invalid_audiofile_id)].audio_file
+        invalid_audiofile = playback_audiofile(
+            self.db.list_audio[tonumber(current_node.invalid_audiofile_id)].audio_file)
     end
     --Get DTMF Filter
     if current_node.type == MULTI_CHOICE then
@@ -325,7 +325,7 @@ function FSMCall:getdigitnode(current_node)
             --Get audio path
             self.debugger:msg("DEBUG", "Play Audio GetDigits")
             current_audio = self.db.list_audio[tonumber(current_node.audiofile_id)]
-            filetoplay = UPLOAD_DIR..current_audio.audio_file
+            filetoplay = playback_audiofile(current_audio.audio_file)
             self.debugger:msg("INFO", "Play Audiofile : "..filetoplay)
 
             digits = self.session:playAndGetDigits(1, number_digits, retries,
@@ -121,6 +121,32 @@ function audio_lenght(audio_file)
     end
 end
 
+--
+-- Return the path of an uploaded audio, prefer the 8kHz mono wav variant
+-- pre-generated by the audio_transcode task to avoid resampling
+--
+function playback_audiofile(audio_file)
+    local variant = (string.gsub(audio_file, '%.%w+$', '.8k.wav'))
+    if variant ~= audio_file and file_exists(UPLOAD_DIR..variant) then
+        return UPLOAD_DIR..variant
+    end
+    return UPLOAD_DIR..audio_file
+end
+
+--
+-- Return the path of the audio of the text pre-rendered by the
+-- survey_prerender_tts task, named as survey.tts_cache.get_tts_key names it,
+-- or nil if not rendered
+--
+function tts_cache_file(engine, voice, language, text, tts_dir)
+    local md5 = require "md5"
+    local output_file = tts_dir..engine..'_'..md5.sumhexa(voice..string.lower(language)..text)..'.wav'
+    if file_exists(output_file) then
+        return output_file
+    end
+    return nil
+end
+
 --
 -- Create TTS audio using a speech processing engine
 --
@@ -182,6 +208,16 @@ function tts(text, tts_dir)
 
     elseif TTS_ENGINE == 'acapela' then
         --Acapela
+        text = trim(text)
+        if string.len(text) == 0 then
+            return false
+        end
+        output_file = tts_cache_file('acapela', (ACAPELA_GENDER or '')..'_'..(ACAPELA_INTONATION or ''),
+            ACAPELA_LANG or '', text, tts_dir)
+        if output_file then
+            return output_file
+        end
+
         Acapela = require "acapela"
         tts_acapela = Acapela:new{
             ACCOUNT_LOGIN=ACCOUNT_LOGIN,
@@ -196,6 +232,15 @@ function tts(text, tts_dir)
 
     elseif TTS_ENGINE == 'mstranslator' then
         -- Microsoft Translator
+        text = trim(text)
+        if string.len(text) == 0 then
+            return false
+        end
+        output_file = tts_cache_file('mstranslator', '', MSTRANSLATOR_LANG or '', text, tts_dir)
+        if output_file then
+            return output_file
+        end
+
         MSTranslator = require "mstranslator"
         tts_mstranslator = MSTranslator:new{
             client_id=CLIENT_ID,
@@ -14,16 +14,37 @@
 #
 from rest_framework import viewsets
 from apirest.api_appointment.event_serializers import EventSerializer
-from rest_framework.decorators import action
+from rest_framework.decorators import action, list_route
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
-from appointment.models.events import Event
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from appointment.models.events import Event, OccurrenceIndex
 from appointment.function_def import get_calendar_user_id_list
 from apirest.permissions import CustomObjectPermissions
+from datetime import datetime, time
 import ast
 
 
+def parse_occurrence_date(value):
+    """Parse a date or a datetime, naive values are taken as UTC"""
+    if not value:
+        return None
+    try:
+        date_value = parse_datetime(value)
+        if date_value is None:
+            date_value = parse_date(value)
+            if date_value is None:
+                return None
+            date_value = datetime.combine(date_value, time())
+    except ValueError:
+        return None
+    if timezone.is_naive(date_value):
+        date_value = timezone.make_aware(date_value, timezone.utc)
+    return date_value
+
+
 class EventViewSet(viewsets.ModelViewSet):
 
     """
@@ -43,6 +64,32 @@ class EventViewSet(viewsets.ModelViewSet):
             queryset = Event.objects.filter(creator_id__in=calendar_user_list)
         return queryset
 
+    @list_route(methods=['GET'])
+    def occurrences(self, request):
+        """
+        it will list the occurrences of the events between start and end
+
+        CURL Usage::
+
+            curl -u username:password -H 'Accept: application/json' 'http://localhost:8000/rest-api/event/occurrences/?start=2015-06-01&end=2015-07-01'
+        """
+        start = parse_occurrence_date(request.QUERY_PARAMS.get('start'))
+        end = parse_occurrence_date(request.QUERY_PARAMS.get('end'))
+        if not start or not end or start >= end:
+            return Response({'error': 'start and end must be valid dates, with start before end'})
+
+        occurrence_list = OccurrenceIndex.objects.get_occurrences(self.get_queryset(), start, end)
+        list_data = []
+        for occurrence in sorted(occurrence_list):
+            list_data.append({
+                'event': 'http://%s/rest-api/event/%s/' % (self.request.META['HTTP_HOST'], str(occurrence.event_id)),
+                'title': occurrence.title or occurrence.event.title,
+                'start': str(occurrence.start),
+                'end': str(occurrence.end),
+                'cancelled': occurrence.cancelled,
+            })
+        return Response(list_data)
+
     @action(methods=['PATCH'])
     def update_last_child_status(self, request, pk=None):
         """it will update last child event status"""
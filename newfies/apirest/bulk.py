@@ -0,0 +1,340 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Bulk endpoints of the REST API
+
+The items are posted as a JSON array, or as NDJSON (one JSON object per line,
+Content-Type: application/x-ndjson). They are validated as a batch, the valid
+items are written in one transaction & the response lists the result of each
+item, in the order of the items::
+
+    [
+        {"index": 0, "status": "created", "id": 1201, "request_uuid": "..."},
+        {"index": 1, "status": "error", "errors": {"phone_number": ["This field is required."]}}
+    ]
+
+Above BULK_API_SYNC_LIMIT items, or with ``?async=1``, the items are stored
+in the cache & processed by the bulk_api_job task, the 202 response gives
+the url of the job, which lists the results once done.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.parsers import BaseParser, JSONParser, ParseError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from dialer_campaign.models import Campaign, Subscriber
+from dialer_campaign.constants import SUBSCRIBER_STATUS
+from dialer_cdr.models import Callrequest
+from uuid import uuid1
+import json
+import logging
+
+logger = logging.getLogger('newfies.filelog')
+
+# Above BULK_API_SYNC_LIMIT items a request is processed as a job
+BULK_API_SYNC_LIMIT = getattr(settings, 'BULK_API_SYNC_LIMIT', 1000)
+BULK_API_MAX_ITEMS = getattr(settings, 'BULK_API_MAX_ITEMS', 100000)
+# Seconds the items & the results of a job are kept in the cache
+BULK_JOB_TTL = getattr(settings, 'BULK_JOB_TTL', 86400)
+# Ids per IN (...) list & rows per INSERT
+BULK_CHUNK = 500
+
+CALLREQUEST_BULK_FIELDS = (
+    'request_uuid', 'call_time', 'call_type', 'callerid', 'caller_name', 'phone_number',
+    'timeout', 'timelimit', 'extra_dial_string', 'extra_data', 'object_id',
+)
+CALLREQUEST_CONTENT_TYPE = ('survey_template', 'survey')
+
+# action => (statuses it applies to, new status)
+SUBSCRIBER_TRANSITION = {
+    'pause': ((SUBSCRIBER_STATUS.PENDING,), SUBSCRIBER_STATUS.PAUSE),
+    'resume': ((SUBSCRIBER_STATUS.PAUSE,), SUBSCRIBER_STATUS.PENDING),
+    'cancel': ((SUBSCRIBER_STATUS.PENDING, SUBSCRIBER_STATUS.PAUSE), SUBSCRIBER_STATUS.ABORT),
+    'requeue': ((SUBSCRIBER_STATUS.PAUSE, SUBSCRIBER_STATUS.ABORT, SUBSCRIBER_STATUS.FAIL,
+                 SUBSCRIBER_STATUS.NOT_AUTHORIZED, SUBSCRIBER_STATUS.COMPLETED), SUBSCRIBER_STATUS.PENDING),
+}
+
+
+class NDJSONParser(BaseParser):
+
+    """Parse a body of one JSON object per line into a list"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        item_list = []
+        for (number, line) in enumerate(stream.read().decode('utf-8').splitlines()):
+            if not line.strip():
+                continue
+            try:
+                item_list.append(json.loads(line))
+            except ValueError as e:
+                raise ParseError('NDJSON parse error on line %d - %s' % (number + 1, e))
+        return item_list
+
+
+def chunks(value_list, size=BULK_CHUNK):
+    for i in range(0, len(value_list), size):
+        yield value_list[i:i + size]
+
+
+def get_related_id(value):
+    """
+    Id of a related object given as an id or as the url of the object
+
+    >>> get_related_id('/rest-api/gateway/12/')
+    12
+    """
+    if isinstance(value, basestring):
+        value = value.rstrip('/').rsplit('/', 1)[-1]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def owned_by(queryset, user, lookup='user'):
+    return queryset if user.is_superuser else queryset.filter(**{lookup: user})
+
+
+def bulk_create_callrequest(user, item_list):
+    """
+    Create the pending callrequests of the valid items, with a few queries
+    to validate the batch & one INSERT per BULK_CHUNK callrequests
+    """
+    opts = Callrequest._meta
+    result_list = [None] * len(item_list)
+    value_list = [None] * len(item_list)
+    related_id = {'aleg_gateway': set(), 'campaign': set(), 'content_type': set()}
+    uuid_list = []
+    for (index, item) in enumerate(item_list):
+        if not isinstance(item, dict):
+            result_list[index] = {'index': index, 'status': 'error', 'errors': {'item': ['Not an object']}}
+            continue
+        (values, errors) = ({}, {})
+        for name in CALLREQUEST_BULK_FIELDS:
+            if name not in item and name not in ('phone_number', 'object_id'):
+                continue
+            try:
+                values[name] = opts.get_field(name).clean(item.get(name), None)
+            except ValidationError as e:
+                errors[name] = e.messages
+        for name in related_id:
+            if item.get(name) in (None, ''):
+                continue
+            values[name] = get_related_id(item[name])
+            if values[name] is None:
+                errors[name] = ['Invalid id']
+            else:
+                related_id[name].add(values[name])
+        if 'content_type' not in values:
+            errors['content_type'] = ['This field is required.']
+        if values.get('call_time') and timezone.is_naive(values['call_time']):
+            values['call_time'] = timezone.make_aware(values['call_time'], timezone.utc)
+        values['request_uuid'] = values.get('request_uuid') or str(uuid1())
+        if errors:
+            result_list[index] = {'index': index, 'status': 'error', 'errors': errors}
+        else:
+            value_list[index] = values
+            uuid_list.append(values['request_uuid'])
+
+    # Validate the related objects of the whole batch at once
+    allowed_id = {'aleg_gateway': set(), 'campaign': set()}
+    if related_id['aleg_gateway']:
+        allowed_id['aleg_gateway'].update(user.userprofile.userprofile_gateway
+                                          .filter(id__in=related_id['aleg_gateway']).values_list('id', flat=True))
+    if related_id['campaign']:
+        allowed_id['campaign'].update(owned_by(Campaign.objects.filter(id__in=related_id['campaign']), user)
+                                      .values_list('id', flat=True))
+    content_type_list = ContentType.objects.filter(id__in=related_id['content_type'],
+                                                   model__in=CALLREQUEST_CONTENT_TYPE)
+    allowed_id['content_type'] = set([content_type.id for content_type in content_type_list])
+    allowed_object = set()
+    for content_type in content_type_list:
+        object_id_list = [values['object_id'] for values in value_list
+                          if values and values['content_type'] == content_type.id]
+        for id_list in chunks(object_id_list):
+            queryset = owned_by(content_type.model_class().objects.filter(id__in=id_list), user)
+            allowed_object.update([(content_type.id, pk) for pk in queryset.values_list('id', flat=True)])
+    existing_uuid = set()
+    for uuid_chunk in chunks(uuid_list):
+        existing_uuid.update(Callrequest.objects.filter(user=user, request_uuid__in=uuid_chunk)
+                             .values_list('request_uuid', flat=True))
+
+    callrequest_list = []
+    batch_uuid = set()
+    for (index, values) in enumerate(value_list):
+        if values is None:
+            continue
+        errors = {}
+        for name in allowed_id:
+            if values.get(name) and values[name] not in allowed_id[name]:
+                errors[name] = ['Invalid id']
+        if (values['content_type'], values['object_id']) not in allowed_object and 'content_type' not in errors:
+            errors['object_id'] = ['Invalid id']
+        if values['request_uuid'] in existing_uuid or values['request_uuid'] in batch_uuid:
+            errors['request_uuid'] = ['Duplicate request_uuid']
+        if errors:
+            result_list[index] = {'index': index, 'status': 'error', 'errors': errors}
+            continue
+        batch_uuid.add(values['request_uuid'])
+        for name in related_id:
+            if name in values:
+                values[name + '_id'] = values.pop(name)
+        callrequest_list.append((index, Callrequest(user=user, **values)))
+
+    with transaction.atomic():
+        Callrequest.objects.bulk_create([callrequest for (index, callrequest) in callrequest_list],
+                                        batch_size=BULK_CHUNK)
+        # bulk_create does not set the ids, they are read back by request_uuid
+        callrequest_id = {}
+        for uuid_chunk in chunks([callrequest.request_uuid for (index, callrequest) in callrequest_list]):
+            callrequest_id.update(Callrequest.objects.filter(user=user, request_uuid__in=uuid_chunk)
+                                  .values_list('request_uuid', 'id'))
+    for (index, callrequest) in callrequest_list:
+        result_list[index] = {'index': index, 'status': 'created', 'id': callrequest_id.get(callrequest.request_uuid),
+                              'request_uuid': callrequest.request_uuid}
+    return result_list
+
+
+def bulk_update_subscriber(user, item_list):
+    """
+    Apply the actions of SUBSCRIBER_TRANSITION to the subscribers, with one
+    UPDATE per action & BULK_CHUNK subscribers on their locked rows
+    """
+    result_list = [None] * len(item_list)
+    action_list = []
+    for (index, item) in enumerate(item_list):
+        subscriber_id = get_related_id(item.get('id')) if isinstance(item, dict) else None
+        action = item.get('action') if isinstance(item, dict) else None
+        if subscriber_id is None:
+            result_list[index] = {'index': index, 'status': 'error', 'errors': {'id': ['Invalid id']}}
+        elif action not in SUBSCRIBER_TRANSITION:
+            result_list[index] = {'index': index, 'status': 'error',
+                                  'errors': {'action': ['Choose one of %s' % ', '.join(sorted(SUBSCRIBER_TRANSITION))]}}
+        else:
+            action_list.append((index, subscriber_id, action))
+
+    with transaction.atomic():
+        subscriber_status = {}
+        for id_list in chunks(list(set([subscriber_id for (index, subscriber_id, action) in action_list]))):
+            queryset = owned_by(Subscriber.objects.select_for_update().filter(id__in=id_list), user, 'campaign__user')
+            subscriber_status.update(queryset.values_list('id', 'status'))
+
+        update_id = dict([(action, []) for action in SUBSCRIBER_TRANSITION])
+        for (index, subscriber_id, action) in action_list:
+            (from_status, to_status) = SUBSCRIBER_TRANSITION[action]
+            current_status = subscriber_status.get(subscriber_id)
+            if current_status is None:
+                result_list[index] = {'index': index, 'status': 'error', 'errors': {'id': ['Invalid id']}}
+            elif current_status == to_status:
+                result_list[index] = {'index': index, 'status': 'unchanged', 'id': subscriber_id}
+            elif current_status not in from_status:
+                result_list[index] = {'index': index, 'status': 'error', 'id': subscriber_id,
+                                      'errors': {'action': ['Cannot %s a subscriber of status %s' %
+                                                            (action, current_status)]}}
+            else:
+                # The status of the later items is the one set by the earlier items
+                subscriber_status[subscriber_id] = to_status
+                update_id[action].append(subscriber_id)
+                result_list[index] = {'index': index, 'status': 'updated', 'id': subscriber_id}
+
+        # update() does not set the auto_now updated_date read by the syncs
+        now = timezone.now()
+        for (action, id_list) in update_id.items():
+            to_status = SUBSCRIBER_TRANSITION[action][1]
+            for id_chunk in chunks(id_list):
+                if action == 'requeue':
+                    Subscriber.objects.filter(id__in=id_chunk)\
+                        .update(status=to_status, count_attempt=0, completion_count_attempt=0, updated_date=now)
+                else:
+                    Subscriber.objects.filter(id__in=id_chunk).update(status=to_status, updated_date=now)
+    return result_list
+
+
+BULK_HANDLER = {
+    'callrequest': bulk_create_callrequest,
+    'subscriber': bulk_update_subscriber,
+}
+
+
+def get_job_key(job_id):
+    return 'bulk_job:%s' % job_id
+
+
+def start_bulk_job(kind, user, item_list):
+    """Store the items of a job & queue its task, return the job id"""
+    from apirest.tasks import bulk_api_job
+    job_id = str(uuid1())
+    cache.set(get_job_key(job_id), {'kind': kind, 'user_id': user.id, 'status': 'pending',
+                                    'item_count': len(item_list), 'items': item_list}, BULK_JOB_TTL)
+    bulk_api_job.delay(job_id)
+    return job_id
+
+
+def run_bulk_job(job_id):
+    """Process the items of a pending job, store the results in place of the items"""
+    job = cache.get(get_job_key(job_id))
+    if not job or job['status'] != 'pending':
+        return False
+    job['status'] = 'running'
+    cache.set(get_job_key(job_id), dict(job, items=None), BULK_JOB_TTL)
+    try:
+        result_list = BULK_HANDLER[job['kind']](User.objects.get(pk=job['user_id']), job['items'])
+    except Exception as e:
+        logger.error("Bulk job %s failed: %s" % (job_id, e))
+        cache.set(get_job_key(job_id), dict(job, items=None, status='failed'), BULK_JOB_TTL)
+        raise
+    cache.set(get_job_key(job_id), dict(job, items=None, status='done', results=result_list), BULK_JOB_TTL)
+    return True
+
+
+class BulkAPIView(APIView):
+
+    """
+    POST of the items of a bulk endpoint
+
+    **Attributes**:
+
+        * ``kind`` - key of the handler of the items in BULK_HANDLER
+    """
+    authentication = (BasicAuthentication, SessionAuthentication)
+    parser_classes = (JSONParser, NDJSONParser)
+    kind = None
+
+    def post(self, request):
+        item_list = request.DATA
+        if isinstance(item_list, dict):
+            item_list = item_list.get('items')
+        if not isinstance(item_list, list) or not item_list:
+            return Response({'error': 'Post a JSON array or NDJSON of the items'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(item_list) > BULK_API_MAX_ITEMS:
+            return Response({'error': 'Too many items, the maximum is %d' % BULK_API_MAX_ITEMS},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if request.QUERY_PARAMS.get('async') or len(item_list) > BULK_API_SYNC_LIMIT:
+            job_id = start_bulk_job(self.kind, request.user, item_list)
+            return Response({'job': job_id, 'url': reverse('bulk_job', args=[job_id])},
+                            status=status.HTTP_202_ACCEPTED)
+        return Response(BULK_HANDLER[self.kind](request.user, item_list))
@@ -14,10 +14,11 @@
 #
 from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
+from apirest.mixins import SparseFieldsMixin
 from dialer_cdr.models import Callrequest
 
 
-class CallrequestSerializer(serializers.HyperlinkedModelSerializer):
+class CallrequestSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
 
     """
     **Create**:
@@ -45,6 +46,8 @@ class CallrequestSerializer(serializers.HyperlinkedModelSerializer):
 
             curl -u username:password -H 'Accept: application/json' http://localhost:8000/rest-api/callrequest/%callreq_id%/
 
+            curl -u username:password -H 'Accept: application/json' 'http://localhost:8000/rest-api/callrequest/?updated_since=2015-01-20T10:00:00&fields=url,status'
+
         Response::
 
             {
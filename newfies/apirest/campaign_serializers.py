@@ -16,6 +16,7 @@
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 from rest_framework import serializers
+from apirest.mixins import SparseFieldsMixin
 from dialer_campaign.models import Campaign
 from dialer_campaign.function_def import user_dialer_setting, check_dialer_setting,\
     dialer_setting_limit
@@ -25,7 +26,7 @@ from dnc.models import DNC
 from sms.models import Gateway as SMS_Gateway
 
 
-class CampaignSerializer(serializers.HyperlinkedModelSerializer):
+class CampaignSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
 
     """
     **Create**:
@@ -102,7 +103,15 @@ class CampaignSerializer(serializers.HyperlinkedModelSerializer):
                         "saturday": true,
                         "sunday": true,
                         "completion_maxretry": 0,
-                        "completion_intervalretry": 900
+                        "completion_intervalretry": 900,
+                        "stats": {
+                            "contact": 100,
+                            "active_contact": 98,
+                            "subscriber": 98,
+                            "status": {"1": 40, "5": 58},
+                            "sent": 58,
+                            "completion": 58
+                        }
                     }
                 ]
             }
@@ -144,6 +153,7 @@ class CampaignSerializer(serializers.HyperlinkedModelSerializer):
             }
     """
     user = serializers.Field(source='user')
+    stats = serializers.Field(source='stats')
     sms_gateway = serializers.HyperlinkedRelatedField(
         read_only=False, view_name='sms-gateway-detail')
 
@@ -158,7 +168,7 @@ class CampaignSerializer(serializers.HyperlinkedModelSerializer):
             'calltimeout', 'daily_start_time', 'daily_stop_time',
             'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
             'saturday', 'sunday', 'completion_maxretry', 'sms_gateway',
-            'completion_intervalretry',
+            'completion_intervalretry', 'stats',
             # 'agent_script', 'lead_disposition', 'external_link'
         )
 
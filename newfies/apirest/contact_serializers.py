@@ -14,10 +14,11 @@
 #
 
 from rest_framework import serializers
+from apirest.mixins import SparseFieldsMixin
 from dialer_contact.models import Phonebook, Contact
 
 
-class ContactSerializer(serializers.HyperlinkedModelSerializer):
+class ContactSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
 
     """
     **Create**:
@@ -0,0 +1,224 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Incremental syncs of the REST API
+
+A list requested with ``cursor`` or ``updated_since`` is paged on
+(updated_date, id), the ``cursor`` of the response resumes the sync after
+its last row, rows updated since are listed again. The rows updated in the
+last API_CURSOR_LAG seconds are listed by a later sync, once the
+transactions which may still insert rows before them are committed::
+
+    curl -u username:password 'http://localhost:8000/rest-api/callrequest/?updated_since=2015-01-20T10:00:00&fields=url,status'
+
+    {
+        "next": "http://localhost:8000/rest-api/callrequest/?cursor=WyJ1cGRhdGVk...&updated_since=2015-01-20T10:00:00&fields=url,status",
+        "cursor": "WyJ1cGRhdGVk...",
+        "results": [...]
+    }
+
+``fields=`` renders only the listed fields, the queryset then loads only
+their columns & joins only their relations. The lists & the objects are
+sent with an ETag, answered by a 304 when the client copy is current.
+"""
+
+from django.conf import settings
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.templatetags.rest_framework import replace_query_param
+from mod_utils.pagination import encode_cursor, decode_cursor
+from calendar import timegm
+from datetime import timedelta
+import hashlib
+
+API_CURSOR_PAGE_SIZE = getattr(settings, 'API_CURSOR_PAGE_SIZE', 100)
+API_CURSOR_MAX_PAGE_SIZE = getattr(settings, 'API_CURSOR_MAX_PAGE_SIZE', 1000)
+API_CURSOR_LAG = getattr(settings, 'API_CURSOR_LAG', 60)
+
+
+def get_requested_fields(request):
+    """Names of the ``fields=`` parameter of a GET, None for all the fields"""
+    if request is None or request.method != 'GET' or not request.QUERY_PARAMS.get('fields'):
+        return None
+    return set([name.strip() for name in request.QUERY_PARAMS['fields'].split(',') if name.strip()])
+
+
+class SparseFieldsMixin(object):
+
+    """Serializer rendering only the fields of the ``fields=`` parameter"""
+
+    def get_fields(self, *args, **kwargs):
+        fields = super(SparseFieldsMixin, self).get_fields(*args, **kwargs)
+        requested = get_requested_fields(self.context.get('request'))
+        if requested:
+            for name in list(fields.keys()):
+                if name not in requested:
+                    del fields[name]
+        return fields
+
+
+class IncrementalListMixin(object):
+
+    """
+    ModelViewSet listing with a cursor on (updated_date, id) & answering
+    the conditional GET, its serializer uses SparseFieldsMixin
+
+    **Attributes**:
+
+        * ``sync_field`` - date field updated on each save of the model
+    """
+    sync_field = 'updated_date'
+
+    def filter_queryset(self, queryset):
+        """Join & load only what the serializer renders"""
+        queryset = super(IncrementalListMixin, self).filter_queryset(queryset)
+        if self.request.method != 'GET':
+            return queryset
+        opts = queryset.model._meta
+        only_list = ['id', self.sync_field]
+        (select_list, prefetch_list) = ([], [])
+        deferrable = True
+        for (name, field) in self.get_serializer().fields.items():
+            source = (getattr(field, 'source', None) or name).split('.')[0]
+            if name == 'url' or source == '*':
+                continue
+            try:
+                (model_field, model, direct, m2m) = opts.get_field_by_name(source)
+            except FieldDoesNotExist:
+                # property or method of the model, it may read any column
+                deferrable = False
+                continue
+            if m2m:
+                prefetch_list.append(source)
+            elif not direct:
+                deferrable = False
+            else:
+                only_list.append(source)
+                if model_field.rel:
+                    select_list.append(source)
+        if select_list:
+            queryset = queryset.select_related(*select_list)
+        if prefetch_list:
+            queryset = queryset.prefetch_related(*prefetch_list)
+        if deferrable and get_requested_fields(self.request):
+            queryset = queryset.only(*only_list)
+        return queryset
+
+    def get_cursor_page_size(self):
+        try:
+            page_size = int(self.request.QUERY_PARAMS.get('page_size', API_CURSOR_PAGE_SIZE))
+        except ValueError:
+            page_size = API_CURSOR_PAGE_SIZE
+        return min(max(page_size, 1), API_CURSOR_MAX_PAGE_SIZE)
+
+    def prepare_row_list(self, row_list):
+        """Hook fetching the data of the rows of a page at once"""
+        return row_list
+
+    def get_etag(self, row_list, *extra):
+        """ETag of the rows as rendered for this request"""
+        data = [self.request.get_full_path(), self.request.META.get('HTTP_ACCEPT'), self.request.user.pk]
+        data += list(extra)
+        data += [(obj.pk, str(getattr(obj, self.sync_field))) for obj in row_list]
+        return '"%s"' % hashlib.md5(repr(data).encode('utf-8')).hexdigest()
+
+    def conditional_response(self, etag, get_data, last_modified=None):
+        """
+        Response of the data, a 304 if the ETag of the client matches or,
+        without ETag, if the object was not modified since its copy
+        """
+        if_none_match = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            not_modified = etag in [tag.strip() for tag in if_none_match.split(',')]
+        elif last_modified:
+            if_modified_since = parse_http_date_safe(self.request.META.get('HTTP_IF_MODIFIED_SINCE'))
+            not_modified = if_modified_since is not None and \
+                timegm(last_modified.utctimetuple()) <= if_modified_since
+        else:
+            not_modified = False
+
+        if not_modified:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(get_data())
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        updated_since = request.QUERY_PARAMS.get('updated_since')
+        if updated_since:
+            try:
+                value = parse_datetime(updated_since)
+            except ValueError:
+                value = None
+            if value is None:
+                return Response({'error': 'updated_since is not a valid datetime'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if settings.USE_TZ and timezone.is_naive(value):
+                value = timezone.make_aware(value, timezone.utc)
+            queryset = queryset.filter(**{'%s__gte' % self.sync_field: value})
+
+        if 'cursor' not in request.QUERY_PARAMS and not updated_since:
+            # page number pagination
+            self.object_list = queryset
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return self.conditional_response(
+                    self.get_etag(queryset), lambda: self.get_serializer(queryset, many=True).data)
+            return self.conditional_response(
+                self.get_etag(page.object_list, page.paginator.count),
+                lambda: self.get_pagination_serializer(page).data)
+
+        # a row saved by a running transaction is older than the rows
+        # committed meanwhile, the cursor must not pass over it
+        queryset = queryset.filter(**{'%s__lte' % self.sync_field: timezone.now() - timedelta(seconds=API_CURSOR_LAG)})
+
+        cursor = request.QUERY_PARAMS.get('cursor')
+        if cursor:
+            position = decode_cursor(cursor, self.sync_field, queryset.model)
+            if position is None:
+                return Response({'error': 'cursor is not valid'}, status=status.HTTP_400_BAD_REQUEST)
+            (value, pk) = position[:2]
+            queryset = queryset.filter(Q(**{'%s__gt' % self.sync_field: value}) |
+                                       Q(**{self.sync_field: value, 'id__gt': pk}))
+
+        page_size = self.get_cursor_page_size()
+        row_list = list(queryset.order_by(self.sync_field, 'id')[:page_size + 1])
+        has_next = len(row_list) > page_size
+        row_list = self.prepare_row_list(row_list[:page_size])
+        if row_list:
+            cursor = encode_cursor(self.sync_field, row_list[-1], 'next')
+
+        def get_data():
+            return {
+                'next': replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if has_next else None,
+                'cursor': cursor or None,
+                'results': self.get_serializer(row_list, many=True).data,
+            }
+        return self.conditional_response(self.get_etag(row_list), get_data)
+
+    def retrieve(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return self.conditional_response(
+            self.get_etag([self.object]), lambda: self.get_serializer(self.object).data,
+            getattr(self.object, self.sync_field))
@@ -13,10 +13,11 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 from rest_framework import serializers
+from apirest.mixins import SparseFieldsMixin
 from dialer_contact.models import Phonebook
 
 
-class PhonebookSerializer(serializers.HyperlinkedModelSerializer):
+class PhonebookSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
 
     """
     **Create**:
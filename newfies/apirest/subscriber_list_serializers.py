@@ -13,10 +13,11 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 from rest_framework import serializers
+from apirest.mixins import SparseFieldsMixin
 from dialer_campaign.models import Subscriber
 
 
-class SubscriberListSerializer(serializers.HyperlinkedModelSerializer):
+class SubscriberListSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
 
     """
     **Read**:
@@ -25,6 +26,8 @@ class SubscriberListSerializer(serializers.HyperlinkedModelSerializer):
 
             curl -u username:password -H 'Accept: application/json' http://localhost:8000/rest-api/subscriber-list/
 
+            curl -u username:password -H 'Accept: application/json' 'http://localhost:8000/rest-api/subscriber-list/?updated_since=2015-01-20T10:00:00&fields=url,status'
+
         Response::
 
             [
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from celery.task import Task
+from celery.utils.log import get_task_logger
+from apirest.bulk import run_bulk_job
+from mod_utils.lease_lock import lease_lock
+
+logger = get_task_logger(__name__)
+
+
+class bulk_api_job(Task):
+
+    """
+    Process the items of a bulk request of the REST API stored in the cache
+
+    **Usage**:
+
+        bulk_api_job.delay(job_id)
+    """
+
+    @lease_lock("bulk_api_job-{job_id}")
+    def run(self, job_id, **kwargs):
+        logger.info("TASK :: bulk_api_job %s" % job_id)
+        return run_bulk_job(job_id)
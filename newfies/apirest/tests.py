@@ -0,0 +1,112 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils.timezone import utc
+from django_lets_go.utils import BaseAuthenticatedClient
+from dialer_campaign.models import Subscriber
+from dialer_campaign.constants import SUBSCRIBER_STATUS
+from dialer_cdr.models import Callrequest
+from datetime import datetime, timedelta
+from uuid import uuid1
+import json
+
+
+class ApiRestCustomerView(BaseAuthenticatedClient):
+
+    """Test cases for the REST API"""
+
+    fixtures = ['auth_user.json', 'gateway.json', 'dialer_setting.json',
+                'user_profile.json', 'phonebook.json', 'contact.json',
+                'dnc_list.json', 'dnc_contact.json', 'campaign.json',
+                'subscriber.json',
+                'survey_template.json', 'survey.json',
+                'section_template.json', 'section.json',
+                'callrequest.json', 'voipcall.json',
+                ]
+
+    def test_api_callrequest_sync(self):
+        """Test the incremental sync of the callrequests by the REST API"""
+        for i in range(2):
+            Callrequest.objects.create(
+                request_uuid=str(uuid1()), call_time=datetime.utcnow().replace(tzinfo=utc),
+                phone_number='123456789', user_id=1, campaign_id=1, aleg_gateway_id=1,
+                subscriber_id=1, content_type=ContentType.objects.get(model='survey'), object_id=1)
+        # The last callrequest is updated within the lag, it is not listed yet
+        last_id = Callrequest.objects.order_by('-id')[0].id
+        Callrequest.objects.exclude(id=last_id)\
+            .update(updated_date=datetime.utcnow().replace(tzinfo=utc) - timedelta(minutes=5))
+        url = '/rest-api/callrequest/?format=json&page_size=1&fields=url,status&cursor='
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(set(data['results'][0].keys()), set(['url', 'status']))
+        self.assertTrue(data['next'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url + data['cursor'])
+        self.assertEqual(response.status_code, 200)
+        next_data = json.loads(response.content)
+        self.assertEqual(len(next_data['results']), 1)
+        self.assertNotEqual(next_data['results'][0]['url'], data['results'][0]['url'])
+        self.assertEqual(next_data['next'], None)
+
+        response = self.client.get(url + 'invalid')
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_bulk_callrequest(self):
+        """Test the bulk creation of callrequests by the REST API"""
+        content_type_id = ContentType.objects.get(model='survey').id
+        item_list = [
+            {'phone_number': '123456789', 'content_type': content_type_id, 'object_id': 1, 'campaign': 1},
+            {'content_type': content_type_id, 'object_id': 1},
+            {'phone_number': '123456780', 'content_type': content_type_id, 'object_id': 1, 'call_type': 9},
+        ]
+        response = self.client.post('/rest-api/bulk-callrequest/', json.dumps(item_list),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        result_list = json.loads(response.content)
+        self.assertEqual([result['status'] for result in result_list], ['created', 'error', 'error'])
+        self.assertTrue(Callrequest.objects.filter(id=result_list[0]['id'], phone_number='123456789').exists())
+        self.assertTrue('phone_number' in result_list[1]['errors'])
+        self.assertTrue('call_type' in result_list[2]['errors'])
+
+        # request_uuid makes the retry of a bulk request idempotent
+        item_list = [dict(item_list[0], request_uuid=result_list[0]['request_uuid'])]
+        response = self.client.post('/rest-api/bulk-callrequest/', json.dumps(item_list),
+                                    content_type='application/json')
+        self.assertTrue('request_uuid' in json.loads(response.content)[0]['errors'])
+
+    def test_api_bulk_subscriber(self):
+        """Test the bulk status changes of subscribers by the REST API"""
+        updated_date = datetime(2015, 1, 1).replace(tzinfo=utc)
+        Subscriber.objects.filter(id=1).update(status=SUBSCRIBER_STATUS.PENDING, updated_date=updated_date)
+        response = self.client.post(
+            '/rest-api/bulk-subscriber/',
+            '{"id": 1, "action": "pause"}\n{"id": 1, "action": "pause"}\n{"id": 999999, "action": "pause"}\n'
+            '{"id": 1, "action": "stop"}\n',
+            content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        result_list = json.loads(response.content)
+        self.assertEqual([result['status'] for result in result_list], ['updated', 'unchanged', 'error', 'error'])
+        self.assertEqual(Subscriber.objects.get(id=1).status, SUBSCRIBER_STATUS.PAUSE)
+        self.assertGreater(Subscriber.objects.get(id=1).updated_date, updated_date)
+
+        response = self.client.post('/rest-api/bulk-subscriber/', json.dumps([{'id': 1, 'action': 'requeue'}]),
+                                    content_type='application/json')
+        self.assertEqual(json.loads(response.content)[0]['status'], 'updated')
+        self.assertEqual(Subscriber.objects.get(id=1).status, SUBSCRIBER_STATUS.PENDING)
@@ -29,6 +29,9 @@ from apirest.view_campaign import CampaignViewSet
 from apirest.view_subscriber import SubscriberViewSet
 from apirest.view_subscriber_list import SubscriberListViewSet
 from apirest.view_bulk_contact import BulkContactViewSet
+from apirest.view_bulk_callrequest import BulkCallrequestViewSet
+from apirest.view_bulk_subscriber import BulkSubscriberViewSet
+from apirest.view_bulk_job import BulkJobView
 from apirest.view_callrequest import CallrequestViewSet
 from apirest.view_survey_template import SurveyTemplateViewSet
 from apirest.view_survey import SurveyViewSet
@@ -104,6 +107,9 @@ urlpatterns = patterns('',
                            SurveyAggregateResultViewSet.as_view(), name="survey_aggregate_result"),
 
                        url(r'^rest-api/bulkcontact/$', BulkContactViewSet.as_view(), name="bulk_contact"),
+                       url(r'^rest-api/bulk-callrequest/$', BulkCallrequestViewSet.as_view(), name="bulk_callrequest"),
+                       url(r'^rest-api/bulk-subscriber/$', BulkSubscriberViewSet.as_view(), name="bulk_subscriber"),
+                       url(r'^rest-api/bulk-job/(?P<job_id>[0-9a-f-]+)/$', BulkJobView.as_view(), name="bulk_job"),
 
                        # subscriber rest api
                        url(r'^rest-api/subscriber/$', SubscriberViewSet.as_view(), name="subscriber_contact"),
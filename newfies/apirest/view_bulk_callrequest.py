@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from apirest.bulk import BulkAPIView
+
+
+class BulkCallrequestViewSet(BulkAPIView):
+
+    """
+    **Create**:
+
+        The fields of a callrequest are those of /rest-api/callrequest/,
+        ``content_type`` is the id of the survey content type
+
+        CURL Usage::
+
+            curl -u username:password --dump-header - -H "Content-Type:application/json" -X POST --data '[{"request_uuid": "2342jtdsf-00123", "call_time": "2011-10-20 12:21:22", "phone_number": "8792749823", "content_type": 49, "object_id": 1, "timeout": "30000", "callerid": "650784355", "aleg_gateway": 1}, {"phone_number": "8792749824", "content_type": 49, "object_id": 1, "aleg_gateway": 1}]' http://localhost:8000/rest-api/bulk-callrequest/
+
+            curl -u username:password --dump-header - -H "Content-Type:application/x-ndjson" -X POST --data-binary @callrequests.ndjson 'http://localhost:8000/rest-api/bulk-callrequest/?async=1'
+
+        Response::
+
+            HTTP/1.0 200 OK
+            Content-Type: application/json; charset=utf-8
+
+            [
+                {"index": 0, "status": "created", "id": 21, "request_uuid": "2342jtdsf-00123"},
+                {"index": 1, "status": "created", "id": 22, "request_uuid": "e8fee8f6-40dd-11e1-964f-000c296bd875"}
+            ]
+
+            HTTP/1.0 202 ACCEPTED
+            Content-Type: application/json; charset=utf-8
+
+            {"job": "d1b3c6a2-40de-11e1-964f-000c296bd875", "url": "/rest-api/bulk-job/d1b3c6a2-40de-11e1-964f-000c296bd875/"}
+    """
+    kind = 'callrequest'
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from apirest.bulk import get_job_key
+
+
+class BulkJobView(APIView):
+
+    """
+    **Read**:
+
+        CURL Usage::
+
+            curl -u username:password -H 'Accept: application/json' http://localhost:8000/rest-api/bulk-job/%job-id%/
+
+        Response::
+
+            {"status": "done", "item_count": 2, "results": [...]}
+    """
+    authentication = (BasicAuthentication, SessionAuthentication)
+
+    def get(self, request, job_id):
+        job = cache.get(get_job_key(job_id))
+        if not job or job['user_id'] != request.user.id:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': job['status'], 'item_count': job['item_count'], 'results': job.get('results')})
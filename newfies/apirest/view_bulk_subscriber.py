@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from apirest.bulk import BulkAPIView
+
+
+class BulkSubscriberViewSet(BulkAPIView):
+
+    """
+    **Update**:
+
+        Change the status of subscribers with the actions pause (PENDING to
+        PAUSE), resume (PAUSE to PENDING), cancel (PENDING or PAUSE to ABORT)
+        & requeue (back to PENDING, attempts reset)
+
+        CURL Usage::
+
+            curl -u username:password --dump-header - -H "Content-Type:application/json" -X POST --data '[{"id": 1, "action": "pause"}, {"id": 2, "action": "cancel"}]' http://localhost:8000/rest-api/bulk-subscriber/
+
+        Response::
+
+            HTTP/1.0 200 OK
+            Content-Type: application/json; charset=utf-8
+
+            [
+                {"index": 0, "status": "updated", "id": 1},
+                {"index": 1, "status": "error", "id": 2, "errors": {"action": ["Cannot cancel a subscriber of status 8"]}}
+            ]
+    """
+    kind = 'subscriber'
@@ -19,9 +19,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from dialer_cdr.models import Callrequest
 from apirest.permissions import CustomObjectPermissions
+from apirest.mixins import IncrementalListMixin
 
 
-class CallrequestViewSet(viewsets.ModelViewSet):
+class CallrequestViewSet(IncrementalListMixin, viewsets.ModelViewSet):
 
     """
     API endpoint that allows campaigns to be viewed or edited.
@@ -17,11 +17,12 @@ from rest_framework import viewsets
 from apirest.campaign_serializers import CampaignSerializer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
-from dialer_campaign.models import Campaign
+from dialer_campaign.models import Campaign, attach_campaign_stats
 from apirest.permissions import CustomObjectPermissions
+from apirest.mixins import IncrementalListMixin
 
 
-class CampaignViewSet(viewsets.ModelViewSet):
+class CampaignViewSet(IncrementalListMixin, viewsets.ModelViewSet):
     model = Campaign
     queryset = Campaign.objects.all()
     serializer_class = CampaignSerializer
@@ -41,3 +42,18 @@ class CampaignViewSet(viewsets.ModelViewSet):
         else:
             queryset = Campaign.objects.filter(user=self.request.user)
         return queryset
+
+    def paginate_queryset(self, queryset, *args, **kwargs):
+        """Fetch the stats of the campaigns of the page at once"""
+        page = super(CampaignViewSet, self).paginate_queryset(queryset, *args, **kwargs)
+        if page is not None:
+            self.prepare_row_list(getattr(page, 'object_list', page))
+        return page
+
+    def prepare_row_list(self, row_list):
+        return attach_campaign_stats(row_list)
+
+    def get_etag(self, row_list, *extra):
+        """The stats change without an update of the campaign"""
+        extra += tuple([sorted(obj.stats.items()) for obj in row_list])
+        return super(CampaignViewSet, self).get_etag(row_list, *extra)
@@ -18,9 +18,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from dialer_contact.models import Contact
 from apirest.permissions import CustomObjectPermissions
+from apirest.mixins import IncrementalListMixin
 
 
-class ContactViewSet(viewsets.ModelViewSet):
+class ContactViewSet(IncrementalListMixin, viewsets.ModelViewSet):
 
     """
     API endpoint that allows contact to be viewed or edited.
@@ -19,9 +19,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from dialer_contact.models import Phonebook
 from apirest.permissions import CustomObjectPermissions
+from apirest.mixins import IncrementalListMixin
 
 
-class PhonebookViewSet(viewsets.ModelViewSet):
+class PhonebookViewSet(IncrementalListMixin, viewsets.ModelViewSet):
 
     """
     API endpoint that allows phonebook to be viewed or edited.
@@ -19,9 +19,10 @@ from rest_framework.authentication import BasicAuthentication, SessionAuthentica
 from apirest.subscriber_list_serializers import SubscriberListSerializer
 from dialer_campaign.models import Subscriber
 from apirest.permissions import CustomObjectPermissions
+from apirest.mixins import IncrementalListMixin
 
 
-class SubscriberListViewSet(viewsets.ReadOnlyModelViewSet):
+class SubscriberListViewSet(IncrementalListMixin, viewsets.ReadOnlyModelViewSet):
 
     """SubscriberListViewSet"""
     queryset = Subscriber.objects.all()
@@ -16,7 +16,8 @@
 from rest_framework.views import APIView
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from rest_framework.response import Response
-from survey.models import Survey, ResultAggregate
+from survey.models import Survey, ResultCube
+from django_lets_go.common_functions import ceil_strdate
 import logging
 logger = logging.getLogger('newfies.filelog')
 
@@ -31,6 +32,10 @@ class SurveyAggregateResultViewSet(APIView):
         CURL Usage::
 
             curl -u username:password -H 'Accept: application/json' http://localhost:8000/rest-api/surveyaggregate/%survey_id%/
+
+        The result can be filtered by date with from_date & to_date (YYYY-MM-DD)::
+
+            curl -u username:password -H 'Accept: application/json' "http://localhost:8000/rest-api/surveyaggregate/%survey_id%/?from_date=2015-06-01&to_date=2015-06-30"
     """
     authentication = (BasicAuthentication, SessionAuthentication)
 
@@ -60,9 +65,17 @@ class SurveyAggregateResultViewSet(APIView):
                 logger.error(error_msg)
                 return Response(error)
 
-        survey_result = ResultAggregate.objects\
-            .filter(**survey_result_kwargs)\
-            .values('section__question', 'response', 'count')\
-            .order_by('section')
+        try:
+            if request.QUERY_PARAMS.get('from_date'):
+                survey_result_kwargs['bucket__gte'] = ceil_strdate(request.QUERY_PARAMS['from_date'], 'start')
+            if request.QUERY_PARAMS.get('to_date'):
+                survey_result_kwargs['bucket__lte'] = ceil_strdate(request.QUERY_PARAMS['to_date'], 'end')
+        except ValueError:
+            error_msg = "Date format must be YYYY-MM-DD"
+            error['error'] = error_msg
+            logger.error(error_msg)
+            return Response(error)
+
+        survey_result = ResultCube.objects.get_survey_result(survey_result_kwargs)
 
         return Response(survey_result)
@@ -44,3 +44,11 @@ if not GET_EVENTS_FUNC:
 
 # URL to redirect to to after an occurrence is canceled
 OCCURRENCE_CANCEL_REDIRECT = getattr(settings, 'OCCURRENCE_CANCEL_REDIRECT', None)
+
+# Number of days ahead the occurrences of the recurring events are materialized
+# in the OccurrenceIndex, the calendar queries beyond it expand the rules
+OCCURRENCE_INDEX_HORIZON = getattr(settings, 'OCCURRENCE_INDEX_HORIZON', 90)
+
+# Number of days back the occurrences of the recurring events are kept in the
+# OccurrenceIndex, the calendar queries before it expand the rules
+OCCURRENCE_INDEX_RETENTION = getattr(settings, 'OCCURRENCE_INDEX_RETENTION', 30)
@@ -0,0 +1,42 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from appointment.models.events import OccurrenceIndex
+
+
+class Command(BaseCommand):
+    args = 'chunk_size'
+    help = "Index the occurrences of all the existing events, to run once on deploy\n" \
+           "-----------------------------------------------------------------------\n" \
+           "python manage.py backfill_occurrence_index --chunk_size=1000"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk_size', default=None, dest='chunk_size', help=help),
+    )
+
+    def handle(self, *args, **options):
+        """
+        We will parse and set default values to parameters
+        """
+        chunk_size = 1000  # default
+        if options.get('chunk_size'):
+            try:
+                chunk_size = int(options.get('chunk_size'))
+            except ValueError:
+                chunk_size = 1000
+
+        count = OccurrenceIndex.objects.backfill(chunk_size)
+        print("Occurrences indexed for %d events" % count)
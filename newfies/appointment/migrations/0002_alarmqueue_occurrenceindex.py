@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlarmQueue',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('due_at', models.DateTimeField(verbose_name='due at', db_index=True)),
+                ('alarm', models.OneToOneField(related_name='alarm_queue', verbose_name='alarm', to='appointment.Alarm')),
+            ],
+            options={
+                'verbose_name': 'alarm queue',
+                'verbose_name_plural': 'alarm queue',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='OccurrenceIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField(verbose_name='start', db_index=True)),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('event', models.ForeignKey(related_name='occurrence_index', verbose_name='event', to='appointment.Event')),
+            ],
+            options={
+                'verbose_name': 'occurrence index',
+                'verbose_name_plural': 'occurrence index',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='occurrenceindex',
+            index_together=set([('event', 'start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='alarm',
+            index_together=set([('status', 'date_start_notice')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='alarmrequest',
+            index_together=set([('status', 'date')]),
+        ),
+    ]
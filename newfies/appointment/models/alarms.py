@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
 from appointment.constants import ALARM_METHOD, ALARM_STATUS, ALARM_RESULT, \
@@ -73,6 +73,7 @@ class Alarm(models.Model):
         verbose_name = _('alarm')
         verbose_name_plural = _('alarms')
         app_label = "appointment"
+        index_together = [['status', 'date_start_notice']]
 
     def __unicode__(self):
         if self.method:
@@ -87,14 +88,14 @@ class Alarm(models.Model):
             timediff = self.date_start_notice - tday
             return timediff.total_seconds()
 
-    def copy_alarm(self, new_event, next_occurrence):
+    def get_copy_alarm(self, new_event_id, next_occurrence):
         """
-        Create a copy of the Alarm
+        Return a new unsaved copy of the Alarm
         """
-        new_alarm = Alarm.objects.create(
+        return Alarm(
             alarm_phonenumber=self.alarm_phonenumber,
             alarm_email=self.alarm_email,
-            event=new_event,
+            event_id=new_event_id,
             daily_start=self.daily_start,
             daily_stop=self.daily_stop,
             advance_notice=self.advance_notice,
@@ -102,9 +103,9 @@ class Alarm(models.Model):
             retry_delay=self.retry_delay,
             num_attempt=self.num_attempt,
             method=self.method,
-            survey=self.survey,
-            mail_template=self.mail_template,
-            sms_template=self.sms_template,
+            survey_id=self.survey_id,
+            mail_template_id=self.mail_template_id,
+            sms_template_id=self.sms_template_id,
             date_start_notice=next_occurrence,
             # result=self.result,
             url_cancel=self.url_cancel,
@@ -112,6 +113,13 @@ class Alarm(models.Model):
             url_confirm=self.url_confirm,
             phonenumber_transfer=self.phonenumber_transfer,
         )
+
+    def copy_alarm(self, new_event, next_occurrence):
+        """
+        Create a copy of the Alarm
+        """
+        new_alarm = self.get_copy_alarm(new_event.id, next_occurrence)
+        new_alarm.save()
         return new_alarm
 
     def retry_alarm(self):
@@ -129,11 +137,59 @@ class Alarm(models.Model):
         second_towait = self.retry_delay
         # If second_towait negative then set to 0 to be run directly
         if second_towait <= 0:
-            perform_alarm.delay(self.event, self)
+            perform_alarm.delay(self.id)
         else:
             # Call the Alarm in the future
             perform_alarm.apply_async(
-                args=[self.event, self], countdown=second_towait)
+                args=[self.id], countdown=second_towait)
+
+
+class AlarmQueueManager(models.Manager):
+
+    """AlarmQueue Manager"""
+
+    def enqueue(self, alarm):
+        """Add the Alarm to the queue or move it to its new due time"""
+        self.update_or_create(alarm_id=alarm.id, defaults={'due_at': alarm.date_start_notice})
+
+    def enqueue_bulk(self, alarm_list):
+        """Add a list of freshly created Alarms to the queue in one query"""
+        self.bulk_create([AlarmQueue(alarm_id=obj_alarm.id, due_at=obj_alarm.date_start_notice)
+                          for obj_alarm in alarm_list])
+
+    @transaction.atomic
+    def pop_due(self, until, limit):
+        """Remove from the queue and return the ids of the Alarms due before ``until``"""
+        alarm_id_list = list(self.select_for_update()
+                             .filter(due_at__lte=until)
+                             .order_by('due_at')
+                             .values_list('alarm_id', flat=True)[:limit])
+        if alarm_id_list:
+            self.filter(alarm_id__in=alarm_id_list).delete()
+        return alarm_id_list
+
+
+class AlarmQueue(models.Model):
+
+    """
+    Due-time queue of the pending Alarms.
+
+    An entry is added when an Alarm is created or copied and removed by the
+    alarm_dispatcher once the Alarm is due, so the dispatcher never has to
+    rescan the Alarm table.
+    """
+    alarm = models.OneToOneField(Alarm, verbose_name=_("alarm"), related_name="alarm_queue")
+    due_at = models.DateTimeField(verbose_name=_('due at'), db_index=True)
+
+    objects = AlarmQueueManager()
+
+    class Meta:
+        verbose_name = _('alarm queue')
+        verbose_name_plural = _('alarm queue')
+        app_label = "appointment"
+
+    def __unicode__(self):
+        return u"%s - %s" % (self.alarm_id, self.due_at)
 
 
 class AlarmRequest(models.Model):
@@ -160,6 +216,7 @@ class AlarmRequest(models.Model):
         verbose_name = _('alarm request')
         verbose_name_plural = _('alarm requests')
         app_label = "appointment"
+        index_together = [['status', 'date']]
 
     def update_status(self, status):
         self.status = status
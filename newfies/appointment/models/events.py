@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+from django.db import models, transaction
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import date
 from django.utils.translation import ugettext, ugettext_lazy as _
@@ -10,14 +10,96 @@ from appointment.models.calendars import Calendar
 from user_profile.models import CalendarUser
 from appointment.utils import OccurrenceReplacer
 from appointment.constants import EVENT_STATUS
+from appointment.conf.settings import OCCURRENCE_INDEX_HORIZON, OCCURRENCE_INDEX_RETENTION
 from dateutil import rrule
 from dateutil.relativedelta import relativedelta
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import utc
 import jsonfield
 import pytz
 
 
+# Max number of rrule objects kept by get_cached_rrule
+RRULE_CACHE_SIZE = 2000
+_rrule_cache = {}
+
+
+# Frequency of a Rule => relativedelta argument of its period
+RRULE_PERIOD = {
+    'YEARLY': 'years',
+    'MONTHLY': 'months',
+    'WEEKLY': 'weeks',
+    'DAILY': 'days',
+    'HOURLY': 'hours',
+    'MINUTELY': 'minutes',
+    'SECONDLY': 'seconds',
+}
+
+
+def get_cached_rrule(rule, dtstart):
+    """
+    Return the rrule object of the Rule starting at dtstart, the objects are
+    cached by frequency, params and dtstart so the events sharing a rule and
+    a start don't parse the params and build the rrule again. The rrule
+    doesn't cache its occurrences, each lookup iterates them from dtstart.
+    """
+    key = (rule.frequency, rule.params, dtstart)
+    rrule_obj = _rrule_cache.get(key)
+    if rrule_obj is None:
+        if len(_rrule_cache) >= RRULE_CACHE_SIZE:
+            _rrule_cache.clear()
+        rrule_obj = rrule.rrule(getattr(rrule, rule.frequency), dtstart=dtstart, **rule.get_params())
+        _rrule_cache[key] = rrule_obj
+    return rrule_obj
+
+
+def count_periods(frequency, start, end):
+    """Return the number of whole periods of the frequency from start to end"""
+    if frequency in ('YEARLY', 'MONTHLY'):
+        delta = relativedelta(end, start)
+        if frequency == 'YEARLY':
+            return delta.years
+        return delta.years * 12 + delta.months
+    seconds = int((end - start).total_seconds())
+    return seconds // {'WEEKLY': 604800, 'DAILY': 86400, 'HOURLY': 3600, 'MINUTELY': 60, 'SECONDLY': 1}[frequency]
+
+
+def get_rrule_after(rule, dtstart, after):
+    """
+    Return the first occurrence of the Rule starting at dtstart after the
+    date ``after``.
+
+    An rrule iterates its occurrences from its dtstart, so the rrule is built
+    from dtstart moved forward by whole intervals to just before ``after``,
+    with the by* params the rrule would default from the original dtstart.
+    A rule with a count is iterated from dtstart.
+
+    >>> rule = Rule(frequency="MONTHLY", name="Monthly")
+    >>> dtstart = datetime(2008, 1, 31, 8, 0, tzinfo=utc)
+    >>> get_rrule_after(rule, dtstart, datetime(2015, 2, 1, tzinfo=utc))
+    datetime.datetime(2015, 3, 31, 8, 0, tzinfo=<UTC>)
+    """
+    params = rule.get_params()
+    frequency = getattr(rrule, rule.frequency)
+    if 'count' in params or after <= dtstart:
+        return rrule.rrule(frequency, dtstart=dtstart, **params).after(after)
+
+    if not any(params.get(name) for name in ('byweekno', 'byyearday', 'bymonthday', 'byweekday', 'byeaster')):
+        if rule.frequency == 'YEARLY':
+            params['bymonth'] = params.get('bymonth') or dtstart.month
+            params['bymonthday'] = dtstart.day
+        elif rule.frequency == 'MONTHLY':
+            params['bymonthday'] = dtstart.day
+        elif rule.frequency == 'WEEKLY':
+            params['byweekday'] = dtstart.weekday()
+    interval = params.get('interval') or 1
+    # start one interval earlier, a month shorter than the day of dtstart
+    # moves the new dtstart to the end of the month
+    shift = max(count_periods(rule.frequency, dtstart, after) // interval - 1, 0) * interval
+    start = dtstart + relativedelta(**{RRULE_PERIOD[rule.frequency]: shift})
+    return rrule.rrule(frequency, dtstart=start, **params).after(after)
+
+
 def set_end_recurring_period():
     return datetime.utcnow().replace(tzinfo=utc) + relativedelta(months=+1)
 
@@ -115,7 +197,8 @@ class Event(models.Model):
 
     def get_next_occurrence(self):
         """
-        TODO: implement this
+        Return the first occurrence of the Event after now, the rule is
+        expanded from the last interval before now
 
         >>> rule = Rule(frequency="MONTHLY", name="Monthly")
         >>> rule.save()
@@ -125,39 +208,38 @@ class Event(models.Model):
         >>> event.get_next_occurrence()
         2008-02-02 00:00:00+00:00
         """
-        start = datetime.utcnow().replace(tzinfo=utc)
-        for occ in self.get_rrule_object():
-            # if occ.replace(tzinfo=None) > start:
-            if occ > start:
-                return occ  # return the next occurent
-
-    def copy_event(self, next_occurrence):
-        """create new event with next occurrence"""
+        if self.rule is None:
+            return None
+        return get_rrule_after(self.rule, self.start, datetime.utcnow().replace(tzinfo=utc))
 
-        if self.parent_event:
-            parent_event = self.parent_event
-        else:
-            parent_event = self
+    def get_copy_event(self, next_occurrence):
+        """return a new unsaved event with next occurrence"""
+        # keep a trace of the original event
+        parent_event_id = self.parent_event_id or self.id
 
         # find the new event end
         event_end = next_occurrence + (self.end - self.start)
 
-        new_event = Event.objects.create(
+        return Event(
             start=next_occurrence,
             end=event_end,
             title=self.title,
             description=self.description,
-            creator=self.creator,
-            rule=self.rule,
+            creator_id=self.creator_id,
+            rule_id=self.rule_id,
             end_recurring_period=self.end_recurring_period,
-            calendar=self.calendar,
+            calendar_id=self.calendar_id,
             notify_count=self.notify_count,
             data=self.data,
             # implemented parent_event & occ_count
-            parent_event=parent_event,
+            parent_event_id=parent_event_id,
             occ_count=self.occ_count + 1,
         )
 
+    def copy_event(self, next_occurrence):
+        """create new event with next occurrence"""
+        new_event = self.get_copy_event(next_occurrence)
+        new_event.save()
         return new_event
 
     def update_last_child_status(self, status):
@@ -185,12 +267,39 @@ class Event(models.Model):
 
     def get_rrule_object(self):
         if self.rule is not None:
-            params = self.rule.get_params()
-            frequency = 'rrule.%s' % self.rule.frequency
-            return rrule.rrule(eval(frequency), dtstart=self.start, **params)
+            return get_cached_rrule(self.rule, self.start)
         else:
             return []
 
+    def is_recurring(self):
+        """
+        Check if the occurrences of the Event follow its rule, the child events
+        created by the event_dispatcher are one occurrence of the recurrence of
+        their parent, so they occur once.
+        """
+        return self.rule is not None and not self.parent_event_id
+
+    def _get_recurrence_list(self, start, end):
+        """
+        Return the (start, end) of the occurrences of the rule ending between
+        start and end
+        """
+        if self.end_recurring_period and self.end_recurring_period < end:
+            end = self.end_recurring_period
+        difference = self.end - self.start
+        return [(o_start, o_start + difference)
+                for o_start in self.get_rrule_object().between(start - difference, end - difference, inc=True)]
+
+    def get_index_occurrences(self, start, end):
+        """
+        Return the (start, end) of the occurrences to store in the OccurrenceIndex,
+        the rule is expanded between start and end only. An event occurring
+        once is stored whatever its date.
+        """
+        if not self.is_recurring():
+            return [(self.start, self.end)]
+        return self._get_recurrence_list(start, end)
+
     def _create_occurrence(self, start, end=None):
         if end is None:
             end = start + (self.end - self.start)
@@ -225,17 +334,9 @@ class Event(models.Model):
         """
         returns a list of occurrences for this event from start to end.
         """
-        difference = (self.end - self.start)
-        if self.rule is not None:
-            occurrences = []
-            if self.end_recurring_period and self.end_recurring_period < end:
-                end = self.end_recurring_period
-            rule = self.get_rrule_object()
-            o_starts = rule.between(start - difference, end - difference, inc=True)
-            for o_start in o_starts:
-                o_end = o_start + difference
-                occurrences.append(self._create_occurrence(o_start, o_end))
-            return occurrences
+        if self.is_recurring():
+            return [self._create_occurrence(o_start, o_end)
+                    for (o_start, o_end) in self._get_recurrence_list(start, end)]
         else:
             # check if event is in the period
             if self.start < end and self.end > start:
@@ -368,3 +469,110 @@ class Occurrence(models.Model):
 
     def __eq__(self, other):
         return self.original_start == other.original_start and self.original_end == other.original_end
+
+
+class OccurrenceIndexManager(models.Manager):
+
+    """OccurrenceIndex Manager"""
+
+    def get_window(self):
+        """Return the (start, end) dates between which the occurrences of the
+        recurring events are stored"""
+        current_time = timezone.now()
+        return (current_time - timedelta(days=OCCURRENCE_INDEX_RETENTION),
+                current_time + timedelta(days=OCCURRENCE_INDEX_HORIZON))
+
+    def covers(self, start, end):
+        """Check if the index holds the occurrences from start until end, the
+        index is refreshed daily so the last day of the horizon is not trusted"""
+        current_time = timezone.now()
+        return start >= current_time - timedelta(days=OCCURRENCE_INDEX_RETENTION) and \
+            end <= current_time + timedelta(days=OCCURRENCE_INDEX_HORIZON - 1)
+
+    @transaction.atomic
+    def refresh_events(self, event_list):
+        """Rebuild the stored occurrences of the events"""
+        (window_start, window_end) = self.get_window()
+        self.filter(event__in=[obj_event.id for obj_event in event_list]).delete()
+        self.bulk_create([OccurrenceIndex(event_id=obj_event.id, start=o_start, end=o_end)
+                          for obj_event in event_list
+                          for (o_start, o_end) in obj_event.get_index_occurrences(window_start, window_end)])
+
+    def backfill(self, chunk_size=1000):
+        """
+        Rebuild the stored occurrences of all the events per chunk of events,
+        return the number of events indexed
+        """
+        event_list = Event.objects.select_related('rule')
+        event_id_list = list(event_list.order_by('id').values_list('id', flat=True))
+        for i in range(0, len(event_id_list), chunk_size):
+            self.refresh_events(event_list.filter(id__in=event_id_list[i:i + chunk_size]))
+        return len(event_id_list)
+
+    def get_occurrences(self, events, start, end):
+        """
+        Return the occurrences of the events between start and end, replaced
+        by their persisted Occurrence when they have been moved or cancelled
+
+        The events without any index row, saved before the index existed or
+        not yet backfilled, are expanded from their rule.
+        """
+        events = list(events)
+        if self.covers(start, end):
+            indexed_id_list = set(self.filter(event__in=[obj_event.id for obj_event in events])
+                                  .values_list('event_id', flat=True).distinct())
+        else:
+            indexed_id_list = set()
+        occurrences = []
+        for obj_event in events:
+            if obj_event.id not in indexed_id_list:
+                occurrences += obj_event.get_occurrences(start, end)
+        if not indexed_id_list:
+            return occurrences
+
+        event_dict = dict((obj_event.id, obj_event) for obj_event in events if obj_event.id in indexed_id_list)
+        occ_replacer = OccurrenceReplacer(Occurrence.objects.filter(event__in=event_dict.keys()))
+        occ_index_list = self.filter(event__in=event_dict.keys(), start__lt=end, end__gte=start)\
+            .values_list('event_id', 'start', 'end')
+        for (event_id, o_start, o_end) in occ_index_list:
+            occ = event_dict[event_id]._create_occurrence(o_start, o_end)
+            # replace occurrences with their persisted counterparts
+            if occ_replacer.has_occurrence(occ):
+                p_occ = occ_replacer.get_occurrence(occ)
+                # ...but only if they are within this period
+                if p_occ.start < end and p_occ.end >= start:
+                    occurrences.append(p_occ)
+            else:
+                occurrences.append(occ)
+        # then add persisted occurrences which originated outside of this period but now
+        # fall within it
+        occurrences += occ_replacer.get_additional_occurrences(start, end)
+        return occurrences
+
+
+class OccurrenceIndex(models.Model):
+
+    """
+    Materialized occurrences of the events from OCCURRENCE_INDEX_RETENTION days
+    ago until the OCCURRENCE_INDEX_HORIZON,
+    this allows the calendar queries to find the occurrences of a period with
+    an indexed lookup instead of expanding the rule of each event.
+
+    The index is rebuilt when an Event or a Rule is saved and extended every
+    day by the occurrence_index_refresh task, the events saved before are
+    indexed by the backfill_occurrence_index command.
+    """
+    event = models.ForeignKey(Event, verbose_name=_("event"), related_name="occurrence_index")
+    start = models.DateTimeField(_("start"), db_index=True)
+    end = models.DateTimeField(_("end"))
+
+    objects = OccurrenceIndexManager()
+
+    class Meta:
+        verbose_name = _("occurrence index")
+        verbose_name_plural = _("occurrence index")
+        app_label = "appointment"
+        index_together = [['event', 'start']]
+
+    def __unicode__(self):
+        return u"%s - %s to %s" % (self.event_id, self.start, self.end)
@@ -2,9 +2,9 @@ import pytz
 import datetime
 from django.template.defaultfilters import date
 from django.utils.dates import WEEKDAYS, WEEKDAYS_ABBR
-from schedule.conf.settings import FIRST_DAY_OF_WEEK, SHOW_CANCELLED_OCCURRENCES
+from appointment.conf.settings import FIRST_DAY_OF_WEEK, SHOW_CANCELLED_OCCURRENCES
 from django.utils.translation import ugettext_lazy as _
-from schedule.models import Occurrence
+from appointment.models.events import Occurrence, OccurrenceIndex
 from django.utils import timezone
 
 
@@ -54,9 +54,7 @@ class Period(object):
                 if occurrence.start <= self.end and occurrence.end >= self.start:
                     occurrences.append(occurrence)
             return occurrences
-        for event in self.events:
-            event_occurrences = event.get_occurrences(self.start, self.end)
-            occurrences += event_occurrences
+        occurrences = OccurrenceIndex.objects.get_occurrences(self.events, self.start, self.end)
         return sorted(occurrences)
 
     def cached_get_sorted_occurrences(self):
@@ -1,5 +1,6 @@
-from django.db.models.signals import pre_save
-from appointment.models import Event, Calendar
+from django.db.models.signals import pre_save, post_save
+from appointment.models import Event, Calendar, Alarm, AlarmQueue, Rule, OccurrenceIndex
+from appointment.constants import ALARM_STATUS
 
 
 def default_calendar(sender, **kwargs):
@@ -17,3 +18,30 @@ def default_calendar(sender, **kwargs):
     return True
 
 pre_save.connect(default_calendar)
+
+
+def alarm_queue_update(sender, **kwargs):
+    """Keep the AlarmQueue in sync with the status and date of the Alarm"""
+    obj_alarm = kwargs['instance']
+    if obj_alarm.status == ALARM_STATUS.PENDING:
+        AlarmQueue.objects.enqueue(obj_alarm)
+    elif not kwargs['created']:
+        AlarmQueue.objects.filter(alarm_id=obj_alarm.id).delete()
+
+post_save.connect(alarm_queue_update, sender=Alarm)
+
+
+def occurrence_index_event_update(sender, **kwargs):
+    """Rebuild the OccurrenceIndex of the Event"""
+    OccurrenceIndex.objects.refresh_events([kwargs['instance']])
+
+post_save.connect(occurrence_index_event_update, sender=Event)
+
+
+def occurrence_index_rule_update(sender, **kwargs):
+    """Rebuild the OccurrenceIndex of the recurring Events using the Rule"""
+    if not kwargs['created']:
+        OccurrenceIndex.objects.refresh_events(
+            Event.objects.select_related('rule').filter(rule=kwargs['instance'], parent_event__isnull=True))
+
+post_save.connect(occurrence_index_rule_update, sender=Rule)
@@ -13,12 +13,14 @@
 #
 
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, connection
+from django.db.models import Q, F
 from celery.task import PeriodicTask
 from celery.decorators import task
 from celery.utils.log import get_task_logger
-from django_lets_go.only_one_task import only_one
-from appointment.models.alarms import Alarm, AlarmRequest
-from appointment.models.events import Event
+from mod_utils.lease_lock import lease_lock, lease_is_current
+from appointment.models.alarms import Alarm, AlarmRequest, AlarmQueue
+from appointment.models.events import Event, OccurrenceIndex
 from user_profile.models import CalendarUserProfile
 from appointment.constants import EVENT_STATUS, ALARM_STATUS, \
     ALARM_METHOD, ALARMREQUEST_STATUS
@@ -26,16 +28,24 @@ from mod_mailer.models import MailSpooler
 from dialer_cdr.models import Callrequest
 from dialer_cdr.tasks import init_callrequest
 from dialer_cdr.constants import CALLREQUEST_STATUS, CALLREQUEST_TYPE
+from survey.models import Survey
 from sms.tasks import SendMessage
 from mod_sms.models import SMSMessage
 from math import floor
+from collections import defaultdict
+from uuid import uuid1
 from datetime import datetime, timedelta
 from django.utils.timezone import utc
 from dateutil.relativedelta import relativedelta
 
 
-LOCK_EXPIRE = 60 * 10 * 1  # Lock expires in 10 minutes
 FREQ_DISPATCHER = 6
+# Max number of Alarms popped from the AlarmQueue per run
+ALARM_QUEUE_LIMIT = 1000
+# Number of Events copied per transaction by the event_dispatcher
+EVENT_CHUNK_SIZE = 1000
+# TODO: build settings for this
+ALARM_CALLMAXDURATION = 60 * 60
 
 logger = get_task_logger(__name__)
 
@@ -58,30 +68,103 @@ class event_dispatcher(PeriodicTask):
     """
     run_every = timedelta(seconds=60)
 
-    @only_one(ikey="event_dispatcher", timeout=LOCK_EXPIRE)
+    @lease_lock("event_dispatcher")
     def run(self, **kwargs):
         # List all the events where event.start > NOW() - 12 hours and status = EVENT_STATUS.PENDING
         start_from = datetime.utcnow().replace(tzinfo=utc) - timedelta(hours=12)
         start_to = datetime.utcnow().replace(tzinfo=utc)
-        event_list = Event.objects.filter(start__gte=start_from, start__lte=start_to, status=EVENT_STATUS.PENDING)
+        event_list = list(Event.objects.select_related('rule')
+                          .filter(start__gte=start_from, start__lte=start_to, status=EVENT_STATUS.PENDING))
 
         logger.info("TASK :: event_dispatcher - #events:%d" % len(event_list))
-        for obj_event in event_list:
-            # Check if need to create a sub event in the future
-            next_occurrence = obj_event.get_next_occurrence()
+        for i in range(0, len(event_list), EVENT_CHUNK_SIZE):
+            copy_next_occurrence(event_list[i:i + EVENT_CHUNK_SIZE])
 
-            if next_occurrence:
-                # The result of get_next_occurrences help to create the next event
-                new_event = obj_event.copy_event(next_occurrence)
 
-                # Copy the alarm link to the event
-                alarm_list = Alarm.objects.filter(event=obj_event)
-                for obj_alarm in alarm_list:
-                    obj_alarm.copy_alarm(new_event, next_occurrence)
+@transaction.atomic
+def copy_next_occurrence(event_list):
+    """
+    Create in bulk the next occurrence of the Events with a copy of their
+    Alarms, then mark the Events as completed
+    """
+    created_on = datetime.utcnow().replace(tzinfo=utc)
+    copied_event = {}
+    new_event_list = []
+    for obj_event in event_list:
+        # Check if need to create a sub event in the future
+        next_occurrence = obj_event.get_next_occurrence()
+        if not next_occurrence:
+            continue
+        # The result of get_next_occurrences help to create the next event
+        new_event = obj_event.get_copy_event(next_occurrence)
+        new_event.created_on = created_on
+        key = (new_event.parent_event_id, new_event.start)
+        if key in copied_event:
+            # This occurrence has already been created from a sibling Event
+            continue
+        copied_event[key] = obj_event
+        new_event_list.append(new_event)
+
+    if new_event_list:
+        Event.objects.bulk_create(new_event_list)
+
+        # Retrieve the events we just created to copy the alarm link
+        alarm_list = defaultdict(list)
+        for obj_alarm in Alarm.objects.filter(event__in=[obj_event.id for obj_event in copied_event.values()]):
+            alarm_list[obj_alarm.event_id].append(obj_alarm)
+
+        new_event_id_list = []
+        new_alarm_list = []
+        new_occ_index_list = []
+        for (new_event_id, parent_event_id, start, end) in Event.objects\
+                .filter(created_on=created_on, parent_event__in=set(key[0] for key in copied_event))\
+                .values_list('id', 'parent_event_id', 'start', 'end'):
+            obj_event = copied_event.get((parent_event_id, start))
+            if obj_event is None:
+                continue
+            new_event_id_list.append(new_event_id)
+            new_occ_index_list.append(OccurrenceIndex(event_id=new_event_id, start=start, end=end))
+            for obj_alarm in alarm_list[obj_event.id]:
+                new_alarm_list.append(obj_alarm.get_copy_alarm(new_event_id, start))
+
+        # bulk_create doesn't send post_save, index the new events
+        OccurrenceIndex.objects.bulk_create(new_occ_index_list)
+
+        if new_alarm_list:
+            Alarm.objects.bulk_create(new_alarm_list)
+            # bulk_create doesn't send post_save, add the new alarms to the queue
+            AlarmQueue.objects.enqueue_bulk(
+                Alarm.objects.only('id', 'date_start_notice').filter(event__in=new_event_id_list))
+
+    # Mark the events as COMPLETED
+    Event.objects.filter(id__in=[obj_event.id for obj_event in event_list])\
+        .update(status=EVENT_STATUS.COMPLETED)
+
+
+class occurrence_index_refresh(PeriodicTask):
+
+    """A periodic task that extends the OccurrenceIndex of the recurring Events
+    to the new horizon
 
-            # Mark the event as COMPLETED
-            obj_event.status = EVENT_STATUS.COMPLETED
-            obj_event.save()
+    **Usage**:
+
+        occurrence_index_refresh.delay()
+    """
+    run_every = timedelta(days=1)
+
+    @lease_lock("occurrence_index_refresh")
+    def run(self, **kwargs):
+        event_list = Event.objects.select_related('rule')\
+            .filter(rule__isnull=False, parent_event__isnull=True)\
+            .filter(Q(end_recurring_period__isnull=True) |
+                    Q(end_recurring_period__gte=datetime.utcnow().replace(tzinfo=utc)))
+        event_id_list = list(event_list.values_list('id', flat=True))
+
+        logger.info("TASK :: occurrence_index_refresh - #events:%d" % len(event_id_list))
+        for i in range(0, len(event_id_list), EVENT_CHUNK_SIZE):
+            OccurrenceIndex.objects.refresh_events(
+                event_list.filter(id__in=event_id_list[i:i + EVENT_CHUNK_SIZE]))
+        return True
 
 
 class alarm_dispatcher(PeriodicTask):
@@ -89,6 +172,9 @@ class alarm_dispatcher(PeriodicTask):
     """A periodic task that checks for scheduled Alarm and trigger the Alarm according
     to the alarm type, such as phone Call, SMS or Email.
 
+    The Alarms to perform are popped from the AlarmQueue, which is ordered by
+    due time, so only the Alarms due within the next 5 minutes are read.
+
     For each Alarm found, the PeriodicTask alarm_dispatcher will ::
 
         - found when the next alarm should be performed. We should notice that alarm
@@ -103,43 +189,101 @@ class alarm_dispatcher(PeriodicTask):
     """
     run_every = timedelta(seconds=FREQ_DISPATCHER)
 
-    @only_one(ikey="alarm_dispatcher", timeout=LOCK_EXPIRE)
+    @lease_lock("alarm_dispatcher")
     def run(self, **kwargs):
-        # Select Alarm where date_start_notice >= now() - 60 minutes and <= now() + 5 minutes
+        # Pop Alarm where date_start_notice <= now() + 5 minutes
         start_time = datetime.utcnow().replace(tzinfo=utc) + relativedelta(minutes=-60)
         end_time = datetime.utcnow().replace(tzinfo=utc) + relativedelta(minutes=+5)
-        alarm_list = Alarm.objects.filter(date_start_notice__range=(start_time, end_time),
-                                          status=ALARM_STATUS.PENDING).order_by('date_start_notice')
+        alarm_id_list = AlarmQueue.objects.pop_due(end_time, ALARM_QUEUE_LIMIT)
+        if not alarm_id_list:
+            return False
+
+        alarm_list = Alarm.objects.only('id', 'event', 'date_start_notice')\
+            .filter(id__in=alarm_id_list, status=ALARM_STATUS.PENDING).order_by('date_start_notice')
 
         logger.info("TASK :: alarm_dispatcher - #alarms:%d" % len(alarm_list))
+        dispatch_list = []
+        failure_id_list = []
         # Browse all the Alarm found
         for obj_alarm in alarm_list:
+            if obj_alarm.date_start_notice < start_time:
+                # Alarm missed for more than 60 minutes, too late to notify,
+                # it is out of the queue & of the reconcile window
+                logger.warning("Alarm out of date, set as failure: %d" % obj_alarm.id)
+                failure_id_list.append(obj_alarm.id)
+                continue
             # Check if there is an existing Event
-            if obj_alarm.event:
-                obj_alarm.status = ALARM_STATUS.IN_PROCESS
-                obj_alarm.save()
-
-                second_towait = obj_alarm.get_time_diff()
-                # If second_towait negative then set to 0 to be run directly
-                if second_towait <= 0:
-                    perform_alarm.delay(obj_alarm.event, obj_alarm)
-                else:
-                    # Call the Alarm in the future
-                    perform_alarm.apply_async(
-                        args=[obj_alarm.event, obj_alarm], countdown=second_towait)
+            if obj_alarm.event_id:
+                dispatch_list.append(obj_alarm)
             else:
                 logger.error("There is no Event attached to this Alarm: %d" % obj_alarm.id)
-                # Mark the Alarm as ERROR
-                obj_alarm.status = ALARM_STATUS.FAILURE
-                obj_alarm.save()
+                failure_id_list.append(obj_alarm.id)
+
+        if failure_id_list:
+            # Mark the Alarm as ERROR, every popped Alarm ends in a final state
+            Alarm.objects.filter(id__in=failure_id_list, status=ALARM_STATUS.PENDING)\
+                .update(status=ALARM_STATUS.FAILURE)
+
+        # A newer holder of the lease dispatches them, the reconcile sweep
+        # puts back in the queue the alarms popped here
+        if not lease_is_current():
+            return False
+
+        # Update in bulk before dispatching, so the reconcile sweep ignores them
+        if dispatch_list:
+            Alarm.objects.filter(id__in=[obj_alarm.id for obj_alarm in dispatch_list])\
+                .update(status=ALARM_STATUS.IN_PROCESS)
+
+        for obj_alarm in dispatch_list:
+            second_towait = obj_alarm.get_time_diff()
+            # If second_towait negative then set to 0 to be run directly
+            if second_towait <= 0:
+                perform_alarm.delay(obj_alarm.id)
+            else:
+                # Call the Alarm in the future
+                perform_alarm.apply_async(
+                    args=[obj_alarm.id], countdown=second_towait)
+        return True
+
+
+class alarm_queue_reconcile(PeriodicTask):
+
+    """A periodic task that adds to the AlarmQueue the pending Alarms which are
+    missing from it, for instance Alarms created with a bulk insert or before
+    the queue existed.
+
+    **Usage**:
+
+        alarm_queue_reconcile.delay()
+    """
+    run_every = timedelta(seconds=300)
+
+    @lease_lock("alarm_queue_reconcile")
+    def run(self, **kwargs):
+        # Select Alarm where date_start_notice >= now() - 60 minutes and <= now() + 1 hour
+        start_time = datetime.utcnow().replace(tzinfo=utc) + relativedelta(minutes=-60)
+        end_time = datetime.utcnow().replace(tzinfo=utc) + relativedelta(hours=+1)
+        alarm_list = Alarm.objects.only('id', 'date_start_notice')\
+            .filter(date_start_notice__range=(start_time, end_time),
+                    status=ALARM_STATUS.PENDING, alarm_queue__isnull=True)
+
+        logger.info("TASK :: alarm_queue_reconcile - #alarms:%d" % len(alarm_list))
+        if alarm_list:
+            AlarmQueue.objects.enqueue_bulk(alarm_list)
+        return True
 
 
 @task()
-def perform_alarm(obj_event, obj_alarm):
+def perform_alarm(alarm_id):
     """
     Task to perform the alarm, this will send the alarms via several mean such
     as Call, SMS and Email
     """
+    try:
+        obj_alarm = Alarm.objects.select_related('event', 'sms_template', 'mail_template').get(id=alarm_id)
+    except Alarm.DoesNotExist:
+        logger.error("Error retrieving Alarm: %d" % alarm_id)
+        return False
     logger.info("TASK :: perform_alarm -> %d-%s" % (obj_alarm.id, obj_alarm.method))
 
     if obj_alarm.method == ALARM_METHOD.CALL:
@@ -207,84 +351,120 @@ class alarmrequest_dispatcher(PeriodicTask):
     """
     run_every = timedelta(seconds=FREQ_DISPATCHER)
 
-    @only_one(ikey="alarmrequest_dispatcher", timeout=LOCK_EXPIRE)
+    @lease_lock("alarmrequest_dispatcher")
     def run(self, **kwargs):
         logger.info("TASK :: alarmrequest_dispatcher")
 
         # Select AlarmRequest where date >= now() - 60 minutes
         start_time = datetime.utcnow().replace(tzinfo=utc) + relativedelta(minutes=-60)
-        alarmreq_list = AlarmRequest.objects.filter(date__gte=start_time, status=ALARMREQUEST_STATUS.PENDING)
-        no_alarmreq = alarmreq_list.count()
+        alarmreq_list = list(AlarmRequest.objects.select_related('alarm', 'alarm__event')
+                             .filter(date__gte=start_time, status=ALARMREQUEST_STATUS.PENDING))
+        no_alarmreq = len(alarmreq_list)
         if no_alarmreq == 0:
             logger.warning("alarmrequest_dispatcher - no alarmreq found!")
             return False
 
+        callrequest_list = create_alarm_callrequest(alarmreq_list)
+
         # Set time to wait for balanced dispatching of calls
         # time_to_wait = int(60 / DIV_MIN) / no_subscriber
         time_to_wait = 6.0 / no_alarmreq
         count = 0
 
-        # Browse all the AlarmRequest found
-        for obj_alarmreq in alarmreq_list:
-            # Loop on AlarmRequest and start to the initcall's task
+        # Browse all the Callrequest created
+        for (callrequest_id, alarm_request_id) in callrequest_list:
+            # Loop on Callrequest and start to the initcall's task
             count = count + 1
             second_towait = floor(count * time_to_wait)
             ms_addtowait = (count * time_to_wait) - second_towait
             logger.info("Init CallRequest for AlarmRequest in %d seconds (alarmreq:%d)" %
-                        (second_towait, obj_alarmreq.id))
-
-            if obj_alarmreq.alarm.maxretry == 0:
-                call_type = CALLREQUEST_TYPE.CANNOT_RETRY
-            else:
-                call_type = CALLREQUEST_TYPE.ALLOW_RETRY
-
-            try:
-                caluser_profile = CalendarUserProfile.objects.get(user=obj_alarmreq.alarm.event.creator)
-            except CalendarUserProfile.DoesNotExist:
-                logger.error("Error retrieving CalendarUserProfile")
-                return False
-
-            # manager_profile = UserProfile.objects.get(user=caluser_profile.manager)
-            # manager_profile = caluser_profile.manager.get_profile()
-            # manager_profile.dialersetting
-            # Use manager_profile.dialersetting to retrieve some settings
-
-            # TODO: build settings for this
-            calltimeout = caluser_profile.calendar_setting.call_timeout
-            callmaxduration = 60 * 60
-            callerid = caluser_profile.calendar_setting.callerid
-            caller_name = caluser_profile.calendar_setting.caller_name
-            aleg_gateway = caluser_profile.calendar_setting.aleg_gateway
-            content_type = ContentType.objects.get(model__in=["survey"])
-            object_id = caluser_profile.calendar_setting.survey_id
-
-            # Create Callrequest to track the call task
-            new_callrequest = Callrequest(
-                status=CALLREQUEST_STATUS.PENDING,
-                call_type=call_type,
-                call_time=datetime.utcnow().replace(tzinfo=utc),
-                timeout=calltimeout,
-                callerid=callerid,
-                caller_name=caller_name,
-                phone_number=obj_alarmreq.alarm.alarm_phonenumber,
-                alarm_request_id=obj_alarmreq.id,
-                aleg_gateway=aleg_gateway,
-                content_type=content_type,
-                object_id=object_id,
-                user=caluser_profile.manager,
-                extra_data='',
-                timelimit=callmaxduration)
-            new_callrequest.save()
+                        (second_towait, alarm_request_id))
 
             init_callrequest.apply_async(
-                args=[new_callrequest.id, None, callmaxduration, ms_addtowait, obj_alarmreq.id],
+                args=[callrequest_id, None, ALARM_CALLMAXDURATION, ms_addtowait, alarm_request_id],
                 countdown=second_towait)
+        return True
 
-            obj_alarmreq.callrequest = new_callrequest
-            obj_alarmreq.status = ALARMREQUEST_STATUS.IN_PROCESS
-            obj_alarmreq.save()
-            # Increment num_attempt
-            if not obj_alarmreq.alarm.num_attempt:
-                obj_alarmreq.alarm.num_attempt = 0
-            obj_alarmreq.alarm.num_attempt = obj_alarmreq.alarm.num_attempt + 1
-            obj_alarmreq.alarm.save()
+
+@transaction.atomic
+def create_alarm_callrequest(alarmreq_list):
+    """
+    Create in bulk the Callrequests of the AlarmRequests, link them to their
+    AlarmRequest flagged as in process and increment the Alarms num_attempt.
+
+    Return the list of (callrequest_id, alarm_request_id) created
+    """
+    # Preload the calendar settings of all the event creators
+    creator_id_list = set(obj_alarmreq.alarm.event.creator_id for obj_alarmreq in alarmreq_list)
+    caluser_profile_dict = dict(
+        (caluser_profile.user_id, caluser_profile) for caluser_profile in
+        CalendarUserProfile.objects.select_related('calendar_setting').filter(user__in=creator_id_list))
+    content_type = ContentType.objects.get_for_model(Survey)
+
+    bulk_record = []
+    alarm_id_list = []
+    # this is used to tag and retrieve the id that are inserted
+    bulk_uuid = str(uuid1())
+    for obj_alarmreq in alarmreq_list:
+        caluser_profile = caluser_profile_dict.get(obj_alarmreq.alarm.event.creator_id)
+        if caluser_profile is None:
+            logger.error("Error retrieving CalendarUserProfile (alarmreq:%d)" % obj_alarmreq.id)
+            continue
+
+        if obj_alarmreq.alarm.maxretry == 0:
+            call_type = CALLREQUEST_TYPE.CANNOT_RETRY
+        else:
+            call_type = CALLREQUEST_TYPE.ALLOW_RETRY
+
+        # manager_profile = UserProfile.objects.get(user=caluser_profile.manager)
+        # Use manager_profile.dialersetting to retrieve some settings
+        calendar_setting = caluser_profile.calendar_setting
+
+        # Create Callrequest to track the call task
+        bulk_record.append(Callrequest(
+            status=CALLREQUEST_STATUS.PENDING,
+            call_type=call_type,
+            call_time=datetime.utcnow().replace(tzinfo=utc),
+            timeout=calendar_setting.call_timeout,
+            callerid=calendar_setting.callerid,
+            caller_name=calendar_setting.caller_name,
+            phone_number=obj_alarmreq.alarm.alarm_phonenumber,
+            alarm_request_id=obj_alarmreq.id,
+            aleg_gateway_id=calendar_setting.aleg_gateway_id,
+            content_type=content_type,
+            object_id=calendar_setting.survey_id,
+            user_id=caluser_profile.manager_id,
+            extra_data='',
+            timelimit=ALARM_CALLMAXDURATION,
+            request_uuid=bulk_uuid))
+        alarm_id_list.append(obj_alarmreq.alarm_id)
+
+    if not bulk_record:
+        return []
+
+    # Create Callrequests in Bulk
+    logger.info("Bulk Create CallRequest for AlarmRequest => %d" % len(bulk_record))
+    Callrequest.objects.bulk_create(bulk_record)
+
+    # Link each AlarmRequest to the Callrequest we just created
+    cursor = connection.cursor()
+    cursor.execute(
+        "UPDATE {alarmreq} SET status = %s, callrequest_id = ("
+        "SELECT {callreq}.id FROM {callreq} WHERE {callreq}.request_uuid = %s "
+        "AND {callreq}.alarm_request_id = {alarmreq}.id) "
+        "WHERE {alarmreq}.id IN (SELECT alarm_request_id FROM {callreq} WHERE request_uuid = %s)"
+        .format(alarmreq=AlarmRequest._meta.db_table, callreq=Callrequest._meta.db_table),
+        [ALARMREQUEST_STATUS.IN_PROCESS, bulk_uuid, bulk_uuid])
+
+    # Increment num_attempt once per Callrequest, grouping the Alarms by count
+    attempt_count = defaultdict(int)
+    for alarm_id in alarm_id_list:
+        attempt_count[alarm_id] += 1
+    count_alarm_dict = defaultdict(list)
+    for (alarm_id, count) in attempt_count.items():
+        count_alarm_dict[count].append(alarm_id)
+    for (count, id_list) in count_alarm_dict.items():
+        Alarm.objects.filter(id__in=id_list).update(num_attempt=F('num_attempt') + count)
+
+    return list(Callrequest.objects.filter(request_uuid=bulk_uuid)
+                .order_by('id').values_list('id', 'alarm_request_id'))
@@ -22,14 +22,17 @@
 from user_profile.models import CalendarUser, CalendarUserProfile
 from calendar_settings.models import CalendarSetting
 from appointment.models.calendars import Calendar
-from appointment.models.events import Event
-from appointment.models.alarms import Alarm
+from appointment.models.events import Event, OccurrenceIndex, get_rrule_after
+from appointment.models.alarms import Alarm, AlarmQueue, AlarmRequest
+from appointment.models.rules import Rule
+from appointment.constants import ALARM_STATUS, EVENT_STATUS, ALARMREQUEST_STATUS
+from appointment.tasks import copy_next_occurrence, create_alarm_callrequest, alarm_dispatcher
 from appointment.views import calendar_setting_list, calendar_user_list, calendar_list,\
     event_list, alarm_list, calendar_setting_add, calendar_setting_change,\
     calendar_setting_del, calendar_user_add, calendar_user_change, calendar_user_del,\
     calendar_add, calendar_change, calendar_del, event_add, event_change, event_del,\
     alarm_add, alarm_change, alarm_del
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import utc
 from django.test.client import RequestFactory
 import pytest
@@ -42,6 +45,7 @@ from newfies_factory.factories import UserFactory, SurveyTemplateFactory, Survey
     ManagerFactory, CalendarUserFactory
 from dialer_campaign.constants import AMD_BEHAVIOR
 from django.core.urlresolvers import reverse
+from dateutil import rrule
 
 
 def test_an_exception():
@@ -243,6 +247,137 @@ def test_calendar_user_view_add(transactional_db, admin_client, client, admin_us
     assert resp.status_code == 200
 
 
+@pytest.fixture
+def appointment_event(transactional_db, nf_manager):
+    calendarsetting = CalendarSettingFactory.create(user=nf_manager)
+    calendarsetting.save()
+    calendar_user = CalendarUserFactory.create(calendaruserprofile__manager=nf_manager,
+                                               calendaruserprofile__calendar_setting=calendarsetting)
+    calendar = Calendar.objects.create(name="test calendar", user=calendar_user)
+    event = Event.objects.create(title="test event", creator=calendar_user, calendar=calendar)
+    return event
+
+
+def test_alarm_queue(appointment_event):
+    """Test that pending Alarms are queued and popped once due"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    alarm_due = Alarm.objects.create(event=appointment_event, date_start_notice=now - timedelta(minutes=1))
+    alarm_later = Alarm.objects.create(event=appointment_event, date_start_notice=now + timedelta(hours=2))
+    assert AlarmQueue.objects.count() == 2
+
+    assert AlarmQueue.objects.pop_due(now, 100) == [alarm_due.id]
+    assert AlarmQueue.objects.filter(alarm=alarm_later).exists()
+
+    # An Alarm leaving the PENDING status is removed from the queue
+    alarm_later.status = ALARM_STATUS.SUCCESS
+    alarm_later.save()
+    assert AlarmQueue.objects.count() == 0
+
+
+def test_alarm_dispatcher_expired(appointment_event):
+    """Test that a popped Alarm too late to notify is set as failure"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    alarm_expired = Alarm.objects.create(event=appointment_event, date_start_notice=now - timedelta(hours=2))
+    alarm_dispatcher().run()
+    assert not AlarmQueue.objects.filter(alarm=alarm_expired).exists()
+    assert Alarm.objects.get(pk=alarm_expired.id).status == ALARM_STATUS.FAILURE
+
+
+def test_rrule_after():
+    """Test the rules expanded from the last interval match the rules expanded from their start"""
+    dtstart = datetime(2012, 1, 31, 8, 30, tzinfo=utc)
+    for (frequency, params) in [("YEARLY", None), ("YEARLY", "bymonth:2;bymonthday:29"),
+                                ("MONTHLY", None), ("MONTHLY", "interval:2"),
+                                ("MONTHLY", "bysetpos:2;byweekday:MO,TU,WE,TH,FR"),
+                                ("WEEKLY", "byweekday:MO,FR;interval:2"), ("DAILY", "interval:3"),
+                                ("HOURLY", "byhour:3,15"), ("DAILY", "count:40")]:
+        rule = Rule(name=frequency, frequency=frequency, params=params)
+        expected_rrule = rrule.rrule(getattr(rrule, frequency), dtstart=dtstart, **rule.get_params())
+        for days in (0, 1, 29, 400, 1000):
+            after = dtstart + timedelta(days=days, hours=5)
+            assert get_rrule_after(rule, dtstart, after) == expected_rrule.after(after)
+
+
+def test_event_next_occurrence_copy(appointment_event):
+    """Test the copy of the next occurrence of an old recurring Event"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    rule = Rule.objects.create(name="Daily", description="Daily", frequency="DAILY")
+    appointment_event.rule = rule
+    appointment_event.start = now - timedelta(days=700, hours=1)
+    appointment_event.end = appointment_event.start + timedelta(hours=1)
+    appointment_event.save()
+    Alarm.objects.create(event=appointment_event, date_start_notice=appointment_event.start)
+
+    next_occurrence = appointment_event.get_next_occurrence()
+    assert now < next_occurrence <= now + timedelta(days=1)
+
+    copy_next_occurrence([appointment_event])
+    new_event = Event.objects.get(parent_event=appointment_event)
+    assert new_event.start == next_occurrence
+    assert new_event.occ_count == appointment_event.occ_count + 1
+    assert Event.objects.get(pk=appointment_event.id).status == EVENT_STATUS.COMPLETED
+    new_alarm = Alarm.objects.get(event=new_event)
+    assert new_alarm.date_start_notice == next_occurrence
+    assert AlarmQueue.objects.filter(alarm=new_alarm).exists()
+
+
+def test_occurrence_index(appointment_event):
+    """Test that the occurrences of a recurring Event are read from the index"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    rule = Rule.objects.create(name="Daily", description="Daily", frequency="DAILY")
+    appointment_event.rule = rule
+    appointment_event.start = now - timedelta(days=10)
+    appointment_event.end = appointment_event.start + timedelta(hours=1)
+    appointment_event.end_recurring_period = now + timedelta(days=20)
+    appointment_event.save()
+    assert OccurrenceIndex.objects.filter(event=appointment_event).count() == 30
+
+    start = now - timedelta(days=2, hours=2)
+    end = now + timedelta(days=1, hours=22)
+    occurrences = OccurrenceIndex.objects.get_occurrences([appointment_event], start, end)
+    expected = appointment_event.get_occurrences(start, end)
+    assert [occ.start for occ in sorted(occurrences)] == [occ.start for occ in sorted(expected)]
+
+    # The rule is expanded from the retention bound, not from the first occurrence
+    appointment_event.start = now - timedelta(days=400)
+    appointment_event.end = appointment_event.start + timedelta(hours=1)
+    appointment_event.save()
+    assert OccurrenceIndex.objects.filter(event=appointment_event).count() == 50
+
+    # A child event occurs once in the index and in the expansion of the rules
+    child_event = appointment_event.copy_event(now + timedelta(days=100))
+    assert OccurrenceIndex.objects.filter(event=child_event).count() == 1
+    occurrences = child_event.get_occurrences(now, now + timedelta(days=200))
+    assert [occ.start for occ in occurrences] == [child_event.start]
+
+    # The events saved before the index existed are expanded until backfilled
+    OccurrenceIndex.objects.all().delete()
+    occurrences = OccurrenceIndex.objects.get_occurrences([appointment_event, child_event], start, end)
+    assert [occ.start for occ in sorted(occurrences)] == [occ.start for occ in sorted(expected)]
+    assert OccurrenceIndex.objects.backfill() == 2
+    assert OccurrenceIndex.objects.filter(event=appointment_event).count() == 50
+    assert OccurrenceIndex.objects.filter(event=child_event).count() == 1
+
+
+def test_create_alarm_callrequest(appointment_event):
+    """Test the bulk creation of the Callrequests of the AlarmRequests"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    alarm = Alarm.objects.create(event=appointment_event, date_start_notice=now, alarm_phonenumber="123456789")
+    other_alarm = Alarm.objects.create(event=appointment_event, date_start_notice=now, alarm_phonenumber="123456780")
+    alarmreq_list = [AlarmRequest.objects.create(alarm=alarm, date=now) for i in range(3)]
+    alarmreq_list.append(AlarmRequest.objects.create(alarm=other_alarm, date=now))
+
+    callrequest_list = create_alarm_callrequest(alarmreq_list)
+    assert len(callrequest_list) == 4
+    for (callrequest_id, alarm_request_id) in callrequest_list:
+        obj_alarmreq = AlarmRequest.objects.get(pk=alarm_request_id)
+        assert obj_alarmreq.callrequest_id == callrequest_id
+        assert obj_alarmreq.status == ALARMREQUEST_STATUS.IN_PROCESS
+    # num_attempt counts each Callrequest of the Alarm
+    assert Alarm.objects.get(pk=alarm.id).num_attempt == 3
+    assert Alarm.objects.get(pk=other_alarm.id).num_attempt == 1
+
+
 # def test_calendar_user_view_update(transactional_db, admin_client, client, admin_user, rf, appointment_fixtures,
 #                                 admin_user_profile, nf_manager):
 #     """Test Function to check update calendar user"""
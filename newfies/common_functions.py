@@ -12,23 +12,9 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 
-from django.conf import settings
-from django import db
 import os
 
 
-def debug_query(number):
-    """
-    Function to debug the SQL queries
-    """
-    if settings.DIALERDEBUG and number >= 20:
-        print("%d) " % number)
-        print("QUERY #) %d" % len(db.connection.queries))
-        print(db.connection.queries)
-    if settings.DIALERDEBUG:
-        db.reset_queries()
-
-
 def check_celeryd_process():
     """Check celeryd service running or not"""
     process = os.popen("ps x | grep celeryd").read().splitlines()
@@ -0,0 +1,160 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
+from celery.decorators import task
+from celery.utils.log import get_task_logger
+from audiofield.models import AudioFile
+from multiprocessing.pool import ThreadPool
+import subprocess
+import hashlib
+import re
+import os
+
+logger = get_task_logger(__name__)
+
+AUDIO_TRANSCODE_POOL_SIZE = getattr(settings, 'AUDIO_TRANSCODE_POOL_SIZE', 4)
+# CONVERT_TYPE_VALUE => extension, 0 keeps the original format
+CONVERT_TYPE_EXT = {0: None, 1: 'mp3', 2: 'wav', 3: 'ogg'}
+# Audio format played by FreeSWITCH without resampling
+PLAYBACK_CHANNEL = 1
+PLAYBACK_FREQ = 8000
+PLAYBACK_SUFFIX = '.8k.wav'
+AUDIO_FILENAME_PREFIX = 'audio-file-'
+TRANSCODED_FILENAME = re.compile(r'^(%s[0-9a-f]{40})\.' % AUDIO_FILENAME_PREFIX)
+
+
+def get_audio_hash(audio_file_path):
+    """Return the sha1 of the audio file content"""
+    sha1 = hashlib.sha1()
+    audio_file = open(audio_file_path, 'rb')
+    for chunk in iter(lambda: audio_file.read(65536), b''):
+        sha1.update(chunk)
+    audio_file.close()
+    return sha1.hexdigest()
+
+
+def get_sox_command(src_path, dst_path, channel=0, freq=0):
+    """
+    Build the sox command converting src_path into dst_path
+
+    >>> get_sox_command('/tmp/a.mp3', '/tmp/b.wav', 1, 8000)
+    ['sox', '/tmp/a.mp3', '-r', '8000', '-c', '1', '-e', 'signed-integer', '-b', '16', '/tmp/b.wav']
+    """
+    conv = ['sox', src_path]
+    if freq > 0:
+        conv += ['-r', str(freq)]
+    if channel > 0:
+        conv += ['-c', str(channel)]
+    if dst_path.endswith('.wav'):
+        conv += ['-e', 'signed-integer', '-b', '16']
+    conv.append(dst_path)
+    return conv
+
+
+def transcode_audio_file(item):
+    """
+    Convert a (src_path, dst_path, channel, freq) item of the transcoding
+    pool, an output that already exists is skipped
+    """
+    (src_path, dst_path, channel, freq) = item
+    if os.path.isfile(dst_path):
+        return True
+    # sox gets the output format from the extension
+    part_path = os.path.join(os.path.dirname(dst_path), '.part%d_%s' % (os.getpid(), os.path.basename(dst_path)))
+    try:
+        response = subprocess.Popen(get_sox_command(src_path, part_path, channel, freq),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (output, error) = response.communicate()
+    except OSError:
+        logger.error("Sox is not installed")
+        return False
+    if response.returncode != 0 or not os.path.isfile(part_path):
+        logger.error("Error conversion %s : %s" % (src_path, error))
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        return False
+    os.rename(part_path, dst_path)
+    return True
+
+
+@task(ignore_result=True)
+def audio_transcode(audio_id_list):
+    """
+    Convert the uploaded audio files to the format set by CONVERT_TYPE_VALUE,
+    CHANNEL_TYPE_VALUE & FREQ_TYPE_VALUE and pre-generate the 8kHz mono wav
+    variant played by FreeSWITCH.
+
+    Outputs are named after the sha1 of the upload so identical uploads are
+    converted once, the conversions run in parallel sox processes. The upload
+    replaced by its conversion is removed once no audio uses it.
+
+    **Attributes**:
+
+        * ``audio_id_list`` - list of AudioFile ID
+    """
+    logger.info("TASK :: audio_transcode = %s" % str(audio_id_list))
+    convert_ext = CONVERT_TYPE_EXT.get(getattr(settings, 'CONVERT_TYPE_VALUE', 0))
+    channel = getattr(settings, 'CHANNEL_TYPE_VALUE', 0)
+    freq = getattr(settings, 'FREQ_TYPE_VALUE', 0)
+
+    job_dict = {}
+    audio_output_list = []
+    for audio in AudioFile.objects.filter(id__in=audio_id_list).only('id', 'audio_file'):
+        if not audio.audio_file or not os.path.isfile(audio.audio_file.path):
+            logger.error("Can't find the file of the audio %d" % audio.id)
+            continue
+        src_path = audio.audio_file.path
+        audio_dir = os.path.dirname(src_path)
+        src_ext = os.path.splitext(src_path)[1][1:].lower()
+        transcoded = TRANSCODED_FILENAME.match(os.path.basename(src_path))
+        if transcoded:
+            # output of a previous run, only check the playback variant
+            basename = transcoded.group(1)
+        else:
+            basename = AUDIO_FILENAME_PREFIX + get_audio_hash(src_path)
+
+        playback_path = os.path.join(audio_dir, basename + PLAYBACK_SUFFIX)
+        job_dict[playback_path] = (src_path, playback_path, PLAYBACK_CHANNEL, PLAYBACK_FREQ)
+        if (convert_ext, channel, freq) == ('wav', PLAYBACK_CHANNEL, PLAYBACK_FREQ):
+            # the default settings convert to the playback variant
+            dst_path = playback_path
+        elif convert_ext and (convert_ext != src_ext or channel > 0 or freq > 0):
+            dst_path = os.path.join(audio_dir, '%s.%s' % (basename, convert_ext))
+            job_dict[dst_path] = (src_path, dst_path, channel, freq)
+        else:
+            dst_path = src_path
+        audio_output_list.append((audio, dst_path))
+
+    if job_dict:
+        pool = ThreadPool(AUDIO_TRANSCODE_POOL_SIZE)
+        try:
+            pool.map(transcode_audio_file, job_dict.values())
+        finally:
+            pool.close()
+            pool.join()
+
+    replaced_list = []
+    for (audio, dst_path) in audio_output_list:
+        if dst_path != audio.audio_file.path and os.path.isfile(dst_path):
+            # update() as save() would trigger the rename of audiofield
+            AudioFile.objects.filter(id=audio.id)\
+                .update(audio_file=os.path.relpath(dst_path, settings.MEDIA_ROOT))
+            replaced_list.append((audio.audio_file.name, audio.audio_file.path))
+
+    # Remove the uploads replaced by their conversion, unless another audio uses them
+    for (src_name, src_path) in set(replaced_list):
+        if not AudioFile.objects.filter(audio_file=src_name).exists() and os.path.isfile(src_path):
+            os.remove(src_path)
+    return True
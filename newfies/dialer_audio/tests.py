@@ -12,12 +12,17 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 
-# from django.contrib.auth.models import User
+from django.contrib.auth.models import User
 from django.conf import settings
+from django.test import TestCase
 from django_lets_go.utils import BaseAuthenticatedClient
-# from audiofield.models import AudioFile
+from audiofield.models import AudioFile
 from dialer_audio.views import audio_list  # audio_add, audio_change, audio_del
-# import os
+from dialer_audio.tasks import get_sox_command, transcode_audio_file, get_audio_hash, audio_transcode, \
+    AUDIO_FILENAME_PREFIX, PLAYBACK_SUFFIX
+import tempfile
+import shutil
+import os
 
 # audio_file = open(
 #    os.path.abspath('../../newfies-dialer/newfies/') + '/dialer_audio/fixtures/testcase_audio.mp3', 'r'
@@ -43,6 +48,67 @@ class AudioFileAdminView(BaseAuthenticatedClient):
         self.assertEqual(response.status_code, 200)
 
 
+class AudioTranscodeTestCase(TestCase):
+
+    """Test cases for the audio transcoding task, sox is replaced by a copy"""
+
+    def setUp(self):
+        self.bin_dir = tempfile.mkdtemp()
+        fake_sox = os.path.join(self.bin_dir, 'sox')
+        with open(fake_sox, 'w') as sox_file:
+            sox_file.write('#!/bin/sh\nfor dst; do :; done\ncp "$1" "$dst"\n')
+        os.chmod(fake_sox, 0o755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.path
+        self.audio_dir = os.path.abspath(os.path.join(settings.MEDIA_ROOT, 'upload/audiofiles'))
+        self.created_list = []
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.bin_dir)
+        for file_path in self.created_list:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def test_get_sox_command(self):
+        """Test the sox command of the 8kHz mono wav variant"""
+        self.assertEqual(get_sox_command('a.mp3', 'b.8k.wav', 1, 8000),
+                         ['sox', 'a.mp3', '-r', '8000', '-c', '1', '-e', 'signed-integer', '-b', '16', 'b.8k.wav'])
+        self.assertEqual(get_sox_command('a.wav', 'b.mp3'), ['sox', 'a.wav', 'b.mp3'])
+
+    def test_transcode_audio_file(self):
+        """Test that an output which already exists is not converted again"""
+        self.assertTrue(transcode_audio_file(('/tmp/missing.mp3', audio_file.name, 1, 8000)))
+        self.assertEqual(len(get_audio_hash(audio_file.name)), 40)
+
+    def test_audio_transcode(self):
+        """Test that the upload is converted, swapped & removed once no audio uses it"""
+        upload_path = os.path.join(self.audio_dir, 'test-upload-%d.mp3' % os.getpid())
+        shutil.copy(audio_file.name, upload_path)
+        playback_path = os.path.join(self.audio_dir, AUDIO_FILENAME_PREFIX + get_audio_hash(upload_path) +
+                                     PLAYBACK_SUFFIX)
+        self.created_list = [upload_path, playback_path]
+
+        user = User.objects.create_user('audio_user', 'audio@example.com', 'password')
+        audio_id_list = []
+        for i in range(2):
+            audio = AudioFile(name='test audio', user=user)
+            audio.save()
+            AudioFile.objects.filter(id=audio.id)\
+                .update(audio_file=os.path.relpath(upload_path, settings.MEDIA_ROOT))
+            audio_id_list.append(audio.id)
+
+        # the other audio still uses the upload
+        audio_transcode([audio_id_list[0]])
+        self.assertEqual(AudioFile.objects.get(id=audio_id_list[0]).audio_file.path, playback_path)
+        self.assertTrue(os.path.isfile(playback_path))
+        self.assertTrue(os.path.isfile(upload_path))
+
+        audio_transcode([audio_id_list[1]])
+        self.assertEqual(AudioFile.objects.get(id=audio_id_list[1]).audio_file.path, playback_path)
+        self.assertFalse(os.path.exists(upload_path))
+
+
 class AudioFileCustomerView(BaseAuthenticatedClient):
 
     """Test cases for AudioFile Customer Interface."""
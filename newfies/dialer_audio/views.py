@@ -20,6 +20,7 @@ from django.shortcuts import render_to_response, get_object_or_404
 from django.template.context import RequestContext
 from django.utils.translation import ugettext as _
 from dialer_audio.forms import DialerAudioFileForm
+from dialer_audio.tasks import audio_transcode, PLAYBACK_SUFFIX
 from audiofield.models import AudioFile
 from django_lets_go.common_functions import get_pagination_vars
 import os.path
@@ -71,9 +72,11 @@ def audio_add(request):
         * Add a new audio which will belong to the logged in user
           via the CustomerAudioFileForm & get redirected to the audio list
     """
+    keep_original_upload(request)
     form = DialerAudioFileForm(request.POST or None, request.FILES or None)
     if form.is_valid():
-        form.save(user=request.user)
+        obj = form.save(user=request.user)
+        audio_transcode.delay([obj.id])
         request.session["msg"] = _('"%(name)s" added.') % {'name': request.POST['name']}
         return HttpResponseRedirect(audio_redirect_url)
     data = {
@@ -83,11 +86,26 @@ def audio_add(request):
     return render_to_response('dialer_audio/audio_change.html', data, context_instance=RequestContext(request))
 
 
+def keep_original_upload(request):
+    """audiofield converts the upload within the request when convert_type is
+    set, keep the upload as it is and let the audio_transcode task convert it"""
+    if request.method == 'POST' and 'convert_type' in request.POST:
+        post = request.POST.copy()
+        post['convert_type'] = '0'
+        request.POST = post
+
+
 def delete_audio_file(obj):
-    """Delete audio file from computer drive"""
+    """Delete audio file & its playback variant from computer drive, the
+    transcoded files are shared by the audios with the same content"""
     if obj.audio_file:
-        if os.path.exists(obj.audio_file.path):
-            os.remove(obj.audio_file.path)
+        if AudioFile.objects.filter(audio_file=obj.audio_file.name).exclude(id=obj.id).exists():
+            return True
+        audio_file_path = obj.audio_file.path
+        playback_path = os.path.splitext(audio_file_path)[0] + PLAYBACK_SUFFIX
+        for file_path in set([audio_file_path, playback_path]):
+            if os.path.exists(file_path):
+                os.remove(file_path)
     return True
 
 
@@ -151,6 +169,7 @@ def audio_change(request, object_id):
           via the CustomerAudioFileForm & get redirected to the audio list
     """
     obj = get_object_or_404(AudioFile, pk=object_id, user=request.user)
+    keep_original_upload(request)
     form = DialerAudioFileForm(request.POST or None, request.FILES or None, instance=obj)
 
     if form.is_valid():
@@ -159,6 +178,8 @@ def audio_change(request, object_id):
             return HttpResponseRedirect(audio_redirect_url)
         else:
             form.save()
+            if request.FILES:
+                audio_transcode.delay([obj.id])
             return HttpResponseRedirect(audio_redirect_url)
     data = {
         'form': form,
@@ -12,6 +12,7 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib import messages
 from django.conf.urls import patterns
 from django.utils.translation import ugettext_lazy as _
@@ -20,7 +21,7 @@ from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
 from django.shortcuts import render_to_response
 from django.template.context import RequestContext
-from dialer_campaign.models import Campaign, Subscriber
+from dialer_campaign.models import Campaign, Subscriber, attach_campaign_stats
 # from dialer_campaign.admin_filters import AgentFilter
 from dialer_campaign.function_def import check_dialer_setting, dialer_setting_limit
 from dialer_campaign.constants import SUBSCRIBER_STATUS, SUBSCRIBER_STATUS_NAME
@@ -30,6 +31,15 @@ from django_lets_go.common_functions import ceil_strdate, getvar
 from datetime import datetime
 
 
+class CampaignChangeList(ChangeList):
+
+    """Fetch the counts of progress_bar for the whole page at once"""
+
+    def get_results(self, request):
+        super(CampaignChangeList, self).get_results(request)
+        self.result_list = attach_campaign_stats(self.result_list)
+
+
 class CampaignAdmin(GenericAdminModelAdmin):
 
     """
@@ -70,6 +80,9 @@ class CampaignAdmin(GenericAdminModelAdmin):
     ordering = ('-id', )
     filter_horizontal = ('phonebook', )
 
+    def get_changelist(self, request, **kwargs):
+        return CampaignChangeList
+
     def get_urls(self):
         urls = super(CampaignAdmin, self).get_urls()
         my_urls = patterns('',
@@ -25,6 +25,7 @@ CAMPAIGN_COLUMN_NAME = {
     'type': _('type'),
     'app': _('app'),
     'contacts': _('contacts'),
+    'progress': _('progress'),
     'status': _('status'),
     'frequency': _('frequency'),
     'phonebook': _('phonebook')
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_pending_index(apps, schema_editor):
+    # Partial index of the pending subscribers claimed by pending_call_processing,
+    # it covers the claim subquery & leaves out the subscribers already called
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(
+            "CREATE INDEX dialer_subscriber_pending_campaign "
+            "ON dialer_subscriber (campaign_id, id) WHERE status = 1")
+    else:
+        schema_editor.execute(
+            "CREATE INDEX dialer_subscriber_pending_campaign "
+            "ON dialer_subscriber (campaign_id, status)")
+
+
+def drop_pending_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP INDEX dialer_subscriber_pending_campaign")
+    else:
+        schema_editor.execute("DROP INDEX dialer_subscriber_pending_campaign ON dialer_subscriber")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialer_campaign', '0002_campaign_stoppeddate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pending_index, drop_pending_index),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_updated_index(apps, schema_editor):
+    # The incremental syncs of the REST API page the subscribers on (updated_date, id)
+    schema_editor.execute(
+        "CREATE INDEX dialer_subscriber_updated_date_id ON dialer_subscriber (updated_date, id)")
+
+
+def drop_updated_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP INDEX dialer_subscriber_updated_date_id")
+    else:
+        schema_editor.execute("DROP INDEX dialer_subscriber_updated_date_id ON dialer_subscriber")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialer_campaign', '0004_phonebooksync'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_updated_index, drop_updated_index),
+    ]
@@ -17,11 +17,10 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 from django.utils.timezone import now
 from django.core.urlresolvers import reverse
-from django.core.cache import cache
 from django.db.models.signals import post_save
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
-from django.db import transaction
+from django.db import transaction, connection
 
 from django_lets_go.intermediate_model_base_class import Model
 from django_lets_go.common_functions import get_unique_code, percentage
@@ -36,6 +35,7 @@ import re
 from .constants import SUBSCRIBER_STATUS, CAMPAIGN_STATUS, AMD_BEHAVIOR
 from dialer_contact.constants import CONTACT_STATUS
 from dialer_contact.models import Phonebook, Contact
+from dialer_contact.outbox import queue_phonebook
 from dialer_gateway.models import Gateway
 from sms.models import Gateway as SMS_Gateway
 from dnc.models import DNC
@@ -70,6 +70,23 @@ def build_kwargs_runnning_campaign():
     return kwargs
 
 
+# Columns of the subscribers claimed by Campaign.get_pending_subscriber_update
+CLAIM_SUBSCRIBER_FIELDS = ('id', 'contact_id', 'campaign_id', 'duplicate_contact', 'count_attempt')
+
+# The subquery is an index only scan of dialer_subscriber_pending_campaign,
+# the rows locked by a concurrent claim are skipped instead of waited for
+CLAIM_SUBSCRIBER_SQL = """
+UPDATE dialer_subscriber SET status = %%s, updated_date = %%s
+WHERE id IN (
+    SELECT id FROM dialer_subscriber
+    WHERE campaign_id = %%s AND status = %%s
+    ORDER BY id
+    LIMIT %%s
+    FOR UPDATE SKIP LOCKED)
+RETURNING %s
+""" % ', '.join(CLAIM_SUBSCRIBER_FIELDS)
+
+
 class CampaignManager(models.Manager):
 
     """Campaign Manager"""
@@ -91,6 +108,60 @@ class CampaignManager(models.Manager):
         return Campaign.objects.filter(**kwargs).exclude(status=CAMPAIGN_STATUS.END)
 
 
+def get_campaign_stats(campaign_id_list, with_subscriber=True):
+    """
+    Return the contact & subscriber counts of the campaigns with two grouped
+    queries, whatever the number of campaigns, campaign_id => stats
+
+    **Attributes**:
+
+        * ``contact`` - contacts of the phonebooks of the campaign
+        * ``active_contact`` - active contacts of the phonebooks
+        * ``subscriber`` - subscribers of the campaign
+        * ``status`` - subscriber status => count
+        * ``sent`` - subscribers with status SENT
+        * ``completion`` - percentage of the contacts sent
+
+    With with_subscriber=False only the contacts are counted.
+    """
+    campaign_stats = dict([
+        (campaign_id, {'contact': 0, 'active_contact': 0, 'subscriber': 0, 'status': {}, 'sent': 0, 'completion': 0})
+        for campaign_id in campaign_id_list])
+    if not campaign_stats:
+        return campaign_stats
+
+    contact_count_list = Contact.objects.filter(phonebook__campaign__in=campaign_stats.keys())\
+        .values_list('phonebook__campaign', 'status').annotate(count=models.Count('id')).order_by()
+    for (campaign_id, status, count) in contact_count_list:
+        campaign_stats[campaign_id]['contact'] += count
+        if status == CONTACT_STATUS.ACTIVE:
+            campaign_stats[campaign_id]['active_contact'] += count
+
+    if not with_subscriber:
+        return campaign_stats
+
+    subscriber_count_list = Subscriber.objects.filter(campaign__in=campaign_stats.keys())\
+        .values_list('campaign', 'status').annotate(count=models.Count('id')).order_by()
+    for (campaign_id, status, count) in subscriber_count_list:
+        campaign_stats[campaign_id]['subscriber'] += count
+        campaign_stats[campaign_id]['status'][status] = count
+
+    for stats in campaign_stats.values():
+        stats['sent'] = stats['status'].get(SUBSCRIBER_STATUS.SENT, 0)
+        if stats['contact'] > 0:
+            stats['completion'] = int(percentage(stats['sent'], stats['contact']))
+    return campaign_stats
+
+
+def attach_campaign_stats(campaign_list):
+    """Set the stats of a page of campaigns at once, return the campaigns as a list"""
+    campaign_list = list(campaign_list)
+    campaign_stats = get_campaign_stats([campaign.id for campaign in campaign_list])
+    for campaign in campaign_list:
+        campaign._stats = campaign_stats[campaign.id]
+    return campaign_list
+
+
 def common_contact_authorization(dialersetting, str_contact):
     """
     Common Function to check contact no is authorized or not.
@@ -372,41 +443,18 @@ class Campaign(Model):
             return False
         return list_contact
 
+    @property
+    def stats(self):
+        """Contact & subscriber counts, see get_campaign_stats"""
+        if not hasattr(self, '_stats'):
+            self._stats = get_campaign_stats([self.id])[self.id]
+        return self._stats
+
     def progress_bar(self):
         """Progress bar generated based on no of contacts"""
-        # Cache subscriber_count
-        count_contact = Contact.objects.filter(phonebook__campaign=self.id).count()
-
-        # Cache need to be set per campaign
-        # subscriber_count_key_campaign_id_1
-        subscriber_count = cache.get('subscriber_count_key_campaign_id_' + str(self.id))
-
-        if subscriber_count is None:
-            list_contact = Contact.objects.values_list('id', flat=True)\
-                .filter(phonebook__campaign=self.id)
-
-            subscriber_count = 0
-            try:
-                subscriber_count += Subscriber.objects\
-                    .filter(contact__in=list_contact,
-                            campaign=self.id,
-                            status=SUBSCRIBER_STATUS.SENT)\
-                    .count()
-            except:
-                pass
-
-            cache.set("subscriber_count_key_campaign_id_%s" % str(self.id), subscriber_count, 5)
-
-        subscriber_count = int(subscriber_count)
-        count_contact = int(count_contact)
-
-        if count_contact > 0:
-            percentage_pixel = int(percentage(subscriber_count, count_contact))
-        else:
-            percentage_pixel = 0
-        subscriber_count_string = "subscribers (" + str(subscriber_count) + ")"
+        subscriber_count_string = "subscribers (" + str(self.stats['sent']) + ")"
         return "<div title='%s' style='width: 100px; border: 1px solid #ccc;'><div style='height: 4px; width: %dpx; background: #555; '></div></div>" % \
-            (subscriber_count_string, percentage_pixel)
+            (subscriber_count_string, self.stats['completion'])
     progress_bar.allow_tags = True
     progress_bar.short_description = _('progress')
 
@@ -425,23 +473,32 @@ class Campaign(Model):
     # OPTIMIZATION - GOOD
     @transaction.atomic
     def get_pending_subscriber_update(self, limit, status):
-        """Get all the pending subscribers from the campaign"""
-        # TODO: Improve this part with a PL/SQL
+        """
+        Claim up to limit pending subscribers of the campaign by setting
+        their status, return (list_subscriber, count)
 
-        # We cannot use select_related here as it's not compliant with locking the rows
-        list_subscriber = Subscriber.objects.select_for_update()\
-            .filter(campaign=self.id, status=SUBSCRIBER_STATUS.PENDING)\
-            .all()[:limit]
+        On PostgreSQL the claim is a single UPDATE ... RETURNING skipping the
+        subscribers locked by another worker, the subscribers returned only
+        have the CLAIM_SUBSCRIBER_FIELDS loaded and must be updated by id.
+        """
+        if connection.vendor == 'postgresql':
+            cursor = connection.cursor()
+            cursor.execute(CLAIM_SUBSCRIBER_SQL, [status, now(), self.id, SUBSCRIBER_STATUS.PENDING, limit])
+            list_subscriber = [Subscriber(**dict(zip(CLAIM_SUBSCRIBER_FIELDS, row))) for row in cursor.fetchall()]
+        else:
+            # We cannot use select_related here as it's not compliant with locking the rows
+            list_subscriber = list(Subscriber.objects.select_for_update()
+                                   .filter(campaign=self.id, status=SUBSCRIBER_STATUS.PENDING)
+                                   .only('contact', 'campaign', 'duplicate_contact', 'count_attempt')
+                                   .order_by('id')[:limit])
+            # Update in bulk
+            Subscriber.objects.filter(id__in=[elem.id for elem in list_subscriber])\
+                .update(status=status, updated_date=now())
         if not list_subscriber:
             return (False, 0)
-        id_list_sb = []
-        count = 0
         for elem_subscriber in list_subscriber:
-            count = count + 1
-            id_list_sb.append(elem_subscriber.id)
-        # Update in bulk
-        Subscriber.objects.filter(id__in=id_list_sb).update(status=status)
-        return (list_subscriber, count)
+            elem_subscriber.status = status
+        return (list_subscriber, len(list_subscriber))
 
 
 class Subscriber(Model):
@@ -532,6 +589,36 @@ class Subscriber(Model):
     """
 
 
+class PhonebookSync(models.Model):
+
+    """This defines how far the contacts of a phonebook have been imported
+    into the subscribers of a campaign
+
+    **Attributes**:
+
+        * ``last_contact_id`` - high-water mark, the contacts up to this id are imported
+        * ``updated_date`` - date of the last import
+
+    **Relationships**:
+
+        * ``campaign`` - Foreign key relationship to the Campaign model.
+        * ``phonebook`` - Foreign key relationship to the Phonebook model.
+
+    **Name of DB table**: dialer_phonebook_sync
+    """
+    campaign = models.ForeignKey(Campaign)
+    phonebook = models.ForeignKey(Phonebook)
+    last_contact_id = models.IntegerField(default=0)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = u'dialer_phonebook_sync'
+        unique_together = ['campaign', 'phonebook']
+
+    def __unicode__(self):
+        return u"%s-%s" % (self.campaign_id, self.phonebook_id)
+
+
 # Note : This will cause the running campaign to add the new contacts to the subscribers list
 def post_save_add_contact(sender, **kwargs):
     """A ``post_save`` signal is sent by the Contact model instance whenever
@@ -539,27 +626,15 @@ def post_save_add_contact(sender, **kwargs):
 
     **Logic Description**:
 
-        * When new contact is added into ``Contact`` model, active the
-          campaign list will be checked with the contact status.
-        * If the active campaign list count is more than one & the contact
-          is active, the contact will be added into ``Subscriber``
-          model.
+        * When a new active contact is added into ``Contact`` model, its
+          phonebook is queued in the contact outbox, ``contact_outbox_flush``
+          adds the contact to the subscribers of the running campaigns.
+        * The contacts imported with ``bulk_create`` queue their phonebook
+          the same way.
     """
     obj = kwargs['instance']
-    active_campaign_list = Campaign.objects.filter(phonebook__contact__id=obj.id,
-                                                   status=CAMPAIGN_STATUS.START)
-    # created instance = True + active contact + active_campaign
-    if kwargs['created'] and obj.status == CONTACT_STATUS.ACTIVE \
-            and active_campaign_list.count() >= 1:
-        for elem_campaign in active_campaign_list:
-            try:
-                Subscriber.objects.create(
-                    contact=obj,
-                    duplicate_contact=obj.contact,
-                    status=SUBSCRIBER_STATUS.PENDING,
-                    campaign=elem_campaign)
-            except:
-                pass
+    if kwargs['created'] and obj.status == CONTACT_STATUS.ACTIVE:
+        queue_phonebook(obj.phonebook_id)
 
 post_save.connect(post_save_add_contact, sender=Contact)
 
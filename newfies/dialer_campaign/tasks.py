@@ -17,24 +17,23 @@ from django.conf import settings
 from celery.task import PeriodicTask
 from celery.task import Task
 from celery.utils.log import get_task_logger
-from dialer_campaign.models import Campaign
+from dialer_campaign.models import Campaign, Subscriber
 from dialer_campaign.constants import SUBSCRIBER_STATUS, CAMPAIGN_STATUS
 from dialer_cdr.constants import CALLREQUEST_STATUS, CALLREQUEST_TYPE
 from dialer_cdr.models import Callrequest
 from dialer_cdr.tasks import init_callrequest
 from dialer_contact.tasks import collect_subscriber
 from dnc.models import DNCContact
-from survey.models import Survey_template
-from django_lets_go.only_one_task import only_one
+from survey.tasks import survey_template_copy
+from mod_utils.lease_lock import lease_lock, lease_is_current
 from datetime import datetime, timedelta
 from django.utils.timezone import utc
 from math import floor
-from common_functions import debug_query
+from mod_utils.metrics import span, tag_span
 from uuid import uuid1
 # from celery.task.http import HttpDispatchTask
 # from common_functions import isint
 
-LOCK_EXPIRE = 60 * 10 * 1  # Lock expires in 10 minutes
 if settings.HEARTBEAT_MIN < 1 or settings.HEARTBEAT_MIN > 10:
     settings.HEARTBEAT_MIN = 1
 
@@ -71,7 +70,8 @@ class campaign_spool_contact(PeriodicTask):
 # OPTIMIZATION - FINE
 class pending_call_processing(Task):
 
-    @only_one(ikey="check_pendingcall", timeout=LOCK_EXPIRE)
+    @lease_lock("pending_call_processing-{campaign_id}")
+    @span('pending_call_processing')
     def run(self, campaign_id):
         """
         This task retrieves the next outbound call to be made for a given
@@ -85,34 +85,34 @@ class pending_call_processing(Task):
         logger = self.get_logger()
         logger.info("TASK :: pending_call_processing = %d" % campaign_id)
 
-        debug_query(0)
-
         try:
             obj_campaign = Campaign.objects\
                 .select_related('user__userprofile__dialersetting', 'aleg_gateway', 'content_type')\
                 .get(id=campaign_id)
         except:
             logger.error("Can't find this campaign")
+            tag_span(outcome='no_campaign')
             return False
 
         # Ensure the content_type become "survey" when campagin starts
         if not obj_campaign.has_been_started:
             # change has_been_started flag
             obj_campaign.has_been_started = True
-            obj_campaign.save()
-
-            if obj_campaign.content_type.model == 'survey_template':
-                # Copy survey
-                survey_template = Survey_template.objects.get(user=obj_campaign.user, pk=obj_campaign.object_id)
-                survey_template.copy_survey_template(obj_campaign.id)
+            obj_campaign.save(update_fields=['has_been_started'])
             collect_subscriber.delay(obj_campaign.id)
 
+        # Wait for the survey copy to attach the survey to the campaign,
+        # the copy is queued again until it did so in case it failed or was lost
+        if obj_campaign.content_type.model == 'survey_template':
+            survey_template_copy.delay(obj_campaign.object_id, obj_campaign.id)
+            logger.info("Survey not yet copied for campaign_id=%d" % campaign_id)
+            tag_span(outcome='survey_not_copied')
+            return False
+
         # TODO : Control the Speed
         # if there is many task pending we should slow down
         frequency = obj_campaign.frequency  # default 10 calls per minutes
 
-        debug_query(1)
-
         # TODO: move this logic of setting call_type after CallRequest post_save
         # Default call_type
         call_type = CALLREQUEST_TYPE.ALLOW_RETRY
@@ -127,10 +127,9 @@ class pending_call_processing(Task):
                 call_type = CALLREQUEST_TYPE.CANNOT_RETRY
         except ObjectDoesNotExist:
             logger.error("Can't find user's dialersetting")
+            tag_span(outcome='no_dialersetting')
             return False
 
-        debug_query(2)
-
         # Speed
         # Check if the other tasks send for this campaign finished to be ran
 
@@ -142,42 +141,45 @@ class pending_call_processing(Task):
             callfrequency = int(frequency / settings.HEARTBEAT_MIN) + 1  # 1000 per minutes
             # callfrequency = int(frequency) + 1  # 1000 per minutes
 
-        (list_subscriber, no_subscriber) = obj_campaign\
-            .get_pending_subscriber_update(callfrequency, SUBSCRIBER_STATUS.IN_PROCESS)
+        # Another worker got the lease meanwhile, it claims the subscribers
+        if not lease_is_current():
+            tag_span(outcome='stale_lease')
+            return False
+
+        with span('pending_call_processing.claim'):
+            (list_subscriber, no_subscriber) = obj_campaign\
+                .get_pending_subscriber_update(callfrequency, SUBSCRIBER_STATUS.IN_PROCESS)
         logger.info("##subscriber=%d campaign_id=%d callfreq=%d freq=%d" %
                     (no_subscriber, campaign_id, callfrequency, frequency))
-        debug_query(3)
 
         if no_subscriber == 0:
+            tag_span(outcome='no_subscriber')
             return False
 
         list_cr = []
         bulk_record = []
+        # the claimed subscribers are partially loaded, they are updated by id
+        not_authorized_id_list = []
         # this is used to tag and retrieve the id that are inserted
         bulk_uuid = str(uuid1())
         for elem_camp_subscriber in list_subscriber:
             phone_number = elem_camp_subscriber.duplicate_contact
-            debug_query(4)
 
             # Verify that the contact is authorized
             if not obj_campaign.is_authorized_contact(obj_campaign.user.userprofile.dialersetting, phone_number):
                 logger.error("Error : Contact not authorized")
-                elem_camp_subscriber.status = SUBSCRIBER_STATUS.NOT_AUTHORIZED
-                elem_camp_subscriber.save()
+                not_authorized_id_list.append(elem_camp_subscriber.id)
                 continue
             # Verify that the contact is not in the DNC list
             if obj_campaign.dnc:
                 res_dnc = DNCContact.objects.filter(dnc_id=obj_campaign.dnc_id, phone_number=phone_number)
                 if res_dnc:
                     logger.error("Contact (%s) in DNC list" % phone_number)
-                    elem_camp_subscriber.status = SUBSCRIBER_STATUS.NOT_AUTHORIZED
-                    elem_camp_subscriber.save()
+                    not_authorized_id_list.append(elem_camp_subscriber.id)
                     continue
                 else:
                     logger.debug("Contact (%s) not in DNC list" % phone_number)
 
-            debug_query(5)
-
             bulk_record.append(
                 Callrequest(
                     status=CALLREQUEST_STATUS.PENDING,
@@ -194,15 +196,28 @@ class pending_call_processing(Task):
                     user=obj_campaign.user,
                     extra_data=obj_campaign.extra_data,
                     timelimit=obj_campaign.callmaxduration,
-                    subscriber=elem_camp_subscriber,
+                    subscriber_id=elem_camp_subscriber.id,
                     request_uuid=bulk_uuid
                 )
             )
-            debug_query(6)
+
+        # Another worker got the lease during the claim, the claimed
+        # subscribers are set back to pending for it to spool them
+        if not lease_is_current():
+            Subscriber.objects\
+                .filter(id__in=[elem.id for elem in list_subscriber], status=SUBSCRIBER_STATUS.IN_PROCESS)\
+                .update(status=SUBSCRIBER_STATUS.PENDING, updated_date=datetime.utcnow().replace(tzinfo=utc))
+            tag_span(outcome='stale_lease')
+            return False
+
+        if not_authorized_id_list:
+            Subscriber.objects.filter(id__in=not_authorized_id_list)\
+                .update(status=SUBSCRIBER_STATUS.NOT_AUTHORIZED, updated_date=datetime.utcnow().replace(tzinfo=utc))
 
         # Create Callrequests in Bulk
         logger.info("Bulk Create CallRequest => %d" % (len(bulk_record)))
-        Callrequest.objects.bulk_create(bulk_record)
+        with span('pending_call_processing.bulk_create'):
+            Callrequest.objects.bulk_create(bulk_record)
 
         # Set time to wait for balanced dispatching of calls
         time_to_wait = (60.0 / settings.HEARTBEAT_MIN) / no_subscriber
@@ -242,8 +257,6 @@ class pending_call_processing(Task):
             # init_callrequest.apply_async(
             #     args=[new_callrequest.id, obj_campaign.id, obj_campaign.callmaxduration, ms_addtowait],
             #     countdown=1)
-
-        debug_query(7)
         return True
 
 
@@ -270,8 +283,7 @@ class campaign_running(PeriodicTask):
 
         for campaign in Campaign.objects.get_running_campaign():
             logger.info("=> Campaign name %s (id:%s)" % (campaign.name, campaign.id))
-            keytask = 'check_campaign_pendingcall-%d' % (campaign.id)
-            pending_call_processing().delay(campaign.id, keytask=keytask)
+            pending_call_processing().delay(campaign.id)
         return True
 
 
@@ -286,7 +298,7 @@ class campaign_expire_check(PeriodicTask):
     """
     run_every = timedelta(seconds=300)
 
-    @only_one(ikey="campaign_expire_check", timeout=LOCK_EXPIRE)
+    @lease_lock("campaign_expire_check")
     def run(self, **kwargs):
         logger.info("TASK :: campaign_expire_check")
         campaign_id_list = []
@@ -295,5 +307,6 @@ class campaign_expire_check(PeriodicTask):
             campaign_id_list.append(obj_campaign.id)
 
         # Update in bulk
-        Campaign.objects.filter(id__in=campaign_id_list).update(status=CAMPAIGN_STATUS.END)
+        Campaign.objects.filter(id__in=campaign_id_list)\
+            .update(status=CAMPAIGN_STATUS.END, updated_date=datetime.utcnow().replace(tzinfo=utc))
         return True
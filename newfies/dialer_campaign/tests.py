@@ -16,7 +16,9 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.management import call_command
 from django.test import TestCase
-from dialer_campaign.models import Campaign, Subscriber, common_contact_authorization
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from dialer_campaign.models import Campaign, Subscriber, common_contact_authorization, get_campaign_stats
 from dialer_campaign.forms import CampaignForm
 from dialer_campaign.views import campaign_list, campaign_add,\
     campaign_change, campaign_del, notify_admin,\
@@ -24,10 +26,14 @@ from dialer_campaign.views import campaign_list, campaign_add,\
     subscriber_export
 from dialer_campaign.tasks import campaign_running, pending_call_processing,\
     collect_subscriber, campaign_expire_check
+from dialer_campaign import tasks as dialer_campaign_tasks
 from dialer_campaign.templatetags.dialer_campaign_tags import get_campaign_status_url
 from dialer_settings.models import DialerSetting
 from dialer_campaign.constants import SUBSCRIBER_STATUS
+from dialer_contact.models import Contact
+from dialer_cdr.models import Callrequest
 from django_lets_go.utils import BaseAuthenticatedClient
+from mod_utils.pagination import paginate_list
 
 
 class DialerCampaignView(BaseAuthenticatedClient):
@@ -106,6 +112,26 @@ class DialerCampaignCustomerView(BaseAuthenticatedClient):
         response = campaign_list(request)
         self.assertEqual(response.status_code, 200)
 
+    def test_campaign_view_list_queries(self):
+        """Test that the queries of the campaign list don't grow with the campaigns"""
+        def count_queries():
+            request = self.factory.get('/campaign/')
+            request.user = self.user
+            request.session = {}
+            with CaptureQueriesContext(connection) as context:
+                response = campaign_list(request)
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        no_queries = count_queries()
+        campaign = Campaign.objects.get(pk=1)
+        for i in range(3):
+            new_campaign = Campaign.objects.create(
+                name='campaign-%d' % i, user=self.user, aleg_gateway_id=1,
+                content_type_id=campaign.content_type_id, object_id=campaign.object_id)
+            new_campaign.phonebook.add(1)
+        self.assertEqual(count_queries(), no_queries)
+
     def test_campaign_view_add(self):
         """Test Function to check add campaign"""
         request = self.factory.get('/campaign/add/')
@@ -257,6 +283,32 @@ class DialerCampaignCustomerView(BaseAuthenticatedClient):
         response = subscriber_list(request)
         self.assertEqual(response.status_code, 200)
 
+    def test_subscriber_list_keyset(self):
+        """Test the keyset pages of the subscriber list"""
+        campaign = Campaign.objects.get(pk=1)
+        for contact in Contact.objects.filter(phonebook__campaign=campaign)[:5]:
+            Subscriber.objects.get_or_create(contact=contact, campaign=campaign,
+                                             defaults={'duplicate_contact': contact.contact})
+        subscriber_id_list = list(Subscriber.objects.order_by('-id').values_list('id', flat=True))
+        pag_vars = {'sort_order': '-id', 'start_page': 0, 'end_page': 2}
+
+        request = self.factory.get('/subscribers/')
+        list_page = paginate_list(request, Subscriber.objects.all(), pag_vars, keyset_fields=('id',))
+        self.assertTrue(list_page.keyset)
+        self.assertEqual([obj.id for obj in list_page], subscriber_id_list[:2])
+        self.assertFalse(list_page.has_previous)
+        self.assertEqual(list_page.count, len(subscriber_id_list))
+
+        if len(subscriber_id_list) > 2:
+            request = self.factory.get('/subscribers/?' + list_page.next_query)
+            next_page = paginate_list(request, Subscriber.objects.all(), pag_vars, keyset_fields=('id',))
+            self.assertEqual(next_page.number, 2)
+            self.assertEqual([obj.id for obj in next_page], subscriber_id_list[2:4])
+
+            request = self.factory.get('/subscribers/?' + next_page.previous_query)
+            previous_page = paginate_list(request, Subscriber.objects.all(), pag_vars, keyset_fields=('id',))
+            self.assertEqual([obj.id for obj in previous_page], subscriber_id_list[:2])
+
     def test_subscriber_list_export(self):
         """Test Function to check subscriber list"""
         response = self.client.get('/subscribers/export_subscriber/?format=csv')
@@ -286,6 +338,20 @@ class DialerCampaignCeleryTaskTestCase(TestCase):
         result = pending_call_processing.delay(1)
         self.assertEqual(result.successful(), True)
 
+    def test_pending_call_processing_stale_lease(self):
+        """Test the subscribers claimed under a stale lease are pending again"""
+        lease_is_current = dialer_campaign_tasks.lease_is_current
+        check_list = [True, False]
+        dialer_campaign_tasks.lease_is_current = lambda: check_list.pop(0)
+        Subscriber.objects.filter(campaign_id=1).update(status=SUBSCRIBER_STATUS.PENDING)
+        try:
+            self.assertEqual(pending_call_processing().run(1), False)
+        finally:
+            dialer_campaign_tasks.lease_is_current = lease_is_current
+        self.assertEqual(check_list, [])
+        self.assertFalse(Subscriber.objects.filter(campaign_id=1, status=SUBSCRIBER_STATUS.IN_PROCESS).exists())
+        self.assertFalse(Callrequest.objects.filter(campaign_id=1).exists())
+
     def test_campaign_running(self):
         """Test that the ``campaign_running``
         periodic task runs with no errors, and returns the correct result."""
@@ -419,6 +485,25 @@ class DialerCampaignModel(TestCase):
             "extra_data": "2000"})
         self.assertEquals(form.is_valid(), False)
 
+    def test_get_campaign_stats(self):
+        """Test the counts of the campaigns"""
+        with self.assertNumQueries(2):
+            campaign_stats = get_campaign_stats([1, self.campaign.id])
+        self.assertEqual(campaign_stats[1]['contact'], 1)
+        self.assertEqual(campaign_stats[1]['subscriber'], 1)
+        self.assertEqual(campaign_stats[self.campaign.id]['contact'], 0)
+        self.assertEqual(campaign_stats[self.campaign.id]['status'], {SUBSCRIBER_STATUS.PENDING: 1})
+        self.assertEqual(self.campaign.stats['completion'], 0)
+
+    def test_get_pending_subscriber_update(self):
+        """Claim the pending subscribers once"""
+        (list_subscriber, count) = self.campaign.get_pending_subscriber_update(10, SUBSCRIBER_STATUS.IN_PROCESS)
+        self.assertEqual(count, 1)
+        self.assertEqual(list_subscriber[0].id, self.subscriber.id)
+        self.assertEqual(list_subscriber[0].campaign_id, self.campaign.id)
+        self.assertEqual(Subscriber.objects.get(pk=self.subscriber.id).status, SUBSCRIBER_STATUS.IN_PROCESS)
+        self.assertEqual(self.campaign.get_pending_subscriber_update(10, SUBSCRIBER_STATUS.IN_PROCESS), (False, 0))
+
     def teardown(self):
         self.campaign.delete()
         self.subscriber.delete()
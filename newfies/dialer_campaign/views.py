@@ -30,7 +30,7 @@ import tablib
 from frontend_notification.views import frontend_send_notification
 from django_lets_go.common_functions import ceil_strdate, getvar, get_pagination_vars, unset_session_var
 
-from .models import Campaign, Subscriber
+from .models import Campaign, Subscriber, attach_campaign_stats
 from .forms import CampaignForm, DuplicateCampaignForm, \
     SubscriberSearchForm, CampaignSearchForm
 from .constants import CAMPAIGN_STATUS, CAMPAIGN_COLUMN_NAME, \
@@ -40,8 +40,10 @@ from .function_def import check_dialer_setting, dialer_setting_limit, \
 from .tasks import collect_subscriber
 from dialer_contact.models import Phonebook
 from survey.models import Survey_template
+from survey.tasks import survey_template_copy
 from user_profile.constants import NOTIFICATION_NAME
 from mod_utils.helper import Export_choice
+from mod_utils.pagination import paginate_list
 
 redirect_url_to_campaign_list = '/campaign/'
 
@@ -82,12 +84,12 @@ def update_campaign_status_cust(request, pk, status):
     if int(status) == CAMPAIGN_STATUS.START and not obj_campaign.has_been_started:
         # change has_been_started flag
         obj_campaign.has_been_started = True
-        obj_campaign.save()
+        obj_campaign.save(update_fields=['has_been_started'])
 
         if obj_campaign.content_type.model == 'survey_template':
-            # Copy survey
+            # Copy survey in its own job
             survey_template = Survey_template.objects.get(user=request.user, pk=obj_campaign.object_id)
-            survey_template.copy_survey_template(obj_campaign.id)
+            survey_template_copy.delay(survey_template.id, obj_campaign.id)
         collect_subscriber.delay(obj_campaign.id)
 
     # Notify user while campaign Start
@@ -170,8 +172,11 @@ def campaign_list(request):
     if status and status != 'all':
         kwargs['status'] = status
 
-    all_campaign_list = Campaign.objects.filter(**kwargs).order_by(pag_vars['sort_order'])
-    campaign_list = all_campaign_list[pag_vars['start_page']:pag_vars['end_page']]
+    all_campaign_list = Campaign.objects.filter(**kwargs).select_related('content_type')\
+        .order_by(pag_vars['sort_order'])
+    # The related objects & the counts of the page are fetched for all the rows at once
+    campaign_list = attach_campaign_stats(all_campaign_list[pag_vars['start_page']:pag_vars['end_page']]
+                                          .prefetch_related('phonebook', 'content_object'))
     campaign_count = all_campaign_list.count()
 
     data = {
@@ -539,10 +544,6 @@ def subscriber_list(request):
     if status and status != 'all':
         kwargs['status'] = status
 
-    subscriber_list = []
-    all_subscriber_list = []
-    subscriber_count = 0
-
     if request.user.is_superuser:
         subscriber_list = Subscriber.objects.all()
     else:
@@ -552,14 +553,14 @@ def subscriber_list(request):
         subscriber_list = subscriber_list.filter(**kwargs)
         request.session['subscriber_list_kwargs'] = kwargs
 
-    all_subscriber_list = subscriber_list.order_by(pag_vars['sort_order'])
-    subscriber_list = all_subscriber_list[pag_vars['start_page']:pag_vars['end_page']]
-    subscriber_count = all_subscriber_list.count()
+    # Keyset pages on the indexed columns, estimated count on large lists
+    list_page = paginate_list(request, subscriber_list.select_related('contact'), pag_vars,
+                              keyset_fields=('id', 'updated_date'))
 
     data = {
-        'subscriber_list': subscriber_list,
-        'all_subscriber_list': all_subscriber_list,
-        'total_subscribers': subscriber_count,
+        'subscriber_list': list_page.object_list,
+        'list_page': list_page,
+        'total_subscribers': list_page.count,
         'SUBSCRIBER_COLUMN_NAME': SUBSCRIBER_COLUMN_NAME,
         'col_name_with_order': pag_vars['col_name_with_order'],
         'msg': request.session.get('msg'),
@@ -29,6 +29,7 @@ from dialer_cdr.forms import AdminVoipSearchForm
 from dialer_cdr.function_def import voipcall_record_common_fun, voipcall_search_admin_form_fun
 from django_lets_go.common_functions import getvar
 from mod_utils.helper import Export_choice
+from mod_utils.pagination import estimated_count_queryset
 from genericadmin.admin import GenericAdminModelAdmin
 from datetime import datetime
 from django.utils.timezone import utc
@@ -92,6 +93,10 @@ class VoIPCallAdmin(admin.ModelAdmin):
             return True
         return super(VoIPCallAdmin, self).lookup_allowed(lookup, *args, **kwargs)
 
+    def get_queryset(self, request):
+        # The changelist counts the calls with the planner estimate on large tables
+        return estimated_count_queryset(super(VoIPCallAdmin, self).get_queryset(request))
+
     def user_link(self, obj):
         """User link to user profile"""
         if obj.user.is_staff:
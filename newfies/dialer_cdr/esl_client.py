@@ -0,0 +1,172 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Pure python client of the FreeSWITCH inbound event socket, it implements
+the subset of the ESL module API used by the dialer so that the originate
+path works when the ESL module is not installed
+"""
+
+import socket
+try:
+    from urllib import unquote
+except ImportError:
+    from urllib.parse import unquote
+
+
+class ESLevent(object):
+
+    """Event or reply received on the event socket"""
+
+    def __init__(self, headers=None, body=None):
+        self.headers = headers or []
+        self.body = body
+
+    def getHeader(self, header_name):
+        for (name, value) in self.headers:
+            if name == header_name:
+                return value
+        return None
+
+    def getBody(self):
+        return self.body
+
+    def getType(self):
+        return self.getHeader('Event-Name') or self.getHeader('Content-Type')
+
+    def serialize(self, format=None):
+        result = ''.join(['%s: %s\n' % (name, value) for (name, value) in self.headers])
+        if self.body:
+            result += '\n' + self.body
+        return result
+
+
+def parse_headers(data, urldecode=False):
+    """
+    Parse the header lines of an event socket message
+
+    >>> parse_headers('Event-Name: BACKGROUND_JOB\\nJob-UUID: 1234\\n')
+    [('Event-Name', 'BACKGROUND_JOB'), ('Job-UUID', '1234')]
+    """
+    headers = []
+    for line in data.splitlines():
+        if ': ' in line:
+            (name, value) = line.split(': ', 1)
+            if urldecode:
+                value = unquote(value)
+            headers.append((name, value))
+    return headers
+
+
+class ESLconnection(object):
+
+    """Inbound connection to the event socket"""
+
+    def __init__(self, host, port, password, timeout=10):
+        self.sock = None
+        self.buffer = b''
+        try:
+            self.sock = socket.create_connection((host, int(port)), timeout)
+            reply = self.recv_message()
+            if reply.getHeader('Content-Type') != 'auth/request':
+                raise socket.error('Unexpected greeting')
+            reply = self.send_recv('auth %s' % password)
+            if not (reply.getHeader('Reply-Text') or '').startswith('+OK'):
+                raise socket.error('Authentication failed')
+        except (socket.error, socket.timeout, ValueError):
+            self.disconnect()
+
+    def connected(self):
+        return 1 if self.sock else 0
+
+    def disconnect(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+        return 1
+
+    def read_until(self, separator):
+        while separator not in self.buffer:
+            data = self.sock.recv(65536)
+            if not data:
+                raise socket.error('Connection closed')
+            self.buffer += data
+        (data, self.buffer) = self.buffer.split(separator, 1)
+        return data
+
+    def read_length(self, length):
+        while len(self.buffer) < length:
+            data = self.sock.recv(65536)
+            if not data:
+                raise socket.error('Connection closed')
+            self.buffer += data
+        (data, self.buffer) = (self.buffer[:length], self.buffer[length:])
+        return data
+
+    def recv_message(self):
+        """Read a message: header lines, an empty line & the optional body"""
+        headers = parse_headers(self.read_until(b'\n\n').decode('utf-8'))
+        event = ESLevent(headers)
+        length = event.getHeader('Content-Length')
+        if length:
+            event.body = self.read_length(int(length)).decode('utf-8')
+        if event.getHeader('Content-Type') == 'text/event-plain' and event.body:
+            # the body holds the event itself, url encoded
+            (event_headers, sep, event_body) = event.body.partition('\n\n')
+            event = ESLevent(parse_headers(event_headers, urldecode=True), event_body or None)
+        return event
+
+    def send_recv(self, command):
+        """Send a command & return its reply, events received meanwhile are ignored"""
+        if not self.sock:
+            return None
+        try:
+            self.sock.sendall(('%s\n\n' % command).encode('utf-8'))
+            while True:
+                reply = self.recv_message()
+                if reply.getHeader('Content-Type') in ('command/reply', 'api/response', 'auth/request'):
+                    return reply
+        except (socket.error, socket.timeout, ValueError):
+            self.disconnect()
+            return None
+
+    def api(self, command, arg=None):
+        if arg:
+            command = '%s %s' % (command, arg)
+        return self.send_recv('api %s' % command)
+
+    def bgapi(self, command, arg=None):
+        if arg:
+            command = '%s %s' % (command, arg)
+        return self.send_recv('bgapi %s' % command)
+
+    def events(self, event_type, value):
+        return self.send_recv('event %s %s' % (event_type, value))
+
+    def recvEventTimed(self, milliseconds):
+        if not self.sock:
+            return None
+        self.sock.settimeout(milliseconds / 1000.0)
+        try:
+            return self.recv_message()
+        except socket.timeout:
+            return None
+        except (socket.error, ValueError):
+            self.disconnect()
+            return None
+
+    def recvEvent(self):
+        return self.recvEventTimed(3600 * 1000)
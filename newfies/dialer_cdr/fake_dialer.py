@@ -0,0 +1,155 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.timezone import utc
+from datetime import datetime
+from random import random, randint
+from uuid import uuid1
+
+# Outcome distribution of the fake dialer in percent, set by the load harness
+# so the celery workers share it
+FAKE_DIALER_PROFILE_KEY = 'fake_dialer_profile'
+FAKE_DIALER_PROFILE = getattr(settings, 'FAKE_DIALER_PROFILE', {
+    'answer': 60,
+    'busy': 15,
+    'noanswer': 20,
+    'machine': 5,
+})
+
+# Outcome => (hangup_cause, hangup_cause_q850, amd_status)
+FAKE_DIALER_OUTCOME = {
+    'answer': ('NORMAL_CLEARING', '16', 'person'),
+    'busy': ('USER_BUSY', '17', 'person'),
+    'noanswer': ('NO_ANSWER', '19', 'person'),
+    'machine': ('NORMAL_CLEARING', '16', 'machine'),
+}
+
+# Same table as the one created by listener.lua
+CALL_EVENT_TABLE_SQL = {
+    'postgresql': "CREATE TABLE if not exists call_event ("
+                  "id serial NOT NULL PRIMARY KEY, "
+                  "event_name varchar(200) NOT NULL, body varchar(200) NOT NULL, "
+                  "job_uuid varchar(200), call_uuid varchar(200) NOT NULL, "
+                  "used_gateway_id integer, callrequest_id integer, alarm_request_id integer, "
+                  "callerid varchar(200), phonenumber varchar(200), "
+                  "duration integer DEFAULT 0, billsec integer DEFAULT 0, "
+                  "hangup_cause varchar(40), hangup_cause_q850 varchar(10), amd_status varchar(40), "
+                  "leg varchar(10) DEFAULT 'aleg', starting_date timestamp with time zone, "
+                  "status smallint, created_date timestamp with time zone NOT NULL)",
+    'sqlite': "CREATE TABLE if not exists call_event ("
+              "id integer NOT NULL PRIMARY KEY AUTOINCREMENT, "
+              "event_name varchar(200) NOT NULL, body varchar(200) NOT NULL, "
+              "job_uuid varchar(200), call_uuid varchar(200) NOT NULL, "
+              "used_gateway_id integer, callrequest_id integer, alarm_request_id integer, "
+              "callerid varchar(200), phonenumber varchar(200), "
+              "duration integer DEFAULT 0, billsec integer DEFAULT 0, "
+              "hangup_cause varchar(40), hangup_cause_q850 varchar(10), amd_status varchar(40), "
+              "leg varchar(10) DEFAULT 'aleg', starting_date datetime, "
+              "status smallint, created_date datetime NOT NULL)",
+}
+
+
+def create_call_event_table():
+    """Create the call_event table when listener.lua is not running"""
+    cursor = connection.cursor()
+    cursor.execute(CALL_EVENT_TABLE_SQL.get(connection.vendor, CALL_EVENT_TABLE_SQL['postgresql']))
+
+
+def set_fake_dialer_profile(profile):
+    """Share the outcome distribution with the workers running the fake dialer"""
+    cache.set(FAKE_DIALER_PROFILE_KEY, profile, None)
+
+
+def get_fake_dialer_profile():
+    """Return the outcome distribution set by the load harness or the default one"""
+    return cache.get(FAKE_DIALER_PROFILE_KEY) or FAKE_DIALER_PROFILE
+
+
+def pick_outcome(profile, rand=None):
+    """
+    Pick an outcome of the profile according to its weight
+
+    >>> pick_outcome({'answer': 50, 'busy': 50}, rand=0.2)
+    'answer'
+    >>> pick_outcome({'answer': 50, 'busy': 50}, rand=0.7)
+    'busy'
+    """
+    if rand is None:
+        rand = random()
+    total = sum(profile.values())
+    if total <= 0:
+        return 'answer'
+    threshold = rand * total
+    weight_sum = 0
+    outcome = 'answer'
+    for outcome in sorted(profile):
+        weight_sum += profile[outcome]
+        if threshold < weight_sum:
+            break
+    return outcome
+
+
+def synthesize_call(profile=None, timeout=45):
+    """
+    Draw the outcome of a call from the profile, return its
+    (hangup_cause, hangup_cause_q850, amd_status, duration, billsec)
+    """
+    outcome = pick_outcome(profile or get_fake_dialer_profile())
+    (hangup_cause, hangup_cause_q850, amd_status) = FAKE_DIALER_OUTCOME[outcome]
+    if outcome == 'answer':
+        billsec = randint(5, 120)
+        duration = billsec + randint(2, 15)
+    elif outcome == 'machine':
+        billsec = randint(5, 30)
+        duration = billsec + randint(2, 15)
+    elif outcome == 'busy':
+        billsec = 0
+        duration = randint(1, 5)
+    else:
+        billsec = 0
+        duration = timeout
+    return (hangup_cause, hangup_cause_q850, amd_status, duration, billsec)
+
+
+def write_call_event(job_uuid, call_uuid, used_gateway_id, callrequest_id, phonenumber, callerid='',
+                     duration=0, billsec=0, hangup_cause='', hangup_cause_q850='', amd_status='person',
+                     event_name='CHANNEL_HANGUP_COMPLETE', body='', alarm_request_id=0, leg='aleg'):
+    """Insert a pending call_event row as listener.lua does"""
+    now = datetime.utcnow().replace(tzinfo=utc)
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO call_event (event_name, body, job_uuid, call_uuid, used_gateway_id, callrequest_id, "
+        "alarm_request_id, status, duration, billsec, callerid, phonenumber, hangup_cause, hangup_cause_q850, "
+        "amd_status, starting_date, created_date, leg) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        [event_name, body, job_uuid, call_uuid, used_gateway_id, callrequest_id,
+         alarm_request_id, 1, duration, billsec, callerid or '', phonenumber, hangup_cause, hangup_cause_q850,
+         amd_status, now, now, leg])
+
+
+def fake_dial_out(callrequest_id, used_gateway_id, phonenumber, callerid='', timeout=45):
+    """
+    Fake dialer used by NEWFIES_DIALER_ENGINE = 'fake', instead of sending the
+    originate to FreeSWITCH it writes the call_event row listener.lua would
+    write once the call is over, picking the outcome from the fake dialer
+    profile. Return the request_uuid like dial_out
+    """
+    request_uuid = str(uuid1())
+    (hangup_cause, hangup_cause_q850, amd_status, duration, billsec) = synthesize_call(timeout=timeout)
+    write_call_event(request_uuid, str(uuid1()), used_gateway_id, callrequest_id, phonenumber, callerid,
+                     duration, billsec, hangup_cause, hangup_cause_q850, amd_status)
+    return request_uuid
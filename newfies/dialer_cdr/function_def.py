@@ -15,6 +15,7 @@
 from django.conf import settings
 from django_lets_go.common_functions import getvar, ceil_strdate
 from country_dialcode.models import Prefix
+from dialer_cdr.prefix_trie import get_prefix_trie
 from datetime import datetime
 from django.utils.timezone import utc
 
@@ -158,14 +159,7 @@ def prefix_list_string(phone_number):
 
 def get_prefix_obj(phonenumber):
     """Get Prefix object"""
-    prefix_obj = None
-    list_prefix = prefix_list_string(phonenumber)
-    if list_prefix:
-        split_prefix_list = list_prefix.split(',')
-        for prefix in split_prefix_list:
-            try:
-                prefix_obj = Prefix.objects.get(prefix=int(prefix))
-                break
-            except:
-                prefix_obj = None
-    return prefix_obj
+    prefix = get_prefix_trie().lookup(phonenumber)
+    if prefix is None:
+        return None
+    return Prefix.objects.get(prefix=prefix)
@@ -0,0 +1,68 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from dialer_cdr.models import VoIPCall
+from dialer_cdr.prefix_trie import get_prefix_trie
+
+
+class Command(BaseCommand):
+    args = 'chunk_size'
+    help = "Resolve the dialcode of the CDRs without dialcode per chunk of CDRs\n" \
+           "-------------------------------------------------------------------\n" \
+           "python manage.py backfill_dialcode --chunk_size=10000"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk_size', default=None, dest='chunk_size', help=help),
+    )
+
+    def handle(self, *args, **options):
+        """
+        We will parse and set default values to parameters
+        """
+        chunk_size = 10000  # default
+        if options.get('chunk_size'):
+            try:
+                chunk_size = int(options.get('chunk_size'))
+            except ValueError:
+                chunk_size = 10000
+
+        count = backfill_dialcode(chunk_size)
+        print("Dialcode resolved for %d CDRs" % count)
+
+
+def backfill_dialcode(chunk_size=10000):
+    """
+    Resolve the dialcode of the CDRs per chunk of ids, one UPDATE is run per
+    distinct dialcode of the chunk
+    """
+    prefix_trie = get_prefix_trie()
+    voipcall_list = VoIPCall.objects.filter(dialcode__isnull=True).order_by('id')
+    count = 0
+    last_id = 0
+    while True:
+        chunk = list(voipcall_list.filter(id__gt=last_id).values_list('id', 'phone_number')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        dialcode_dict = {}
+        for (voipcall_id, phone_number) in chunk:
+            dialcode_id = prefix_trie.lookup(phone_number)
+            if dialcode_id is not None:
+                dialcode_dict.setdefault(dialcode_id, []).append(voipcall_id)
+        for dialcode_id, voipcall_id_list in dialcode_dict.items():
+            count += VoIPCall.objects.filter(id__in=voipcall_id_list).update(dialcode=dialcode_id)
+    return count
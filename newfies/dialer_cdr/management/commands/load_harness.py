@@ -0,0 +1,356 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.db import connection
+from django.db.backends import utils as backend_utils
+from django.utils.timezone import utc
+from optparse import make_option
+from celery import current_app
+from celery.signals import task_prerun
+from dialer_campaign.models import Campaign, Subscriber
+from dialer_campaign.constants import CAMPAIGN_STATUS, SUBSCRIBER_STATUS
+from dialer_campaign.tasks import pending_call_processing
+from dialer_contact.models import Phonebook, Contact
+from dialer_cdr.models import Callrequest, VoIPCall
+from dialer_cdr.constants import VOIPCALL_AMD_STATUS
+from dialer_cdr.tasks import callevent_processing, dispatch_due_retry
+from dialer_cdr.fake_dialer import create_call_event_table, set_fake_dialer_profile
+from dialer_gateway.models import Gateway
+from survey.models import Survey
+from datetime import datetime, timedelta
+from random import choice
+from math import ceil
+from time import time, sleep
+from uuid import uuid1
+
+PHONENUMBER_LENGTH = 10
+STAGE_LIST = ['spool', 'dial', 'callevent', 'total']
+
+
+def percentile(value_list, pct):
+    """
+    Nearest-rank percentile of a sorted list
+
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 90)
+    9
+    """
+    if not value_list:
+        return 0
+    rank = int(ceil(pct / 100.0 * len(value_list))) - 1
+    return value_list[min(max(rank, 0), len(value_list) - 1)]
+
+
+class QueryCounter(object):
+
+    """Count the SQL queries run by this process, the queries of the
+    tasks are only seen when celery runs them eagerly"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        counter = self
+        self.execute = backend_utils.CursorWrapper.execute
+        self.executemany = backend_utils.CursorWrapper.executemany
+        execute = self.execute
+        executemany = self.executemany
+
+        def counted_execute(cursor, sql, params=None):
+            counter.count += 1
+            return execute(cursor, sql, params)
+
+        def counted_executemany(cursor, sql, param_list):
+            counter.count += 1
+            return executemany(cursor, sql, param_list)
+
+        backend_utils.CursorWrapper.execute = counted_execute
+        backend_utils.CursorWrapper.executemany = counted_executemany
+        return self
+
+    def __exit__(self, *args):
+        backend_utils.CursorWrapper.execute = self.execute
+        backend_utils.CursorWrapper.executemany = self.executemany
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Run the dialer pipeline end to end against the fake dialer and report its throughput\n"\
+           "campaign_running > pending_call_processing > init_callrequest > call_event > process_callevent\n"\
+           "------------------------------------------------------------------------------------------\n"\
+           "python manage.py load_harness --campaigns=2 --subscribers=1000 --answer=60 --busy=15 --noanswer=20 --machine=5\n"\
+           "python manage.py load_harness --mode=worker  (workers & celerybeat run with NEWFIES_DIALER_ENGINE = 'fake')"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--campaigns', default=1, dest='campaigns',
+                    help='Number of campaigns to create'),
+        make_option('--subscribers', default=100, dest='subscribers',
+                    help='Number of subscribers per campaign'),
+        make_option('--user_id', default=1, dest='user_id',
+                    help='User ID owning the campaigns, needs a dialer setting'),
+        make_option('--mode', default='eager', dest='mode',
+                    help='eager: run the tasks in this process, worker: let celery run them'),
+        make_option('--frequency', default=1000, dest='frequency',
+                    help='Calls per minute of each campaign'),
+        make_option('--answer', default=60, dest='answer', help='Percent of answered calls'),
+        make_option('--busy', default=15, dest='busy', help='Percent of busy calls'),
+        make_option('--noanswer', default=20, dest='noanswer', help='Percent of unanswered calls'),
+        make_option('--machine', default=5, dest='machine', help='Percent of calls reaching a machine (AMD)'),
+        make_option('--timeout', default=600, dest='timeout',
+                    help='Seconds to wait for the calls to complete'),
+        make_option('--keep', action='store_true', default=False, dest='keep',
+                    help='Keep the campaigns, subscribers & CDRs created'),
+    )
+
+    def handle(self, *args, **options):
+        """
+        Create the campaigns, run them and print the report
+        """
+        try:
+            no_campaign = int(options.get('campaigns'))
+            no_subscriber = int(options.get('subscribers'))
+            user_id = int(options.get('user_id'))
+            frequency = int(options.get('frequency'))
+            timeout = int(options.get('timeout'))
+            profile = dict((outcome, int(options.get(outcome)))
+                           for outcome in ('answer', 'busy', 'noanswer', 'machine'))
+        except ValueError:
+            print("Options campaigns, subscribers, user_id, frequency, timeout & outcomes need integer values")
+            return False
+        mode = options.get('mode')
+        if mode not in ('eager', 'worker'):
+            print("Mode must be eager or worker")
+            return False
+
+        if mode == 'eager':
+            # the tasks run in this process so it can dial with the fake dialer
+            settings.NEWFIES_DIALER_ENGINE = 'fake'
+            current_app.conf.CELERY_ALWAYS_EAGER = True
+            current_app.conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+        elif settings.NEWFIES_DIALER_ENGINE.lower() != 'fake':
+            print("Worker mode needs NEWFIES_DIALER_ENGINE = 'fake' in the settings of the celery workers")
+            return False
+
+        try:
+            user = User.objects.get(pk=user_id)
+            user.userprofile.dialersetting
+        except Exception:
+            print("User %d needs a user profile with a dialer setting" % user_id)
+            return False
+
+        create_call_event_table()
+        set_fake_dialer_profile(profile)
+        campaign_id_list = create_harness_campaign(user, no_campaign, no_subscriber, frequency)
+        print("Created %d campaigns of %d subscribers" % (no_campaign, no_subscriber))
+
+        start = time()
+        try:
+            if mode == 'eager':
+                (complete, task_count, query_count) = run_eager(campaign_id_list, no_subscriber, timeout)
+            else:
+                (complete, task_count, query_count) = run_worker(campaign_id_list, no_subscriber, timeout)
+            elapsed = time() - start
+            if not complete:
+                print("Timeout reached (%d seconds) before the calls completed" % timeout)
+            print_report(campaign_id_list, elapsed, task_count, query_count)
+        finally:
+            if not options.get('keep'):
+                delete_harness_campaign(campaign_id_list)
+
+
+def create_harness_campaign(user, no_campaign, no_subscriber, frequency):
+    """
+    Create the campaigns with a phonebook each, the contacts are inserted in
+    bulk so collect_subscriber imports them as in production
+    """
+    try:
+        survey = Survey.objects.filter(user=user)[0]
+    except IndexError:
+        survey = Survey.objects.create(name='load-harness', user=user)
+    gateway = Gateway.objects.all()[0]
+    content_type = ContentType.objects.get_for_model(Survey)
+    run_tag = str(uuid1())[:8]
+    now = datetime.utcnow().replace(tzinfo=utc)
+
+    campaign_id_list = []
+    for count in range(no_campaign):
+        phonebook = Phonebook.objects.create(name='load-harness-%s-%d' % (run_tag, count), user=user)
+        Contact.objects.bulk_create([
+            Contact(phonebook=phonebook, contact=''.join([choice('1234567890') for i in range(PHONENUMBER_LENGTH)]))
+            for i in range(no_subscriber)
+        ], batch_size=1000)
+        campaign = Campaign.objects.create(
+            name='load-harness-%s-%d' % (run_tag, count),
+            user=user,
+            status=CAMPAIGN_STATUS.START,
+            startingdate=now - timedelta(minutes=1),
+            expirationdate=now + timedelta(days=1),
+            frequency=frequency,
+            maxretry=0,
+            aleg_gateway=gateway,
+            content_type=content_type,
+            object_id=survey.id)
+        campaign.phonebook.add(phonebook)
+        campaign_id_list.append(campaign.id)
+    return campaign_id_list
+
+
+def delete_harness_campaign(campaign_id_list):
+    """Remove the campaigns, their phonebooks and their call events"""
+    callrequest_id_list = list(Callrequest.objects.filter(campaign_id__in=campaign_id_list)
+                               .values_list('id', flat=True))
+    cursor = connection.cursor()
+    for i in range(0, len(callrequest_id_list), 1000):
+        cursor.execute("DELETE FROM call_event WHERE callrequest_id IN (%s)" %
+                       ','.join([str(callrequest_id) for callrequest_id in callrequest_id_list[i:i + 1000]]))
+    phonebook_id_list = list(Phonebook.objects.filter(campaign__id__in=campaign_id_list)
+                             .values_list('id', flat=True))
+    Campaign.objects.filter(id__in=campaign_id_list).delete()
+    Phonebook.objects.filter(id__in=phonebook_id_list).delete()
+
+
+def is_complete(campaign_id_list, no_subscriber):
+    """All the subscribers are imported and their calls are over"""
+    subscriber_list = Subscriber.objects.filter(campaign_id__in=campaign_id_list)
+    if subscriber_list.count() < len(campaign_id_list) * no_subscriber:
+        return False
+    if subscriber_list.filter(status__in=[SUBSCRIBER_STATUS.PENDING, SUBSCRIBER_STATUS.IN_PROCESS]).exists():
+        return False
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM call_event WHERE status=1")
+    return cursor.fetchone()[0] == 0
+
+
+def run_eager(campaign_id_list, no_subscriber, timeout):
+    """
+    Spool the campaigns as campaign_running does, the tasks run eagerly in
+    this process, then process the call events as task_pending_callevent &
+    the due retries as callrequest_pending do
+    """
+    task_count = {}
+
+    def count_task(sender=None, **kwargs):
+        task_count[sender.name] = task_count.get(sender.name, 0) + 1
+
+    task_prerun.connect(count_task, weak=False)
+    start = time()
+    complete = False
+    try:
+        with QueryCounter() as query_counter:
+            while time() - start < timeout:
+                for campaign_id in campaign_id_list:
+                    pending_call_processing().delay(campaign_id)
+                callevent_processing()
+                dispatch_due_retry()
+                if is_complete(campaign_id_list, no_subscriber):
+                    complete = True
+                    break
+    finally:
+        task_prerun.disconnect(count_task)
+    return (complete, task_count, query_counter.count)
+
+
+def get_worker_task_count():
+    """Sum the tasks run by the celery workers, by task name"""
+    task_count = {}
+    stats = current_app.control.inspect(timeout=2).stats() or {}
+    for worker_stats in stats.values():
+        for name, count in worker_stats.get('total', {}).items():
+            task_count[name] = task_count.get(name, 0) + count
+    return task_count
+
+
+def run_worker(campaign_id_list, no_subscriber, timeout):
+    """
+    Let celerybeat & the celery workers run the campaigns and wait for the
+    calls to complete, the queries run by the workers can't be counted
+    """
+    task_count_before = get_worker_task_count()
+    if not task_count_before:
+        print("No celery worker replied, the task counts won't be reported")
+    start = time()
+    complete = False
+    while time() - start < timeout:
+        if is_complete(campaign_id_list, no_subscriber):
+            complete = True
+            break
+        sleep(1)
+    task_count = dict((name, count - task_count_before.get(name, 0))
+                      for name, count in get_worker_task_count().items())
+    return (complete, task_count, None)
+
+
+def get_stage_latency(campaign_id_list):
+    """
+    Latency in seconds of each stage of the calls, from the timestamps
+    left in the database:
+
+        * ``spool`` - subscriber imported > callrequest created (pending_call_processing)
+        * ``dial`` - callrequest created > call_event written (init_callrequest & dialer)
+        * ``callevent`` - call_event written > CDR created (process_callevent)
+        * ``total`` - subscriber imported > CDR created
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT sb.created_date, cr.created_date, ce.created_date, vc.starting_date "
+        "FROM %s cr "
+        "INNER JOIN %s sb ON sb.id = cr.subscriber_id "
+        "INNER JOIN call_event ce ON ce.callrequest_id = cr.id "
+        "INNER JOIN %s vc ON vc.callrequest_id = cr.id "
+        "WHERE cr.campaign_id IN (%s)" %
+        (Callrequest._meta.db_table, Subscriber._meta.db_table, VoIPCall._meta.db_table,
+         ','.join([str(campaign_id) for campaign_id in campaign_id_list])))
+
+    latency = dict((stage, []) for stage in STAGE_LIST)
+    for (subscriber_date, callrequest_date, callevent_date, voipcall_date) in cursor.fetchall():
+        latency['spool'].append((callrequest_date - subscriber_date).total_seconds())
+        latency['dial'].append((callevent_date - callrequest_date).total_seconds())
+        latency['callevent'].append((voipcall_date - callevent_date).total_seconds())
+        latency['total'].append((voipcall_date - subscriber_date).total_seconds())
+    for stage in STAGE_LIST:
+        latency[stage].sort()
+    return latency
+
+
+def print_report(campaign_id_list, elapsed, task_count, query_count):
+    voipcall_list = VoIPCall.objects.filter(callrequest__campaign_id__in=campaign_id_list)
+    no_call = voipcall_list.count()
+
+    print("\nCalls completed : %d in %.1f seconds" % (no_call, elapsed))
+    if elapsed > 0:
+        print("Sustained calls per second : %.2f" % (no_call / elapsed))
+
+    print("\nDisposition :")
+    for disposition in sorted(set(voipcall_list.values_list('disposition', flat=True))):
+        print("  %-12s %d" % (disposition, voipcall_list.filter(disposition=disposition).count()))
+    print("  %-12s %d" % ('AMD machine', voipcall_list.filter(amd_status=VOIPCALL_AMD_STATUS.MACHINE).count()))
+
+    print("\nLatency per stage (seconds) :")
+    print("  %-10s %8s %8s %8s %8s" % ('stage', 'p50', 'p90', 'p99', 'max'))
+    latency = get_stage_latency(campaign_id_list)
+    for stage in STAGE_LIST:
+        print("  %-10s %8.3f %8.3f %8.3f %8.3f" % (
+            stage, percentile(latency[stage], 50), percentile(latency[stage], 90),
+            percentile(latency[stage], 99), percentile(latency[stage], 100)))
+
+    print("\nDB queries : %s" % ('n/a (run by the workers)' if query_count is None else query_count))
+    if query_count and no_call:
+        print("DB queries per call : %.1f" % (float(query_count) / no_call))
+
+    print("\nBroker messages (tasks) : %d" % sum(task_count.values()))
+    for name in sorted(task_count):
+        print("  %-50s %d" % (name, task_count[name]))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_pending_index(apps, schema_editor):
+    # Partial index of the pending callrequests scanned by callrequest_pending,
+    # the callrequests already called are left out so it stays small
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(
+            "CREATE INDEX dialer_callrequest_pending_call_time "
+            "ON dialer_callrequest (status, call_time) WHERE status = 1")
+    else:
+        schema_editor.execute(
+            "CREATE INDEX dialer_callrequest_pending_call_time "
+            "ON dialer_callrequest (status, call_time)")
+
+
+def drop_pending_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP INDEX dialer_callrequest_pending_call_time")
+    else:
+        schema_editor.execute("DROP INDEX dialer_callrequest_pending_call_time ON dialer_callrequest")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialer_cdr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pending_index, drop_pending_index),
+    ]
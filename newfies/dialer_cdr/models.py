@@ -13,6 +13,7 @@
 #
 
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
 from django.contrib.contenttypes.models import ContentType
@@ -23,6 +24,7 @@ from dialer_cdr.constants import CALLREQUEST_STATUS, CALLREQUEST_TYPE, LEG_TYPE,
     VOIPCALL_AMD_STATUS
 from django_lets_go.intermediate_model_base_class import Model
 from country_dialcode.models import Prefix
+from dialer_cdr.prefix_trie import prefix_trie_changed
 from datetime import datetime
 from django.utils.timezone import utc
 from uuid import uuid1
@@ -43,6 +45,12 @@ class CallRequestManager(models.Manager):
         # return Callrequest.objects.all()
         return Callrequest.objects.filter(**kwargs)
 
+    def get_due_retry(self, limit):
+        """Return the retries due to be called, stored as pending callrequests
+        with a parent, the scan uses the partial index on (status, call_time)"""
+        return self.get_pending_callrequest()\
+            .filter(parent_callrequest__isnull=False).order_by('call_time')[:limit]
+
 
 def str_uuid1():
     return str(uuid1())
@@ -235,3 +243,7 @@ class VoIPCall(models.Model):
 
     def __unicode__(self):
         return u"%d - %s" % (self.id, self.callid)
+
+
+post_save.connect(prefix_trie_changed, sender=Prefix)
+post_delete.connect(prefix_trie_changed, sender=Prefix)
@@ -0,0 +1,131 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_text
+from country_dialcode.models import Prefix
+from time import time
+import re
+
+# Bumped on every Prefix change so that each worker reloads its trie
+PREFIX_TRIE_VERSION_KEY = 'prefix_trie_version'
+# Seconds between two checks of the version by a worker
+PREFIX_TRIE_CHECK_INTERVAL = getattr(settings, 'PREFIX_TRIE_CHECK_INTERVAL', 60)
+DIGITS = re.compile(r'^[0-9]+$')
+
+
+def normalize_phonenumber(phone_number, prefix_to_ignore=None):
+    """
+    Remove the longest of the PREFIX_TO_IGNORE from the phone number,
+    return None if the phone number is not numeric
+
+    >>> normalize_phonenumber('0034650123456', '+,0,00')
+    '34650123456'
+
+    >>> normalize_phonenumber('sip:1000@127.0.0.1', '+,0,00')
+
+    >>> normalize_phonenumber(u'\u0663\u0664650123456', '+,0,00')
+    """
+    if prefix_to_ignore is None:
+        prefix_to_ignore = getattr(settings, 'PREFIX_TO_IGNORE', '')
+    phone_number = force_text(phone_number or '', errors='replace').strip()
+    for prefix in sorted(prefix_to_ignore.split(','), key=len, reverse=True):
+        prefix = prefix.strip()
+        if prefix and phone_number.startswith(prefix):
+            phone_number = phone_number[len(prefix):]
+            break
+    # isdigit() of unicode accepts the non-ASCII digits
+    if not DIGITS.match(phone_number):
+        return None
+    return str(phone_number)
+
+
+class PrefixTrie(object):
+
+    """Longest prefix match of the phone numbers on the dialcode prefixes
+
+    >>> trie = PrefixTrie([34, 346, 34650], prefix_limit_min=2, prefix_limit_max=5)
+    >>> trie.lookup('34650123456')
+    34650
+    >>> trie.lookup('34611111111')
+    346
+    >>> trie.lookup_list(['34111', '44111'])
+    [34, None]
+    """
+
+    def __init__(self, prefix_list=(), prefix_limit_min=None, prefix_limit_max=None):
+        self.root = {}
+        self.prefix_limit_min = prefix_limit_min or settings.PREFIX_LIMIT_MIN
+        self.prefix_limit_max = prefix_limit_max or settings.PREFIX_LIMIT_MAX
+        for prefix in prefix_list:
+            self.add(prefix)
+
+    def add(self, prefix):
+        """Add a prefix to the trie, the prefix is stored on its last digit"""
+        node = self.root
+        for digit in str(prefix):
+            node = node.setdefault(digit, {})
+        node[None] = prefix
+
+    def lookup(self, phone_number):
+        """Return the longest prefix of the phone number or None"""
+        phone_number = normalize_phonenumber(phone_number)
+        if phone_number is None:
+            return None
+        node = self.root
+        match = None
+        for length, digit in enumerate(phone_number[:self.prefix_limit_max], 1):
+            node = node.get(digit)
+            if node is None:
+                break
+            if None in node and length >= self.prefix_limit_min:
+                match = node[None]
+        return match
+
+    def lookup_list(self, phone_number_list):
+        """Return the longest prefix of each phone number of the list"""
+        return [self.lookup(phone_number) for phone_number in phone_number_list]
+
+
+_prefix_trie = None
+_prefix_trie_version = None
+_prefix_trie_checked = 0
+
+
+def get_prefix_trie():
+    """
+    Return the PrefixTrie of the worker, loaded once and reloaded when the
+    Prefix table changed
+    """
+    global _prefix_trie, _prefix_trie_version, _prefix_trie_checked
+    now = time()
+    if _prefix_trie is None or now - _prefix_trie_checked > PREFIX_TRIE_CHECK_INTERVAL:
+        version = cache.get(PREFIX_TRIE_VERSION_KEY, 0)
+        if _prefix_trie is None or version != _prefix_trie_version:
+            _prefix_trie = PrefixTrie(Prefix.objects.values_list('prefix', flat=True).iterator())
+            _prefix_trie_version = version
+        _prefix_trie_checked = now
+    return _prefix_trie
+
+
+def prefix_trie_changed(sender, **kwargs):
+    """A ``post_save`` / ``post_delete`` signal is sent by the Prefix model
+    whenever a prefix changed, the version is bumped for all the workers"""
+    global _prefix_trie
+    _prefix_trie = None
+    try:
+        cache.incr(PREFIX_TRIE_VERSION_KEY)
+    except ValueError:
+        cache.set(PREFIX_TRIE_VERSION_KEY, 1, None)
@@ -23,6 +23,7 @@ from dialer_campaign.constants import SUBSCRIBER_STATUS, AMD_BEHAVIOR
 from dialer_cdr.models import Callrequest
 from dialer_cdr.constants import CALLREQUEST_STATUS, CALLREQUEST_TYPE
 from dialer_cdr.utils import voipcall_save  # BufferVoIPCall
+from dialer_cdr.fake_dialer import fake_dial_out
 
 from user_profile.models import CalendarUserProfile
 from appointment.models.alarms import AlarmRequest
@@ -32,20 +33,30 @@ from sms.tasks import SendMessage
 from dialer_gateway.utils import prepare_phonenumber
 from datetime import datetime, timedelta
 from django.utils.timezone import utc
-from django_lets_go.only_one_task import only_one
-from common_functions import debug_query
+from mod_utils.lease_lock import lease_lock, lease_is_current
+from mod_utils.metrics import span, tag_span
 from uuid import uuid1
 from time import sleep
 try:
     import ESL as ESL
 except ImportError:
-    ESL = None
+    # pure python event socket client
+    from dialer_cdr import esl_client as ESL
 
 
 logger = get_task_logger(__name__)
 
-LOCK_EXPIRE = 60 * 10 * 1  # Lock expires in 10 minutes
 NODES_NUMBER = 3
+# Retries due are scanned every RETRY_DISPATCH_FREQ seconds, at most
+# RETRY_DISPATCH_LIMIT callrequests are dispatched per scan
+RETRY_DISPATCH_FREQ = getattr(settings, 'RETRY_DISPATCH_FREQ', 5)
+RETRY_DISPATCH_LIMIT = getattr(settings, 'RETRY_DISPATCH_LIMIT', 1000)
+# Call events processed per process_callevent task
+CALLEVENT_BATCH = getattr(settings, 'CALLEVENT_BATCH', 50)
+# Columns of call_event, in the order of the records of handle_callevent
+CALL_EVENT_FIELDS = "id, event_name, body, job_uuid, call_uuid, used_gateway_id, " \
+    "callrequest_id, alarm_request_id, callerid, phonenumber, duration, billsec, hangup_cause, " \
+    "hangup_cause_q850, starting_date, status, created_date, amd_status, leg"
 
 
 def find_dialer_node(callrequest_id):
@@ -58,29 +69,32 @@ def find_dialer_node(callrequest_id):
     return "newfiesfs%d" % c_node
 
 
+@span('dial_out')
 def dial_out(dial_command, callrequest_id):
-    if not ESL:
-        logger.debug('ESL not installed')
-        return 'load esl error'
-
-    reload(ESL)
+    if ESL.__name__ == 'ESL':
+        reload(ESL)
     hostname = settings.ESL_HOSTNAME
     # hostname = find_dialer_node(callrequest_id)
     logger.info("Selected Node to dialout: %s" % hostname)
     c = ESL.ESLconnection(hostname, settings.ESL_PORT, settings.ESL_SECRET)
-    c.connected()
+    if not c.connected():
+        logger.error("Can't connect to the ESL of %s" % hostname)
+        tag_span(outcome='not_connected')
+        return 'error'
     ev = c.api("bgapi", str(dial_command))
     c.disconnect()
     if ev:
         result = ev.serialize()
         logger.debug(result)
         pos = result.find('Job-UUID:')
-        if pos:
+        if pos >= 0:
             request_uuid = result[pos + 10:pos + 46]
         else:
             request_uuid = 'error'
     else:
         request_uuid = 'error'
+    if request_uuid == 'error':
+        tag_span(outcome='failure')
     return request_uuid
 
 
@@ -107,6 +121,8 @@ def check_retrycall_completion(callrequest):
 
         # TODO: Add method in models.Callrequest to create copy
         # Init new callrequest -> delay at completion_intervalretry
+        # NOTE : implement a PID algorithm
+        second_towait = callrequest.campaign.completion_intervalretry
         new_callrequest = Callrequest(
             request_uuid=uuid1(),
             parent_callrequest_id=callrequest.id,
@@ -123,19 +139,17 @@ def check_retrycall_completion(callrequest):
             caller_name=callrequest.caller_name,
             timeout=callrequest.timeout,
             content_object=callrequest.content_object,
-            subscriber=callrequest.subscriber
+            subscriber=callrequest.subscriber,
+            call_time=datetime.utcnow().replace(tzinfo=utc) + timedelta(seconds=second_towait or 0)
         )
+        # Stored as pending, dispatched by callrequest_pending once due
         new_callrequest.save()
-        # NOTE : implement a PID algorithm
-        second_towait = callrequest.campaign.completion_intervalretry
         logger.info("Init Completion Retry CallRequest %d in %d seconds" % (new_callrequest.id, second_towait))
-        init_callrequest.apply_async(
-            args=[new_callrequest.id, callrequest.campaign.id, callrequest.campaign.callmaxduration],
-            countdown=second_towait)
 
 
 @task(ignore_result=True)
-def update_callrequest(callrequest, opt_hangup_cause):
+def update_callrequest(callrequest_id, opt_hangup_cause):
+    callrequest = Callrequest.objects.select_related('subscriber').get(id=callrequest_id)
     # Only the aleg will update the subscriber status / Bleg is only recorded
     # Update Callrequest Status
     if opt_hangup_cause == 'NORMAL_CLEARING':
@@ -149,15 +163,59 @@ def update_callrequest(callrequest, opt_hangup_cause):
 
     callrequest.save()
     callrequest.subscriber.save()
-    debug_query(24)
+
+
+def get_callevent_callrequest(record_list):
+    """
+    Return the callrequests of the call events by call_event id, found by
+    callrequest_id or else by request_uuid, with 2 queries at most
+    """
+    queryset = Callrequest.objects.select_related('aleg_gateway', 'subscriber', 'campaign')
+    callrequest_by_id = queryset.in_bulk([record[6] for record in record_list if record[6]])
+    uuid_list = [(record[3] or '').strip(' \t\n\r') for record in record_list if not record[6]]
+    callrequest_by_uuid = {}
+    if uuid_list:
+        callrequest_by_uuid = dict([(callrequest.request_uuid, callrequest)
+                                    for callrequest in queryset.filter(request_uuid__in=uuid_list)])
+    callrequest_list = {}
+    for record in record_list:
+        if record[6]:
+            callrequest_list[record[0]] = callrequest_by_id.get(record[6])
+        else:
+            callrequest_list[record[0]] = callrequest_by_uuid.get((record[3] or '').strip(' \t\n\r'))
+    return callrequest_list
 
 
 @task(ignore_result=True)
-def process_callevent(record):
+def process_callevent(call_event_id_list):
     """
-    Process the callevent, this tasks will:
-        - Retrieve the callrequest using either callrequest_id or request_uuid
+    Process a batch of call events, the message only holds their ids, the
+    call events & their callrequests are read back at once
+
+    **Usage**:
+
+        process_callevent.delay([call_event_id, ...])
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT %s FROM call_event WHERE id IN (%s) ORDER BY id" %
+                   (CALL_EVENT_FIELDS, ','.join(['%s'] * len(call_event_id_list))), call_event_id_list)
+    record_list = cursor.fetchall()
+    callrequest_list = get_callevent_callrequest(record_list)
+    for record in record_list:
+        try:
+            handle_callevent(record, callrequest_list[record[0]])
+        except Exception:
+            # a failed event does not stop the rest of the batch
+            logger.exception("Error processing call_event %s" % record[0])
+
+
+@span('process_callevent')
+def handle_callevent(record, callrequest):
+    """
+    Process the callevent, this function will:
         - create the voipcall, and save different data
+        - update the callrequest & the subscriber or the alarm
+        - create the retry callrequest
     """
     # TODO: add method in utils parse_callevent
     app_type = 'campaign'
@@ -187,20 +245,10 @@ def process_callevent(record):
 
     request_uuid = job_uuid
     opt_hangup_cause = hangup_cause
-    debug_query(22)
 
-    try:
-        if callrequest_id == 0:
-            callrequest = Callrequest.objects \
-                .select_related('aleg_gateway', 'subscriber', 'campaign') \
-                .get(request_uuid=request_uuid.strip(' \t\n\r'))
-        else:
-            # mainly coming here
-            callrequest = Callrequest.objects \
-                .select_related('aleg_gateway', 'subscriber', 'campaign') \
-                .get(id=callrequest_id)
-    except:
-        logger.error("Cannot find Callrequest job_uuid : %s" % job_uuid)
+    if callrequest is None:
+        logger.error("Cannot find Callrequest %s job_uuid : %s" % (callrequest_id, job_uuid))
+        tag_span(outcome='no_callrequest')
         return True
 
     if callrequest.alarm_request_id:
@@ -210,11 +258,10 @@ def process_callevent(record):
         alarm_request_id = callrequest.alarm_request_id
 
     logger.debug("Find Callrequest id : %d" % callrequest.id)
-    debug_query(23)
 
     if leg == 'aleg' and app_type == 'campaign':
         # Update callrequest
-        # update_callrequest.delay(callrequest, opt_hangup_cause)
+        # update_callrequest.delay(callrequest.id, opt_hangup_cause)
         # Disabled above tasks to reduce amount of tasks
 
         # Only the aleg will update the subscriber status / Bleg is only recorded
@@ -231,12 +278,12 @@ def process_callevent(record):
 
         callrequest.save()
         callrequest.subscriber.save()
-        debug_query(24)
     elif leg == 'aleg' and app_type == 'alarm':
         try:
             caluser_profile = CalendarUserProfile.objects.get(user=alarm_req.alarm.event.creator)
         except CalendarUserProfile.DoesNotExist:
             logger.error("Error retrieving CalendarUserProfile")
+            tag_span(outcome='no_calendar_user')
             return False
 
         if opt_hangup_cause == 'NORMAL_CLEARING' and \
@@ -263,7 +310,6 @@ def process_callevent(record):
         callrequest.save()
         alarm_req.save()
         alarm_req.alarm.save()
-        debug_query(24)
 
     if call_uuid == '':
         call_uuid = job_uuid
@@ -286,8 +332,7 @@ def process_callevent(record):
     #     billsec=billsec,
     #     amd_status=amd_status)
 
-    # debug_query(25)
-
+    tag_span(outcome='answered' if opt_hangup_cause == 'NORMAL_CLEARING' else 'failed')
     voipcall_save(
         callrequest=callrequest,
         request_uuid=request_uuid,
@@ -312,8 +357,6 @@ def process_callevent(record):
         callrequest.call_type = CALLREQUEST_TYPE.RETRY_DONE
         callrequest.save()
 
-        debug_query(26)
-
         # check if we are allowed to retry on failure
         if ((callrequest.subscriber.count_attempt - 1) >= callrequest.campaign.maxretry
                 or not callrequest.campaign.maxretry):
@@ -321,13 +364,14 @@ def process_callevent(record):
                          callrequest.campaign.maxretry)
             # Check here if we should try for completion
             check_retrycall_completion(callrequest)
-            debug_query(28)
         else:
             # Allowed Retry
             logger.error("Allowed Retry - Maxretry (%d)" % callrequest.campaign.maxretry)
 
             # Create new callrequest, Assign parent_callrequest,
             # Change callrequest_type & num_attempt
+            # NOTE : implement a PID algorithm
+            second_towait = callrequest.campaign.intervalretry
             new_callrequest = Callrequest(
                 request_uuid=uuid1(),
                 parent_callrequest_id=callrequest.id,
@@ -342,17 +386,12 @@ def process_callevent(record):
                 timelimit=callrequest.timelimit,
                 callerid=callrequest.callerid,
                 timeout=callrequest.timeout,
-                subscriber_id=callrequest.subscriber_id
+                subscriber_id=callrequest.subscriber_id,
+                call_time=datetime.utcnow().replace(tzinfo=utc) + timedelta(seconds=second_towait or 0)
             )
+            # Stored as pending, dispatched by callrequest_pending once due
             new_callrequest.save()
-            # NOTE : implement a PID algorithm
-            second_towait = callrequest.campaign.intervalretry
-            debug_query(29)
-
             logger.debug("Init Retry CallRequest in  %d seconds" % second_towait)
-            init_callrequest.apply_async(
-                args=[new_callrequest.id, callrequest.campaign.id, callrequest.campaign.callmaxduration],
-                countdown=second_towait)
 
     elif app_type == 'campaign':
         # The Call is Answered and it's a campaign call
@@ -373,6 +412,7 @@ def process_callevent(record):
 
 
 # OPTIMIZATION - TO REVIEW
+@span('callevent_processing')
 def callevent_processing():
     """
     Retrieve callevents and process them
@@ -404,41 +444,38 @@ def callevent_processing():
     --CREATE INDEX call_event_idx_date ON call_event (created_date);
     --CREATE INDEX call_event_idx_uuid ON call_event (call_uuid);
     """
-    debug_query(20)
-
     cursor = connection.cursor()
     # TODO (Areski)
     # Replace this for ORM with select_for_update or transaction
 
     try:
-        sql_statement = "SELECT id, event_name, body, job_uuid, call_uuid, used_gateway_id, " \
-            "callrequest_id, alarm_request_id, callerid, phonenumber, duration, billsec, hangup_cause, " \
-            "hangup_cause_q850, starting_date, status, created_date, amd_status, leg " \
-            "FROM call_event WHERE status=1 LIMIT 1000 OFFSET 0"
+        # process_callevent reads the rest of the call events
+        sql_statement = "SELECT id, event_name FROM call_event WHERE status=1 LIMIT 1000 OFFSET 0"
 
         cursor.execute(sql_statement)
         row = cursor.fetchall()
     except:
         # Error on sql / Lua listener might not be on
         logger.error("Error Fetching call_event")
+        tag_span(outcome='error')
     else:
-        debug_query(21)
+        if not lease_is_current():
+            # a newer holder of task_pending_callevent processes these events
+            tag_span(outcome='stale_lease')
+            return
         # buff_voipcall = BufferVoIPCall()
         call_event_list = []
-        for record in row:
-            call_event_id = record[0]
-            event_name = record[1]
+        for (call_event_id, event_name) in row:
             call_event_list.append(str(call_event_id))
             logger.info("Processing Call_Event : %s" % event_name)
-            process_callevent.delay(record)
+        for i in range(0, len(row), CALLEVENT_BATCH):
+            process_callevent.delay([call_event_id for (call_event_id, event_name) in row[i:i + CALLEVENT_BATCH]])
 
         if call_event_list:
             # Update Call Event
             sql_statement = "UPDATE call_event SET status=2 WHERE id IN (%s)" % ','.join(call_event_list)
             cursor.execute(sql_statement)
-            debug_query(30)
         # buff_voipcall.commit()
-        # debug_query(31)
         logger.debug('End Loop : callevent_processing')
 
 
@@ -457,44 +494,58 @@ class task_pending_callevent(PeriodicTask):
 
     # run_every = timedelta(seconds=15)
 
-    # TODO: problem of the lock if it's a cloud, it won't be shared
-    @only_one(ikey="task_pending_callevent", timeout=LOCK_EXPIRE)
+    @lease_lock("task_pending_callevent")
     def run(self, **kwargs):
         logger.info("TASK :: task_pending_callevent")
         callevent_processing()
 
-"""
-from celery.decorators import periodic_task
-from datetime import timedelta
 
-@periodic_task(run_every=timedelta(seconds=1))
-@only_one(ikey="callrequest_pending", timeout=LOCK_EXPIRE)
-def callrequest_pending(*args, **kwargs):
-    #A periodic task that checks for pending calls
-    #**Usage**:
-    #    callrequest_pending.delay()
-    #
-    logger.info("TASK :: callrequest_pending")
+class callrequest_pending(PeriodicTask):
 
-    list_callrequest = Callrequest.objects\
-                .get_pending_callrequest()[:settings.MAX_CALLS_PER_SECOND]
-    logger.info("callrequest_pending - number_found=%d" % \
-                len(list_callrequest))
+    """
+    A periodic task that dispatches the retries of the calls, they are
+    stored as pending Callrequests with the call_time of the retry instead
+    of delayed tasks held by the broker
 
-    if not list_callrequest:
-        logger.debug("No Pending Calls")
+    **Usage**:
 
-    for callrequest in list_callrequest:
-        logger.info("=> CallRequest (id:%s, phone_number:%s)" %
-                    (callrequest.id, callrequest.phone_number))
+        callrequest_pending.delay()
+    """
+    run_every = timedelta(seconds=RETRY_DISPATCH_FREQ)
 
-        callrequest.status = 7 # Update to Process
-        callrequest.save()
-        init_callrequest.delay(callrequest.id, callrequest.campaign.id, callrequest.campaign.callmaxduration)
-"""
+    @lease_lock("callrequest_pending")
+    def run(self, **kwargs):
+        logger.debug("TASK :: callrequest_pending")
+        dispatch_due_retry()
+
+
+@span('dispatch_due_retry')
+def dispatch_due_retry(limit=RETRY_DISPATCH_LIMIT):
+    """
+    Start the retries due, oldest first, by batch of limit callrequests.
+    Return the number of callrequests dispatched
+    """
+    callrequest_list = list(Callrequest.objects.get_due_retry(limit)
+                            .values_list('id', 'campaign_id', 'timelimit'))
+    if not callrequest_list:
+        tag_span(outcome='empty')
+        return 0
+    if not lease_is_current():
+        tag_span(outcome='stale_lease')
+        return 0
+
+    # Update in bulk before dispatching so the next scan skips them
+    callrequest_id_list = [callrequest_id for (callrequest_id, campaign_id, timelimit) in callrequest_list]
+    Callrequest.objects.filter(id__in=callrequest_id_list)\
+        .update(status=CALLREQUEST_STATUS.CALLING, updated_date=datetime.utcnow().replace(tzinfo=utc))
+    for (callrequest_id, campaign_id, timelimit) in callrequest_list:
+        init_callrequest.delay(callrequest_id, campaign_id, timelimit)
+    logger.info("Dispatched %d due retries" % len(callrequest_list))
+    return len(callrequest_list)
 
 
 @task(ignore_result=True)
+@span('init_callrequest')
 def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=0, alarm_request_id=None):
     """
     This task read the callrequest, update it as 'In Process'
@@ -511,7 +562,6 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
     outbound_failure = False
     subscriber_id = None
     contact_id = None
-    debug_query(8)
 
     if ms_addtowait > 0:
         sleep(ms_addtowait)
@@ -529,9 +579,9 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
         alarm_request_id = obj_callrequest.alarm_request_id
     else:
         logger.info("TASK :: init_callrequest, wrong campaign_id & alarm_request_id")
+        tag_span(outcome='no_campaign')
         return False
 
-    debug_query(9)
     logger.info("TASK :: init_callrequest - status:%s;cmpg:%s;alarm:%s" %
                 (obj_callrequest.status, campaign_id, alarm_request_id))
 
@@ -544,12 +594,11 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
         obj_callrequest.aleg_gateway.status)
     if not dialout_phone_number:
         logger.info("Error with dialout_phone_number - phone_number:%s" % (obj_callrequest.phone_number))
+        tag_span(outcome='bad_phonenumber')
         return False
     else:
         logger.debug("dialout_phone_number : %s" % dialout_phone_number)
 
-    debug_query(10)
-
     if settings.DIALERDEBUG:
         dialout_phone_number = settings.DIALERDEBUG_PHONENUMBER
 
@@ -568,8 +617,6 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
         dialing_timeout = 45
     originate_dial_string = obj_callrequest.aleg_gateway.originate_dial_string
 
-    debug_query(11)
-
     # Sanitize gateways
     gateways = gateways.strip()
     if gateways[-1] != '/':
@@ -580,9 +627,7 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
         originate_dial_string = originate_dial_string + ',accountcode=' + \
             str(obj_callrequest.user.userprofile.accountcode)
 
-    debug_query(12)
-
-    if settings.NEWFIES_DIALER_ENGINE.lower() == 'esl':
+    if settings.NEWFIES_DIALER_ENGINE.lower() in ('esl', 'fake'):
         try:
             args_list = []
             send_digits = False
@@ -672,13 +717,15 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
             # logger.warn('dial_command (%d): %s' % (randval, dial_command))
 
             logger.warn('dial_command : %s' % dial_command)
-            request_uuid = dial_out(dial_command, obj_callrequest.id)
-
-            debug_query(14)
+            if settings.NEWFIES_DIALER_ENGINE.lower() == 'fake':
+                # load testing, the call_event is synthesized
+                request_uuid = fake_dial_out(obj_callrequest.id, gateway_id, obj_callrequest.phone_number,
+                                             obj_callrequest.callerid, dialing_timeout)
+            else:
+                request_uuid = dial_out(dial_command, obj_callrequest.id)
 
             if request_uuid and len(request_uuid) > 0 and request_uuid[:5] == 'error':
                 outbound_failure = True
-            debug_query(13)
         except:
             raise
             logger.error('error : ESL')
@@ -686,6 +733,7 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
         logger.debug('Received RequestUUID :> %s' % request_uuid)
     else:
         logger.error('No other method supported!')
+        tag_span(outcome='no_engine')
         obj_callrequest.status = CALLREQUEST_STATUS.FAILURE
         obj_callrequest.save()
         # ADD if alarm_request_id update AlarmRequest
@@ -711,13 +759,12 @@ def init_callrequest(callrequest_id, campaign_id, callmaxduration, ms_addtowait=
     obj_callrequest.request_uuid = request_uuid
     # check if the outbound call failed
     if outbound_failure:
+        tag_span(outcome='failure')
         obj_callrequest.status = CALLREQUEST_STATUS.FAILURE
     else:
         obj_callrequest.status = CALLREQUEST_STATUS.CALLING
     obj_callrequest.save()
 
-    debug_query(14)
-
     return True
 
 
@@ -12,19 +12,31 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 
+from __future__ import absolute_import
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.management import call_command
 from django.test import TestCase
+from django.db import connection
 from django_lets_go.utils import BaseAuthenticatedClient
 from dialer_campaign.models import Campaign
 from dialer_cdr.models import Callrequest, VoIPCall
+from dialer_cdr.constants import CALLREQUEST_STATUS
 from dialer_cdr.forms import VoipSearchForm
 from dialer_cdr.views import export_voipcall_report, voipcall_report
 from dialer_cdr.function_def import voipcall_search_admin_form_fun
+from dialer_cdr.prefix_trie import PrefixTrie, get_prefix_trie
+from dialer_cdr.management.commands.backfill_dialcode import backfill_dialcode
+from dialer_cdr.fake_dialer import create_call_event_table, set_fake_dialer_profile, fake_dial_out, pick_outcome,\
+    write_call_event
+from dialer_cdr.tasks import callevent_processing, process_callevent, dial_out, dispatch_due_retry
+from dialer_cdr import esl_client
+from tests.fake_esl import FakeESLServer
+from country_dialcode.models import Country, Prefix
 # from dialer_cdr.tasks import init_callrequest
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import utc
+from uuid import uuid1
 
 
 class DialerCdrView(BaseAuthenticatedClient):
@@ -147,6 +159,158 @@ class DialerCdrCeleryTaskTestCase(TestCase):
     #    result = init_callrequest.delay(self.callrequest.id, self.campaign.id, 30)
     #    self.assertEqual(result.successful(), True)
 
+    def create_retry(self, call_time):
+        retry = Callrequest.objects.get(pk=1)
+        retry.pk = None
+        retry.request_uuid = str(uuid1())
+        retry.parent_callrequest_id = self.callrequest.id
+        retry.status = CALLREQUEST_STATUS.PENDING
+        retry.call_time = call_time
+        retry.save()
+        return retry
+
+    def test_dispatch_due_retry(self):
+        """Test the due retries are dispatched & the others kept pending"""
+        create_call_event_table()
+        now = datetime.utcnow().replace(tzinfo=utc)
+        due_retry = self.create_retry(now - timedelta(minutes=1))
+        future_retry = self.create_retry(now + timedelta(hours=2))
+
+        with self.settings(NEWFIES_DIALER_ENGINE='fake'):
+            self.assertEqual(dispatch_due_retry(), 1)
+            self.assertEqual(dispatch_due_retry(), 0)
+        self.assertNotEqual(Callrequest.objects.get(pk=due_retry.id).status, CALLREQUEST_STATUS.PENDING)
+        self.assertEqual(Callrequest.objects.get(pk=future_retry.id).status, CALLREQUEST_STATUS.PENDING)
+
+
+class PrefixTrieTestCase(TestCase):
+
+    """Test the dialcode resolution with the prefix trie"""
+
+    fixtures = ['auth_user.json', 'gateway.json', 'dialer_setting.json',
+                'user_profile.json', 'phonebook.json', 'contact.json',
+                'dnc_list.json', 'dnc_contact.json', 'survey.json',
+                'campaign.json', 'subscriber.json', 'callrequest.json', 'voipcall.json']
+
+    def test_lookup(self):
+        """Test the longest prefix match"""
+        prefix_trie = PrefixTrie([34, 346, 34650, 1], prefix_limit_min=2, prefix_limit_max=5)
+        self.assertEqual(prefix_trie.lookup('0034650123456'), 34650)
+        self.assertEqual(prefix_trie.lookup('34611111111'), 346)
+        self.assertEqual(prefix_trie.lookup('1555'), None)
+        self.assertEqual(prefix_trie.lookup_list(['34111', 'sip:1000', '']), [34, None, None])
+        self.assertEqual(prefix_trie.lookup(u'34650\xe9'), None)
+        self.assertEqual(prefix_trie.lookup(u'\u0663\u0664650123456'), None)
+        self.assertEqual(prefix_trie.lookup(u'0034650123456'), 34650)
+
+    def test_backfill_dialcode(self):
+        """Test the reload of the trie on change & the backfill of the CDRs"""
+        country = Country.objects.create(countrycode='XXX', iso2='XX', countryprefix=58, countryname='Test')
+        Prefix.objects.create(prefix=582, destination='Test', country_id=country, carrier_name='Test')
+        self.assertEqual(get_prefix_trie().lookup('58236'), 582)
+
+        self.assertEqual(backfill_dialcode(chunk_size=1), VoIPCall.objects.filter(phone_number='58236').count())
+        self.assertEqual(VoIPCall.objects.get(pk=1).dialcode_id, 582)
+
+
+class FakeDialerTestCase(TestCase):
+
+    """Test the call events synthesized by the fake dialer of the load harness"""
+
+    fixtures = ['auth_user.json', 'gateway.json', 'dialer_setting.json',
+                'user_profile.json', 'phonebook.json', 'contact.json',
+                'dnc_list.json', 'dnc_contact.json', 'survey.json',
+                'campaign.json', 'subscriber.json', 'callrequest.json']
+
+    def test_pick_outcome(self):
+        """Test the outcome distribution"""
+        profile = {'answer': 60, 'busy': 15, 'noanswer': 20, 'machine': 5}
+        self.assertEqual(pick_outcome(profile, rand=0.1), 'answer')
+        self.assertEqual(pick_outcome(profile, rand=0.62), 'busy')
+        self.assertEqual(pick_outcome(profile, rand=0.99), 'noanswer')
+        self.assertEqual(pick_outcome({'busy': 0}, rand=0.5), 'answer')
+
+    def test_fake_dial_out(self):
+        """Test the call_event is processed into a CDR"""
+        create_call_event_table()
+        set_fake_dialer_profile({'answer': 100})
+        Callrequest.objects.filter(pk=1).update(subscriber=1)
+        callrequest = Callrequest.objects.get(pk=1)
+        request_uuid = fake_dial_out(callrequest.id, callrequest.aleg_gateway_id, callrequest.phone_number)
+
+        callevent_processing()
+        voipcall = VoIPCall.objects.get(request_uuid=request_uuid)
+        self.assertEqual(voipcall.disposition, 'ANSWER')
+        self.assertEqual(voipcall.callrequest_id, callrequest.id)
+
+    def test_process_callevent_batch(self):
+        """Test a batch of call events is read back by id, past an unknown callrequest"""
+        create_call_event_table()
+        request_uuid = str(uuid1())
+        Callrequest.objects.filter(pk=1).update(request_uuid=request_uuid, subscriber=1)
+        callrequest = Callrequest.objects.get(pk=1)
+        write_call_event(str(uuid1()), str(uuid1()), callrequest.aleg_gateway_id, 999999, '123456789',
+                         hangup_cause='NORMAL_CLEARING')
+        # no callrequest_id, found by request_uuid
+        write_call_event(request_uuid, str(uuid1()), callrequest.aleg_gateway_id, 0,
+                         callrequest.phone_number, hangup_cause='NORMAL_CLEARING')
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM call_event WHERE status=1 ORDER BY id")
+        call_event_id_list = [row[0] for row in cursor.fetchall()]
+
+        process_callevent(call_event_id_list)
+        self.assertEqual(VoIPCall.objects.filter(callrequest=callrequest, request_uuid=request_uuid).count(), 1)
+
+
+class FakeESLTestCase(TestCase):
+
+    """Test the originate path against the fake FreeSWITCH event socket"""
+
+    dial_command = "originate {callrequest_id=1,used_gateway_id=1,originate_timeout=30}user/1000 '&park'"
+
+    def setUp(self):
+        self.server = FakeESLServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_dial_out(self):
+        """Test dial_out gets the Job-UUID of the bgapi"""
+        with self.settings(ESL_HOSTNAME=self.server.host, ESL_PORT=self.server.port, ESL_SECRET='ClueCon'):
+            request_uuid = dial_out(self.dial_command, 1)
+            self.assertEqual(len(request_uuid), 36)
+
+        with self.settings(ESL_HOSTNAME=self.server.host, ESL_PORT=self.server.port, ESL_SECRET='wrong'):
+            self.assertEqual(dial_out(self.dial_command, 1), 'error')
+        self.assertEqual(self.server.stats['connection'], 2)
+        self.assertEqual(self.server.stats['auth_failure'], 1)
+
+    def test_events(self):
+        """Test the BACKGROUND_JOB & CHANNEL_HANGUP_COMPLETE events"""
+        self.server.profile = {'busy': 100}
+        esl = esl_client.ESLconnection(self.server.host, self.server.port, 'ClueCon')
+        self.assertTrue(esl.connected())
+        esl.events('plain', 'BACKGROUND_JOB CHANNEL_HANGUP_COMPLETE')
+        job_uuid = esl.bgapi(self.dial_command).getHeader('Job-UUID')
+
+        event = esl.recvEventTimed(5000)
+        self.assertEqual(event.getType(), 'BACKGROUND_JOB')
+        self.assertEqual(event.getHeader('Job-UUID'), job_uuid)
+        self.assertEqual(event.getBody(), '-ERR USER_BUSY\n')
+        event = esl.recvEventTimed(5000)
+        self.assertEqual(event.getType(), 'CHANNEL_HANGUP_COMPLETE')
+        self.assertEqual(event.getHeader('variable_hangup_cause'), 'USER_BUSY')
+        self.assertEqual(event.getHeader('variable_callrequest_id'), '1')
+        esl.disconnect()
+
+    def test_failure_rate(self):
+        """Test the failure injection"""
+        self.server.failure_rate = 1
+        esl = esl_client.ESLconnection(self.server.host, self.server.port, 'ClueCon')
+        self.assertEqual(esl.api(self.dial_command).getBody(), '-ERR NORMAL_TEMPORARY_FAILURE\n')
+        esl.disconnect()
+        self.assertEqual(self.server.stats['originate_failure'], 1)
+
 
 class DialerCdrModel(TestCase):
 
@@ -15,7 +15,7 @@
 from dialer_cdr.models import VoIPCall
 from dialer_cdr.constants import VOIPCALL_AMD_STATUS, LEG_TYPE
 from celery.utils.log import get_task_logger
-# from dialer_cdr.function_def import get_prefix_obj
+from dialer_cdr.prefix_trie import get_prefix_trie
 
 logger = get_task_logger(__name__)
 
@@ -81,11 +81,7 @@ class BufferVoIPCall:
         else:
             disposition = 'FAILED'
 
-        # Note: Removed for test performance
-        # Note: Look at prefix PG module : https://github.com/dimitri/prefix
-        #prefix_obj = get_prefix_obj(phonenumber)
-
-        # Save this for bulk saving
+        # Save this for bulk saving, the dialcode is resolved on commit
         self.list_voipcall.append(
             VoIPCall(
                 user_id=obj_callrequest.user_id,
@@ -96,7 +92,6 @@ class BufferVoIPCall:
                 callid=call_uuid,
                 callerid=callerid,
                 phone_number=phonenumber,
-                # dialcode=prefix_obj,
                 starting_date=starting_date,
                 duration=duration,
                 billsec=billsec,
@@ -110,6 +105,10 @@ class BufferVoIPCall:
         """
         function to create CDR / VoIP Call
         """
+        dialcode_list = get_prefix_trie().lookup_list(
+            [voipcall.phone_number for voipcall in self.list_voipcall])
+        for voipcall, dialcode_id in zip(self.list_voipcall, dialcode_list):
+            voipcall.dialcode_id = dialcode_id
         VoIPCall.objects.bulk_create(self.list_voipcall)
 
 
@@ -153,9 +152,8 @@ def voipcall_save(callrequest, request_uuid, leg='aleg', hangup_cause='',
     else:
         disposition = 'FAILED'
 
-    # Note: Removed for test performance
-    # Note: Look at prefix PG module : https://github.com/dimitri/prefix
-    #prefix_obj = get_prefix_obj(phonenumber)
+    # Longest prefix match on the in-memory trie, no query
+    dialcode_id = get_prefix_trie().lookup(phonenumber)
 
     # Save the VoIPCall
     new_voipcall = VoIPCall(
@@ -167,7 +165,7 @@ def voipcall_save(callrequest, request_uuid, leg='aleg', hangup_cause='',
         callid=call_uuid,
         callerid=callerid,
         phone_number=phonenumber,
-        # dialcode=prefix_obj,
+        dialcode_id=dialcode_id,
         starting_date=starting_date,
         duration=duration,
         billsec=billsec,
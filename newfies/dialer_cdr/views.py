@@ -23,6 +23,7 @@ from dialer_cdr.constants import CDR_REPORT_COLUMN_NAME
 from dialer_cdr.forms import VoipSearchForm
 from django_lets_go.common_functions import ceil_strdate, unset_session_var, getvar, get_pagination_vars
 from mod_utils.helper import Export_choice
+from mod_utils.pagination import paginate_list
 # from dialer_cdr.constants import Export_choice
 from datetime import datetime
 from django.utils.timezone import utc
@@ -167,7 +168,6 @@ def voipcall_report(request):
         kwargs['user_id'] = request.user.id
 
     voipcall_list = VoIPCall.objects.filter(**kwargs)
-    all_voipcall_list = voipcall_list.values_list('id', flat=True)
 
     # Session variable is used to get record set with searched option
     # into export file
@@ -176,12 +176,12 @@ def voipcall_report(request):
     if request.GET.get('page') or request.GET.get('sort_by'):
         daily_data = request.session['voipcall_daily_data']
     else:
-        if not voipcall_list:
-            request.session['voipcall_daily_data'] = ''
         daily_data = get_voipcall_daily_data(voipcall_list)
         request.session['voipcall_daily_data'] = daily_data
 
-    voipcall_list = voipcall_list.order_by(pag_vars['sort_order'])[pag_vars['start_page']:pag_vars['end_page']]
+    # The calls are already counted by get_voipcall_daily_data
+    list_page = paginate_list(request, voipcall_list, pag_vars, keyset_fields=('starting_date', ),
+                              count=daily_data['total_calls'])
 
     data = {
         'form': form,
@@ -190,8 +190,8 @@ def voipcall_report(request):
         'total_calls': daily_data['total_calls'],
         'total_avg_duration': daily_data['total_avg_duration'],
         'max_duration': daily_data['max_duration'],
-        'all_voipcall_list': all_voipcall_list,
-        'voipcall_list': voipcall_list,
+        'voipcall_list': list_page.object_list,
+        'list_page': list_page,
         'CDR_REPORT_COLUMN_NAME': CDR_REPORT_COLUMN_NAME,
         'col_name_with_order': pag_vars['col_name_with_order'],
         'start_date': start_date,
@@ -22,6 +22,7 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import render_to_response
 
 from dialer_contact.models import Phonebook, Contact
+from dialer_contact.outbox import queue_phonebook
 from dialer_contact.forms import Contact_fileImport
 from dialer_campaign.function_def import check_dialer_setting, dialer_setting_limit
 from user_profile.constants import NOTIFICATION_NAME
@@ -202,6 +203,8 @@ class ContactAdmin(admin.ModelAdmin):
             # remaining record
             Contact.objects.bulk_create(bulk_record)
             bulk_record = []
+            # bulk_create doesn't send post_save, add the contacts to the running campaigns
+            queue_phonebook(phonebook.id)
 
             # check if there is contact imported
             if contact_cnt > 0:
@@ -14,6 +14,7 @@
 
 from django.core.management.base import BaseCommand
 from dialer_contact.models import Phonebook, Contact
+from dialer_contact.outbox import queue_phonebook
 from optparse import make_option
 from django.db import IntegrityError
 from random import choice
@@ -99,4 +100,7 @@ class Command(BaseCommand):
             except IntegrityError:
                 print "Error : Duplicate contact - %s" % phone_no
 
+        # bulk_create doesn't send post_save, add the contacts to the running campaigns
+        queue_phonebook(obj_phonebook.id)
+
         print "\nTotal contacts created : %(count)s" % {'count': amount}
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_phonebook_index(apps, schema_editor):
+    # The contacts of a phonebook are imported into the subscribers in chunks
+    # of contact ids, from the high-water mark of PhonebookSync
+    schema_editor.execute(
+        "CREATE INDEX dialer_contact_phonebook_id_id ON dialer_contact (phonebook_id, id)")
+
+
+def drop_phonebook_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP INDEX dialer_contact_phonebook_id_id")
+    else:
+        schema_editor.execute("DROP INDEX dialer_contact_phonebook_id_id ON dialer_contact")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialer_contact', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_phonebook_index, drop_phonebook_index),
+    ]
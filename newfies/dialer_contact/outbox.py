@@ -0,0 +1,62 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Outbox of the phonebooks having new contacts
+
+Saving a contact or importing contacts in bulk only adds the phonebook to a
+redis set, the contact_outbox_flush task pops the set every
+CONTACT_OUTBOX_FREQ seconds and imports the contacts above the high-water
+mark of each phonebook into the subscribers of the running campaigns.
+
+A phonebook lost on a redis failure is caught up by campaign_spool_contact,
+which syncs the phonebooks of the running campaigns every minute.
+"""
+
+from django.conf import settings
+import logging
+
+logger = logging.getLogger('newfies.filelog')
+
+CONTACT_OUTBOX_REDIS_URL = getattr(settings, 'CONTACT_OUTBOX_REDIS_URL', 'redis://localhost:6379/0')
+CONTACT_OUTBOX_KEY = 'contact_outbox'
+
+_client = None
+
+
+def get_redis_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.StrictRedis.from_url(CONTACT_OUTBOX_REDIS_URL)
+    return _client
+
+
+def queue_phonebook(*phonebook_ids):
+    """Queue the phonebooks to which contacts have been added"""
+    if not phonebook_ids:
+        return
+    try:
+        get_redis_client().sadd(CONTACT_OUTBOX_KEY, *phonebook_ids)
+    except Exception as e:
+        logger.warning("Contact outbox: cannot queue phonebook %s: %s" % (phonebook_ids, e))
+
+
+def pop_phonebook():
+    """Return the queued phonebook ids & empty the outbox"""
+    pipe = get_redis_client().pipeline()
+    pipe.smembers(CONTACT_OUTBOX_KEY)
+    pipe.delete(CONTACT_OUTBOX_KEY)
+    (phonebook_ids, deleted) = pipe.execute()
+    return sorted([int(phonebook_id) for phonebook_id in phonebook_ids])
@@ -13,24 +13,52 @@
 #
 
 from django.conf import settings
+from django.db import connection, transaction
+from celery.task import PeriodicTask
 from celery.task import Task
 from celery.utils.log import get_task_logger
-from dialer_campaign.models import Campaign, Subscriber
-from user_profile.models import UserProfile
-from django_lets_go.only_one_task import only_one
+from dialer_campaign.constants import SUBSCRIBER_STATUS, CAMPAIGN_STATUS
+from dialer_campaign.models import Campaign, Subscriber, PhonebookSync
+from dialer_contact.constants import CONTACT_STATUS
+from dialer_contact.outbox import pop_phonebook
+from mod_utils.lease_lock import lease_lock, lease_is_current
+from datetime import datetime, timedelta
+from django.utils.timezone import utc
 
 logger = get_task_logger(__name__)
 
-LOCK_EXPIRE = 60 * 10 * 1  # Lock expires in 10 minutes
+# Number of contacts of a phonebook imported per transaction
+SUBSCRIBER_SYNC_CHUNK = getattr(settings, 'SUBSCRIBER_SYNC_CHUNK', 10000)
+SUBSCRIBER_SYNC_LAG = getattr(settings, 'SUBSCRIBER_SYNC_LAG', 60)
+CONTACT_OUTBOX_FREQ = getattr(settings, 'CONTACT_OUTBOX_FREQ', 5)
+
+# Upper bound of the next chunk of contact ids of the phonebook
+NEXT_CHUNK_SQL = \
+    "SELECT MAX(id) FROM (" \
+    "SELECT id FROM dialer_contact WHERE phonebook_id = %s AND id > %s ORDER BY id LIMIT %s" \
+    ") AS chunk"
+
+# First contact of a chunk created after a date, the high-water mark stays below it
+FIRST_RECENT_CONTACT_SQL = \
+    "SELECT MIN(id) FROM dialer_contact WHERE phonebook_id = %s AND id > %s AND id <= %s AND created_date >= %s"
+
+# The contacts already subscribed are skipped by the unique (contact, campaign)
+# of dialer_subscriber, without locking the table
+SYNC_CHUNK_SQL = \
+    "INSERT INTO dialer_subscriber " \
+    "(contact_id, campaign_id, duplicate_contact, status, created_date, updated_date) " \
+    "SELECT id, %s, contact, %s, %s, %s FROM dialer_contact " \
+    "WHERE phonebook_id = %s AND status = %s AND id > %s AND id <= %s " \
+    "ON CONFLICT (contact_id, campaign_id) DO NOTHING"
 
 
 class collect_subscriber(Task):
 
-    @only_one(ikey="check_collect_subscriber", timeout=LOCK_EXPIRE)
+    @lease_lock("collect_subscriber-{campaign_id}")
     def run(self, campaign_id):
         """
-        This task will collect all the contact and create the Subscriber
-        if the phonebook_id is no in the list of imported_phonebook IDs.
+        This task will import the contacts added to the phonebooks of the
+        campaign since the last run into the Subscriber
 
         **Attributes**:
 
@@ -38,81 +66,123 @@ class collect_subscriber(Task):
         """
         logger.debug("Collect subscribers for the campaign = %s" % str(campaign_id))
 
-        # Retrieve the list of active contact
         obj_campaign = Campaign.objects.get(id=campaign_id)
-        list_phonebook = obj_campaign.phonebook.all()
+        imported_phonebook = [elem for elem in obj_campaign.imported_phonebook.split(',') if elem]
+        count_import = 0
 
-        for item_phonebook in list_phonebook:
-            phonebook_id = item_phonebook.id
+        for phonebook_id in obj_campaign.phonebook.values_list('id', flat=True):
+            count_import += sync_phonebook_subscriber(obj_campaign, phonebook_id)
 
-            # check if phonebook_id is missing in imported_phonebook list
-            if not str(phonebook_id) in obj_campaign.imported_phonebook.split(','):
-                # Run import
-                logger.info("ImportPhonebook %d for campaign = %d" % (phonebook_id, campaign_id))
+            # imported_phonebook is kept for display & the API
+            if str(phonebook_id) not in imported_phonebook:
+                imported_phonebook.append(str(phonebook_id))
+                obj_campaign.imported_phonebook = ','.join(imported_phonebook)
+                obj_campaign.save(update_fields=['imported_phonebook'])
 
-                # Add the phonebook id to the imported list
-                if obj_campaign.imported_phonebook == '':
-                    sep = ''
-                else:
-                    sep = ','
-                obj_campaign.imported_phonebook = obj_campaign.imported_phonebook + \
-                    '%s%d' % (sep, phonebook_id)
-                obj_campaign.save()
+        if count_import:
+            logger.info("Imported %d subscribers for campaign = %d" % (count_import, campaign_id))
+            # Count contact imported
+            obj_campaign.totalcontact = Subscriber.objects.filter(campaign=campaign_id).count()
+            obj_campaign.save(update_fields=['totalcontact'])
 
-                # Faster method, ask the Database to do the job
-                importcontact_custom_sql(campaign_id, phonebook_id)
+        return True
 
-        # Count contact imported
-        count_contact = Subscriber.objects.filter(campaign=campaign_id).count()
-        obj_campaign.totalcontact = count_contact
-        obj_campaign.save()
 
-        return True
+class contact_outbox_flush(PeriodicTask):
 
+    """A periodic task that imports the new contacts of the phonebooks queued
+    in the contact outbox into the subscribers of the running campaigns
 
-def importcontact_custom_sql(campaign_id, phonebook_id):
-    # Call PL-SQL stored procedure
-    # Subscriber.importcontact_pl_sql(campaign_id, phonebook_id)
+    **Usage**:
 
-    # max_subr_cpg = max number of subscriber per campaign,
-    # That is going to be checked when a contact is going to be imported
-    # to the subscriber list
+        contact_outbox_flush.delay()
+    """
+    run_every = timedelta(seconds=CONTACT_OUTBOX_FREQ)
 
-    # TODO: to review first... accr max_subr_cpn/max_subr_cpg
-    campaign_obj = Campaign.objects.get(pk=campaign_id)
-    max_subr_cpg = UserProfile.objects.get(user=campaign_obj.user).dialersetting.max_subr_cpg
+    @lease_lock("contact_outbox_flush")
+    def run(self, **kwargs):
+        phonebook_id_list = pop_phonebook()
+        if not phonebook_id_list:
+            return False
+        logger.debug("TASK :: contact_outbox_flush phonebooks = %s" % phonebook_id_list)
 
-    if max_subr_cpg > 0:
-        # Check how many we are going to import and how many exist for that campaign already
-        imported_subscriber_count = Subscriber.objects.filter(campaign_id=campaign_id).count()
-        allowed_import = max_subr_cpg - imported_subscriber_count
-        if allowed_import > 0:
-            # handle negative value for to_import
-            limit_import = 'LIMIT %d' % allowed_import
-        else:
-            limit_import = 'LIMIT 0'
-    else:
-        limit_import = ''
+        campaign_phonebook_list = list(Campaign.phonebook.through.objects
+                                       .filter(phonebook_id__in=phonebook_id_list,
+                                               campaign__status=CAMPAIGN_STATUS.START)
+                                       .values_list('campaign_id', 'phonebook_id'))
+        campaign_list = Campaign.objects.select_related('user')\
+            .in_bulk(set([campaign_id for (campaign_id, phonebook_id) in campaign_phonebook_list]))
 
-    from django.db import connection
-    cursor = connection.cursor()
-    if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql_psycopg2':
-        # Data insert operation - http://stackoverflow.com/questions/12451053/django-bulk-create-with-ignore-rows-that-cause-integrityerror
-        sqlimport = \
-            "LOCK TABLE dialer_subscriber IN EXCLUSIVE MODE;" \
-            "INSERT INTO dialer_subscriber "\
-            "(contact_id, campaign_id, duplicate_contact, status, created_date, updated_date) "\
-            "SELECT id, %d, contact, 1, NOW(), NOW() FROM dialer_contact "\
-            "WHERE phonebook_id=%d AND dialer_contact.status=1 AND NOT EXISTS (" \
-            "SELECT 1 FROM dialer_subscriber WHERE "\
-            "dialer_subscriber.campaign_id=%d "\
-            "AND dialer_contact.id = dialer_subscriber.contact_id ) %s;" % \
-            (campaign_id, phonebook_id, campaign_id, limit_import)
-    else:
-        # MYSQL Support removed
-        logger.error("Database not supported (%s)" % settings.DATABASES['default']['ENGINE'])
-        return False
+        count_import = dict.fromkeys(campaign_list, 0)
+        for (campaign_id, phonebook_id) in campaign_phonebook_list:
+            count_import[campaign_id] += sync_phonebook_subscriber(campaign_list[campaign_id], phonebook_id)
 
-    cursor.execute(sqlimport)
+        for (campaign_id, count) in count_import.items():
+            if count:
+                logger.info("Imported %d subscribers for campaign = %d" % (count, campaign_id))
+                Campaign.objects.filter(id=campaign_id)\
+                    .update(totalcontact=Subscriber.objects.filter(campaign=campaign_id).count(),
+                            updated_date=datetime.utcnow().replace(tzinfo=utc))
+        return True
+
+
+def sync_phonebook_subscriber(obj_campaign, phonebook_id, chunk_size=SUBSCRIBER_SYNC_CHUNK, lag=SUBSCRIBER_SYNC_LAG):
+    """
+    Import the contacts of the phonebook above the high-water mark of
+    PhonebookSync into the subscribers of the campaign, chunk by chunk of
+    contact ids, and return the number of subscribers created
 
-    return True
+    The mark is not moved past the contacts created less than lag seconds
+    ago, the contacts of the imports still running may get lower ids, they
+    are imported by a later sync. The max_subr_cpg of the user's dialer
+    setting caps the subscribers of the campaign
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        # MYSQL Support removed
+        logger.error("Database not supported (%s)" % connection.vendor)
+        return 0
+
+    (obj_sync, created) = PhonebookSync.objects.get_or_create(campaign=obj_campaign, phonebook_id=phonebook_id)
+    cursor = connection.cursor()
+    created_before = datetime.utcnow().replace(tzinfo=utc) - timedelta(seconds=lag)
+    # position of the import, the mark stays at the first recent contact
+    position = obj_sync.last_contact_id
+    mark_settled = False
+    max_import = None
+    count_import = 0
+    while True:
+        limit = chunk_size if max_import is None else min(chunk_size, max_import - count_import)
+        if limit <= 0:
+            logger.info("max_subr_cpg reached for campaign = %d" % obj_campaign.id)
+            break
+        cursor.execute(NEXT_CHUNK_SQL, [phonebook_id, position, limit])
+        last_contact_id = cursor.fetchone()[0]
+        if last_contact_id is None:
+            break
+
+        if max_import is None:
+            # The subscribers are only counted when there are contacts to import
+            max_subr_cpg = obj_campaign.user.userprofile.dialersetting.max_subr_cpg
+            if max_subr_cpg > 0:
+                max_import = max_subr_cpg - Subscriber.objects.filter(campaign=obj_campaign.id).count()
+                continue
+            max_import = float('inf')
+
+        if not lease_is_current():
+            break
+        now = datetime.utcnow().replace(tzinfo=utc)
+        with transaction.atomic():
+            cursor.execute(SYNC_CHUNK_SQL, [
+                obj_campaign.id, SUBSCRIBER_STATUS.PENDING, now, now,
+                phonebook_id, CONTACT_STATUS.ACTIVE, position, last_contact_id])
+            count_import += max(cursor.rowcount, 0)
+            if not mark_settled:
+                cursor.execute(FIRST_RECENT_CONTACT_SQL, [phonebook_id, position, last_contact_id, created_before])
+                first_recent_id = cursor.fetchone()[0]
+                if first_recent_id is not None:
+                    mark_settled = True
+                mark_id = last_contact_id if first_recent_id is None else first_recent_id - 1
+                PhonebookSync.objects.filter(id=obj_sync.id, last_contact_id__lt=mark_id)\
+                    .update(last_contact_id=mark_id)
+        position = last_contact_id
+    return count_import
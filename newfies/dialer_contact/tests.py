@@ -22,9 +22,11 @@ from dialer_contact.forms import Contact_fileImport, PhonebookForm, ContactForm,
 from dialer_contact.views import phonebook_add, phonebook_change, phonebook_list,\
     phonebook_del, contact_list, contact_add, contact_change, contact_del, contact_import,\
     get_contact_count
-from dialer_contact.tasks import collect_subscriber
+from dialer_contact.tasks import collect_subscriber, sync_phonebook_subscriber, contact_outbox_flush
+from dialer_contact.outbox import queue_phonebook, pop_phonebook
+from dialer_campaign.models import Campaign, Subscriber, PhonebookSync
 from django_lets_go.utils import BaseAuthenticatedClient
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import utc
 # import os
 
@@ -305,6 +307,37 @@ class DialerContactCeleryTaskTestCase(TestCase):
 
         call_command("create_contact", "3|10")
 
+    def test_sync_phonebook_subscriber(self):
+        """Test that only the contacts added since the last sync are imported"""
+        campaign = Campaign.objects.get(pk=1)
+        self.assertEqual(sync_phonebook_subscriber(campaign, 1), 0)
+        self.assertEqual(PhonebookSync.objects.get(campaign=campaign, phonebook_id=1).last_contact_id, 1)
+
+        # bulk_create skips the post_save of the contacts
+        Contact.objects.bulk_create([Contact(phonebook_id=1, contact='6402340%02d' % i) for i in range(3)])
+        self.assertEqual(sync_phonebook_subscriber(campaign, 1, chunk_size=2), 3)
+        self.assertEqual(Subscriber.objects.filter(campaign=campaign).count(), 4)
+        self.assertEqual(sync_phonebook_subscriber(campaign, 1), 0)
+
+        # The mark only moves past the contacts older than the lag
+        self.assertEqual(PhonebookSync.objects.get(campaign=campaign, phonebook_id=1).last_contact_id, 1)
+        last_id = Contact.objects.filter(phonebook_id=1).order_by('-id')[0].id
+        Contact.objects.filter(phonebook_id=1).exclude(id=last_id)\
+            .update(created_date=datetime.utcnow().replace(tzinfo=utc) - timedelta(minutes=5))
+        self.assertEqual(sync_phonebook_subscriber(campaign, 1), 0)
+        self.assertEqual(PhonebookSync.objects.get(campaign=campaign, phonebook_id=1).last_contact_id, last_id - 1)
+        self.assertEqual(sync_phonebook_subscriber(campaign, 1, lag=0), 0)
+        self.assertEqual(PhonebookSync.objects.get(campaign=campaign, phonebook_id=1).last_contact_id, last_id)
+
+    def test_contact_outbox_flush(self):
+        """Test that the contacts of the queued phonebooks are subscribed"""
+        Contact.objects.bulk_create([Contact(phonebook_id=1, contact='6402341%02d' % i) for i in range(3)])
+        queue_phonebook(1)
+        self.assertEqual(contact_outbox_flush().run(), True)
+        self.assertEqual(Subscriber.objects.filter(campaign=1).count(), 4)
+        self.assertEqual(Campaign.objects.get(pk=1).totalcontact, 4)
+        self.assertEqual(pop_phonebook(), [])
+
 
 class DialerContactModel(TestCase):
 
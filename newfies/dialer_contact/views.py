@@ -19,6 +19,7 @@ from django.utils.translation import ugettext as _
 from django.db.models import Q
 from django.db.models import Count
 from dialer_contact.models import Phonebook, Contact
+from dialer_contact.outbox import queue_phonebook
 from dialer_contact.forms import ContactSearchForm, Contact_fileImport, PhonebookForm, ContactForm
 from dialer_contact.constants import PHONEBOOK_COLUMN_NAME, CONTACT_COLUMN_NAME
 from dialer_contact.constants import STATUS_CHOICE
@@ -27,6 +28,7 @@ from user_profile.constants import NOTIFICATION_NAME
 from frontend_notification.views import frontend_send_notification
 from django_lets_go.common_functions import striplist, getvar, get_pagination_vars,\
     unset_session_var, source_desti_field_chk
+from mod_utils.pagination import paginate_list
 import csv
 import json
 
@@ -250,8 +252,7 @@ def contact_list(request):
         kwargs[i] = contact_no[i]
 
     contact_list = []
-    all_contact_list = []
-    contact_count = 0
+    list_page = None
 
     if phonebook_id_list:
         contact_list = Contact.objects\
@@ -269,14 +270,14 @@ def contact_list(request):
             if contact_name_filter:
                 contact_list = contact_list.filter(contact_name_filter)
 
-        all_contact_list = contact_list.order_by(pag_vars['sort_order'])
-        contact_list = all_contact_list[pag_vars['start_page']:pag_vars['end_page']]
-        contact_count = all_contact_list.count()
+        # Keyset pages on the id, estimated count on large phonebooks
+        list_page = paginate_list(request, contact_list, pag_vars, keyset_fields=('id', ))
+        contact_list = list_page.object_list
 
     data = {
         'contact_list': contact_list,
-        'all_contact_list': all_contact_list,
-        'total_contacts': contact_count,
+        'list_page': list_page,
+        'total_contacts': list_page.count if list_page else 0,
         'CONTACT_COLUMN_NAME': CONTACT_COLUMN_NAME,
         'col_name_with_order': pag_vars['col_name_with_order'],
         'msg': request.session.get('msg'),
@@ -518,6 +519,8 @@ def contact_import(request):
         # remaining record
         Contact.objects.bulk_create(bulk_record)
         bulk_record = []
+        # bulk_create doesn't send post_save, add the contacts to the running campaigns
+        queue_phonebook(phonebook.id)
 
     # check if there is contact imported
     if contact_cnt > 0:
@@ -23,6 +23,7 @@ urlpatterns = [
     url(r'^index/$', views.index),
     url(r'^pleaselog/$', views.pleaselog),
     url(r'^dashboard/$', views.customer_dashboard),
+    url(r'^metrics/$', views.metrics),
 ]
 
 #
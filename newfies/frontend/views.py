@@ -15,15 +15,13 @@
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required,\
     permission_required
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, HttpResponse, Http404
 from django.shortcuts import render_to_response
 from django.db.models import Sum, Avg, Count
 from django.conf import settings
 from django.template.context import RequestContext
 from django.utils.translation import ugettext as _
-from dialer_contact.models import Contact
-from dialer_contact.constants import CONTACT_STATUS
-from dialer_campaign.models import Campaign, Subscriber
+from dialer_campaign.models import Campaign, Subscriber, get_campaign_stats
 from dialer_campaign.function_def import date_range
 from dialer_cdr.models import VoIPCall
 from dialer_cdr.constants import CALL_DISPOSITION
@@ -31,6 +29,7 @@ from frontend.forms import LoginForm, DashboardForm
 from frontend.function_def import calculate_date
 from frontend.constants import COLOR_DISPOSITION, SEARCH_TYPE
 from django_lets_go.common_functions import percentage
+from mod_utils.metrics import METRICS_ENABLED, get_metrics_text
 from datetime import datetime
 from django.utils.timezone import utc
 from dateutil.relativedelta import relativedelta
@@ -120,6 +119,20 @@ def pleaselog(request):
     return render_to_response('frontend/index.html', data, context_instance=RequestContext(request))
 
 
+def metrics(request):
+    """Timing & query metrics of the dialer stages in the Prometheus text format
+
+    **Logic Description**:
+
+        * Only served when METRICS_ENABLED is set, to the addresses
+          listed in METRICS_ALLOWED_IPS
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    if not METRICS_ENABLED or request.META.get('REMOTE_ADDR') not in allowed_ips:
+        raise Http404
+    return HttpResponse(get_metrics_text(), content_type='text/plain; version=0.0.4')
+
+
 @permission_required('dialer_campaign.view_dashboard', login_url='/')
 @login_required
 def customer_dashboard(request, on_index=None):
@@ -137,12 +150,12 @@ def customer_dashboard(request, on_index=None):
     """
     logging.debug('Start Dashboard')
     # All campaign for logged in User
-    campaign_id_list = Campaign.objects.values_list('id', flat=True).filter(user=request.user).order_by('id')
+    campaign_id_list = list(Campaign.objects.values_list('id', flat=True).filter(user=request.user).order_by('id'))
 
     # Contacts count which are active and belong to those phonebook(s) which is
     # associated with all campaign
-    pb_active_contact_count = Contact.objects\
-        .filter(phonebook__campaign__in=campaign_id_list, status=CONTACT_STATUS.ACTIVE).count()
+    pb_active_contact_count = sum([stats['active_contact'] for stats in
+                                   get_campaign_stats(campaign_id_list, with_subscriber=False).values()])
 
     form = DashboardForm(request.user, request.POST or None)
     logging.debug('Got Campaign list')
@@ -0,0 +1,52 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from optparse import make_option
+from celery import current_app
+from celery.bin.worker import worker
+from newfies_dialer.celery_routes import get_worker_argv
+
+
+class Command(BaseCommand):
+    args = 'role'
+    help = "Start the celery worker of a role defined in CELERY_WORKER_PROFILE\n" \
+           "-----------------------------------------------------------------\n" \
+           "python manage.py celery_worker dispatch\n" \
+           "python manage.py celery_worker --list"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--list', action='store_true', default=False, dest='list',
+                    help='list the roles & their worker arguments'),
+        make_option('--loglevel', default='info', dest='loglevel', help='loglevel of the worker'),
+    )
+
+    def handle(self, *args, **options):
+        profile_list = getattr(settings, 'CELERY_WORKER_PROFILE', {})
+        if options.get('list') or not args:
+            for role in sorted(profile_list):
+                print("%s: %s" % (role, ' '.join(get_worker_argv(role, profile_list[role]))))
+            return
+
+        role = args[0]
+        if role not in profile_list:
+            print("No worker profile %s, choose one of: %s" % (role, ', '.join(sorted(profile_list))))
+            return
+
+        profile = profile_list[role]
+        # The prefetch is a setting of the worker, not an argument
+        current_app.conf.CELERYD_PREFETCH_MULTIPLIER = profile.get('prefetch', 4)
+        argv = get_worker_argv(role, profile, options.get('loglevel') or 'info')
+        worker(app=current_app).run_from_argv('manage.py celery_worker', argv, command='worker')
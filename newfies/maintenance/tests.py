@@ -1,3 +1,52 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
 from django.test import TestCase
+from newfies_dialer.celery_routes import QueueRouter, get_task_route, get_worker_argv
+
+
+class CeleryRouteTestCase(TestCase):
+
+    """Test the queue topology of the celery tasks"""
+
+    def test_task_route(self):
+        """Test the queue, routing key & priority of a task"""
+        self.assertEqual(QueueRouter().route_for_task('dialer_cdr.tasks.init_callrequest'),
+                         {'queue': 'dispatch', 'routing_key': 'dispatch.init_callrequest', 'priority': 0})
+        self.assertEqual(get_task_route('dialer_audio.tasks.audio_transcode')['queue'], 'bulk')
+        self.assertEqual(get_task_route('celery.backend_cleanup'), None)
+
+    def test_queue_topology(self):
+        """Test the queues of the routes & of the worker profiles are declared"""
+        queue_list = [queue.name for queue in settings.CELERY_QUEUES]
+        for queue in settings.CELERY_TASK_QUEUE.values():
+            self.assertIn(queue, queue_list)
+            self.assertIn(queue, settings.CELERY_QUEUE_PRIORITY)
+        for profile in settings.CELERY_WORKER_PROFILE.values():
+            for queue in profile['queues']:
+                self.assertIn(queue, queue_list)
+        self.assertEqual(sorted(settings.CELERY_WORKER_PROFILE['all']['queues']), sorted(queue_list))
 
-# Create your tests here.
+    def test_worker_argv(self):
+        """Test the worker arguments of a profile"""
+        argv = get_worker_argv('dispatch', {'queues': ['dispatch'], 'concurrency': 10, 'prefetch': 1})
+        self.assertIn('--queues=dispatch', argv)
+        self.assertIn('--hostname=dispatch@%h', argv)
+        self.assertIn('--concurrency=10', argv)
+        self.assertIn('-Ofair', argv)
+        argv = get_worker_argv('all', {'queues': ['dispatch', 'events'], 'autoscale': '10,2'})
+        self.assertIn('--queues=dispatch,events', argv)
+        self.assertIn('--autoscale=10,2', argv)
+        self.assertNotIn('-Ofair', argv)
@@ -26,7 +26,7 @@ admin.site.register(MailTemplate, MailTemplateAdmin)
 
 # MailSpooler
 class MailSpoolerAdmin(admin.ModelAdmin):
-    list_display = ('id', 'mailtemplate', 'contact_email', 'mailspooler_type', 'created_date')
+    list_display = ('id', 'mailtemplate', 'contact_email', 'mailspooler_type', 'num_attempt', 'created_date')
     list_display_links = ['id', 'mailtemplate']
     #raw_id_fields = ('contact',)
 
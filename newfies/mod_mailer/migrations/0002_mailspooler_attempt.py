@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mod_mailer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailspooler',
+            name='num_attempt',
+            field=models.IntegerField(default=0, verbose_name='attempts'),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='mailspooler',
+            name='last_attempt_time',
+            field=models.DateTimeField(null=True, verbose_name='last attempt', blank=True),
+            preserve_default=True,
+        ),
+    ]
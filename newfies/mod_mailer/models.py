@@ -52,6 +52,11 @@ class MailSpooler(models.Model):
 
     """
     This table store the Mail Spooler
+
+    **Attributes**:
+
+        * ``num_attempt`` - sending attempts failed with a transient error
+        * ``last_attempt_time`` - date the mail was last claimed for sending
     """
     mailtemplate = models.ForeignKey(MailTemplate, verbose_name=_('mail template'))
     contact_email = models.EmailField(verbose_name=_('contact email'))
@@ -61,6 +66,8 @@ class MailSpooler(models.Model):
     mailspooler_type = models.IntegerField(choices=list(MAILSPOOLER_TYPE),
                                            blank=True, null=True, verbose_name=_("type"),
                                            default=MAILSPOOLER_TYPE.PENDING)
+    num_attempt = models.IntegerField(default=0, verbose_name=_('attempts'))
+    last_attempt_time = models.DateTimeField(null=True, blank=True, verbose_name=_('last attempt'))
 
     class Meta:
         verbose_name = _('mail spooler')
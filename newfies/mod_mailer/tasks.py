@@ -13,26 +13,155 @@
 #
 
 from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
 from celery.decorators import task, periodic_task
 from celery.task import PeriodicTask
 from celery.utils.log import get_task_logger
-from django_lets_go.only_one_task import only_one
-from mod_mailer.models import MailSpooler, MailTemplate
+from mod_utils.lease_lock import lease_lock
+from mod_mailer.models import MailSpooler
 from mod_mailer.constants import MAILSPOOLER_TYPE
 from mailer.engine import send_all
 from mailer.models import Message
-from mailer import send_html_mail
 from datetime import timedelta
+from time import sleep
+import smtplib
+import socket
 
 
-LOCK_EXPIRE = 60 * 5  # Lock expires in 5 minutes
-
 logger = get_task_logger(__name__)
 
 
 # allow a sysadmin to pause the sending of mail temporarily.
 PAUSE_SEND = getattr(settings, "MAILER_PAUSE_SEND", False)
 
+# Number of pending mails claimed per run of mailspooler_pending
+MAILSPOOLER_BATCH_SIZE = getattr(settings, "MAILSPOOLER_BATCH_SIZE", 500)
+# Max number of mails per second sent by a batch, 0 for no limit
+MAILSPOOLER_MAX_RATE = getattr(settings, "MAILSPOOLER_MAX_RATE", 0)
+# Mail backend used to send the batches
+MAILSPOOLER_EMAIL_BACKEND = getattr(settings, "MAILSPOOLER_EMAIL_BACKEND", settings.MAILER_EMAIL_BACKEND)
+# Attempts of a mail failing with a transient error before it is set as FAILURE
+MAILSPOOLER_MAX_ATTEMPT = getattr(settings, "MAILSPOOLER_MAX_ATTEMPT", 5)
+# Seconds before a mail deferred or released is claimed again
+MAILSPOOLER_RETRY_DELAY = getattr(settings, "MAILSPOOLER_RETRY_DELAY", 600)
+# Seconds after which a mail still IN_PROCESS is released as PENDING
+MAILSPOOLER_IN_PROCESS_TIMEOUT = getattr(settings, "MAILSPOOLER_IN_PROCESS_TIMEOUT", 3600)
+
+
+def render_mailtemplate(mailtemplate):
+    """
+    Return the (subject, message_plaintext, message_html, from_email) used
+    to build the mails of the MailTemplate
+    """
+    return (mailtemplate.subject, mailtemplate.message_plaintext,
+            mailtemplate.message_html, mailtemplate.from_email)
+
+
+def is_transient_error(exc):
+    """
+    Return True if the mail failed with an error worth a retry, a 4xx reply
+    of the SMTP server or a lost connection
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for (code, msg) in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPConnectError):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, socket.error))
+
+
+def send_mailspooler(mailspooler_list, connection, max_rate=0):
+    """
+    Send the mails of the MailSpooler list over a single connection of the
+    mail backend, sending at most max_rate mails per second (0 for no limit).
+    The sending stops if the connection is lost, the mails left are in none
+    of the lists, an error opening the connection is raised.
+
+    Return the tuple (sent_id_list, retry_id_list, failure_id_list)
+    """
+    rendered_template = {}
+    sent_id_list = []
+    retry_id_list = []
+    failure_id_list = []
+    connection.open()
+    try:
+        for current_mailspooler in mailspooler_list:
+            # Render each MailTemplate once per batch
+            if current_mailspooler.mailtemplate_id not in rendered_template:
+                rendered_template[current_mailspooler.mailtemplate_id] = \
+                    render_mailtemplate(current_mailspooler.mailtemplate)
+            (subject, message_plaintext, message_html, from_email) = \
+                rendered_template[current_mailspooler.mailtemplate_id]
+
+            msg = EmailMultiAlternatives(subject, message_plaintext, from_email,
+                                         [current_mailspooler.contact_email], connection=connection)
+            msg.attach_alternative(message_html, "text/html")
+            try:
+                msg.send()
+            except (smtplib.SMTPServerDisconnected, socket.error) as exc:
+                logger.error("Mail connection lost - ID:%d - %s" % (current_mailspooler.id, exc))
+                break
+            except Exception as exc:
+                logger.error("Mail failure - ID:%d - %s" % (current_mailspooler.id, exc))
+                if is_transient_error(exc):
+                    retry_id_list.append(current_mailspooler.id)
+                else:
+                    failure_id_list.append(current_mailspooler.id)
+            else:
+                sent_id_list.append(current_mailspooler.id)
+
+            if max_rate > 0:
+                sleep(1.0 / max_rate)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return (sent_id_list, retry_id_list, failure_id_list)
+
+
+@task()
+def sendmail_batch_task(mailspooler_id_list):
+    """
+    Task to send a batch of Mail over one connection and update their status in bulk,
+    the mails failing with a transient error are deferred until MAILSPOOLER_MAX_ATTEMPT
+    and the mails not sent are put back as PENDING
+    """
+    logger.info("TASK :: sendmail_batch_task - #mails:%d" % len(mailspooler_id_list))
+
+    mailspooler_list = list(MailSpooler.objects.select_related('mailtemplate')
+                            .filter(id__in=mailspooler_id_list, mailspooler_type=MAILSPOOLER_TYPE.IN_PROCESS))
+
+    connection = get_connection(backend=MAILSPOOLER_EMAIL_BACKEND)
+    try:
+        (sent_id_list, retry_id_list, failure_id_list) = \
+            send_mailspooler(mailspooler_list, connection, MAILSPOOLER_MAX_RATE)
+    except Exception as exc:
+        logger.error("Mail connection failure - %s" % exc)
+        (sent_id_list, retry_id_list, failure_id_list) = ([], [], [])
+
+    # Update in bulk
+    if sent_id_list:
+        MailSpooler.objects.filter(id__in=sent_id_list).update(mailspooler_type=MAILSPOOLER_TYPE.SENT)
+    if failure_id_list:
+        MailSpooler.objects.filter(id__in=failure_id_list).update(mailspooler_type=MAILSPOOLER_TYPE.FAILURE)
+    if retry_id_list:
+        MailSpooler.objects.filter(id__in=retry_id_list, num_attempt__gte=MAILSPOOLER_MAX_ATTEMPT - 1)\
+            .update(mailspooler_type=MAILSPOOLER_TYPE.FAILURE, num_attempt=F('num_attempt') + 1)
+        MailSpooler.objects.filter(id__in=retry_id_list, mailspooler_type=MAILSPOOLER_TYPE.IN_PROCESS)\
+            .update(mailspooler_type=MAILSPOOLER_TYPE.PENDING, num_attempt=F('num_attempt') + 1)
+    done_id_list = set(sent_id_list + retry_id_list + failure_id_list)
+    unsent_id_list = [obj.id for obj in mailspooler_list if obj.id not in done_id_list]
+    if unsent_id_list:
+        MailSpooler.objects.filter(id__in=unsent_id_list, mailspooler_type=MAILSPOOLER_TYPE.IN_PROCESS)\
+            .update(mailspooler_type=MAILSPOOLER_TYPE.PENDING)
+    logger.info("Mail Sent - #sent:%d #retry:%d #failure:%d #unsent:%d"
+                % (len(sent_id_list), len(retry_id_list), len(failure_id_list), len(unsent_id_list)))
+
 
 @task()
 def sendmail_task(current_mail_id):
@@ -47,26 +176,13 @@ def sendmail_task(current_mail_id):
         logger.info("ERROR :: Trying to send mail which is not set as IN_PROCESS")
         return False
 
-    mailtemplate = MailTemplate.objects.get(pk=current_mailspooler.mailtemplate.id)
-    #contact_email = current_mailspooler.contact.email
-
-    send_html_mail(
-        mailtemplate.subject,
-        mailtemplate.message_plaintext,
-        mailtemplate.message_html,
-        mailtemplate.from_email,
-        [current_mailspooler.contact_email],
-    )
-
-    current_mailspooler.mailspooler_type = MAILSPOOLER_TYPE.SENT
-    current_mailspooler.save()
-
-    logger.info("Mail Sent - ID:%d" % current_mailspooler.id)
+    sendmail_batch_task([current_mailspooler.id])
 
 
 class mailspooler_pending(PeriodicTask):
 
-    """A periodic task that spool mail that needs to be sent
+    """A periodic task that spool mail that needs to be sent, the pending mails
+    are claimed in bulk and sent as one batch
 
     **Usage**:
 
@@ -74,23 +190,66 @@ class mailspooler_pending(PeriodicTask):
     """
     run_every = timedelta(seconds=10)
 
-    @only_one(ikey="mailspooler_pending", timeout=LOCK_EXPIRE)
+    @lease_lock("mailspooler_pending")
     def run(self, **kwargs):
         logger.info("TASK :: mailspooler_pending")
+        if PAUSE_SEND:
+            logger.info("Sending mail is paused.")
+            return False
 
-        try:
-            list_pending_mail = MailSpooler.objects.filter(mailspooler_type=MAILSPOOLER_TYPE.PENDING)[:50]
-            logger.info("Check for pending Mail...")
-        except MailSpooler.DoesNotExist:
-            logger.info("MailSpooler doesn't exist!")
+        mailspooler_id_list = claim_pending_mailspooler(MAILSPOOLER_BATCH_SIZE)
+        if not mailspooler_id_list:
+            logger.info("No pending Mail")
             return False
 
-        for current_mailspooler in list_pending_mail:
-            # To avoid duplicate sending
-            current_mailspooler.mailspooler_type = MAILSPOOLER_TYPE.IN_PROCESS  # In Process
-            current_mailspooler.save()
-            logger.info("Calling Task to send MAIL!")
-            sendmail_task.delay(current_mailspooler.id)
+        logger.info("Calling Task to send MAIL batch!")
+        sendmail_batch_task.delay(mailspooler_id_list)
+        return True
+
+
+@transaction.atomic
+def claim_pending_mailspooler(limit):
+    """Flag as IN_PROCESS up to limit pending mails, to avoid duplicate sending,
+    and return their ids. A mail attempted before waits MAILSPOOLER_RETRY_DELAY"""
+    current_time = now()
+    retry_time = current_time - timedelta(seconds=MAILSPOOLER_RETRY_DELAY)
+    mailspooler_id_list = list(MailSpooler.objects.select_for_update()
+                               .filter(Q(last_attempt_time__isnull=True) | Q(last_attempt_time__lte=retry_time),
+                                       mailspooler_type=MAILSPOOLER_TYPE.PENDING)
+                               .order_by('id').values_list('id', flat=True)[:limit])
+    if mailspooler_id_list:
+        MailSpooler.objects.filter(id__in=mailspooler_id_list)\
+            .update(mailspooler_type=MAILSPOOLER_TYPE.IN_PROCESS, last_attempt_time=current_time)
+    return mailspooler_id_list
+
+
+def release_stale_mailspooler(timeout=MAILSPOOLER_IN_PROCESS_TIMEOUT):
+    """Put back as PENDING the mails IN_PROCESS for more than timeout seconds,
+    their batch was lost, and return their count"""
+    stale_time = now() - timedelta(seconds=timeout)
+    return MailSpooler.objects\
+        .filter(Q(last_attempt_time__isnull=True) | Q(last_attempt_time__lte=stale_time),
+                mailspooler_type=MAILSPOOLER_TYPE.IN_PROCESS)\
+        .update(mailspooler_type=MAILSPOOLER_TYPE.PENDING)
+
+
+class mailspooler_release_stale(PeriodicTask):
+
+    """A periodic task that release the mails left IN_PROCESS by a lost batch
+
+    **Usage**:
+
+        mailspooler_release_stale.delay()
+    """
+    run_every = timedelta(minutes=5)
+
+    @lease_lock("mailspooler_release_stale")
+    def run(self, **kwargs):
+        logger.info("TASK :: mailspooler_release_stale")
+        count = release_stale_mailspooler()
+        if count:
+            logger.warning("%d stale mail(s) released" % count)
+        return count
 
 
 @periodic_task(run_every=timedelta(seconds=60))  # every 10 seconds
@@ -12,10 +12,35 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 
-# from django.test import TestCase
+from django.test import TestCase
 # from django.contrib.auth.models import User
 # from django.conf import settings
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
 from django_lets_go.utils import BaseAuthenticatedClient
+from mod_mailer.models import MailTemplate, MailSpooler
+from mod_mailer.constants import MAILSPOOLER_TYPE
+from mod_mailer.tasks import claim_pending_mailspooler, send_mailspooler, \
+    sendmail_batch_task, release_stale_mailspooler
+from mod_mailer import tasks
+import smtplib
+
+
+class RefusedEmailBackend(BaseEmailBackend):
+
+    """Mail backend answering the mails with a 4xx reply"""
+
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPDataError(451, 'Try again later')
+
+
+class UnreachableEmailBackend(RefusedEmailBackend):
+
+    """Mail backend failing to connect"""
+
+    def open(self):
+        raise smtplib.SMTPConnectError(421, 'Service not available')
 
 
 class ModMailerAdminView(BaseAuthenticatedClient):
@@ -56,3 +81,64 @@ class ModMailerAdminView(BaseAuthenticatedClient):
                   'parameter': '', 'mailspooler_type': '1'},
             follow=True)
         self.assertEqual(response.status_code, 200)
+
+
+class ModMailerSpoolerTestCase(TestCase):
+
+    """Test cases for the batch sending of the MailSpooler"""
+
+    def setUp(self):
+        self.mailtemplate = MailTemplate.objects.create(
+            label='test', template_key='template_key_xyz', from_email='xyz@gmail.com',
+            from_name='xyz', subject='sample_template', message_plaintext='test msg',
+            message_html='<b>test msg</b>')
+        for i in range(5):
+            MailSpooler.objects.create(mailtemplate=self.mailtemplate,
+                                       contact_email='contact%d@example.com' % i)
+
+    def test_send_mailspooler(self):
+        """Test that a claimed batch is sent over one connection"""
+        mailspooler_id_list = claim_pending_mailspooler(3)
+        self.assertEqual(len(mailspooler_id_list), 3)
+        self.assertEqual(MailSpooler.objects.filter(mailspooler_type=MAILSPOOLER_TYPE.PENDING).count(), 2)
+
+        connection = get_connection(backend='django.core.mail.backends.locmem.EmailBackend')
+        mailspooler_list = MailSpooler.objects.select_related('mailtemplate').filter(id__in=mailspooler_id_list)
+        (sent_id_list, retry_id_list, failure_id_list) = send_mailspooler(mailspooler_list, connection)
+        self.assertEqual(sorted(sent_id_list), sorted(mailspooler_id_list))
+        self.assertEqual(retry_id_list, [])
+        self.assertEqual(failure_id_list, [])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].subject, 'sample_template')
+
+    def test_sendmail_batch_task_retry(self):
+        """Test that transient failures are deferred then set as FAILURE"""
+        backend = tasks.MAILSPOOLER_EMAIL_BACKEND
+        tasks.MAILSPOOLER_EMAIL_BACKEND = 'mod_mailer.tests.UnreachableEmailBackend'
+        try:
+            mailspooler_id_list = claim_pending_mailspooler(5)
+            sendmail_batch_task(mailspooler_id_list)
+            # the batch couldn't connect, the mails are pending without attempt
+            self.assertEqual(MailSpooler.objects.filter(
+                mailspooler_type=MAILSPOOLER_TYPE.PENDING, num_attempt=0).count(), 5)
+            # and wait for MAILSPOOLER_RETRY_DELAY
+            self.assertEqual(claim_pending_mailspooler(5), [])
+
+            tasks.MAILSPOOLER_EMAIL_BACKEND = 'mod_mailer.tests.RefusedEmailBackend'
+            MailSpooler.objects.update(last_attempt_time=None, num_attempt=tasks.MAILSPOOLER_MAX_ATTEMPT - 2)
+            sendmail_batch_task(claim_pending_mailspooler(5))
+            self.assertEqual(MailSpooler.objects.filter(mailspooler_type=MAILSPOOLER_TYPE.PENDING).count(), 5)
+            MailSpooler.objects.update(last_attempt_time=None)
+            sendmail_batch_task(claim_pending_mailspooler(5))
+            self.assertEqual(MailSpooler.objects.filter(
+                mailspooler_type=MAILSPOOLER_TYPE.FAILURE, num_attempt=tasks.MAILSPOOLER_MAX_ATTEMPT).count(), 5)
+        finally:
+            tasks.MAILSPOOLER_EMAIL_BACKEND = backend
+
+    def test_release_stale_mailspooler(self):
+        """Test that the mails of a lost batch are released"""
+        mailspooler_id_list = claim_pending_mailspooler(3)
+        self.assertEqual(release_stale_mailspooler(), 0)
+        self.assertEqual(release_stale_mailspooler(timeout=-1), 3)
+        self.assertEqual(MailSpooler.objects.filter(
+            id__in=mailspooler_id_list, mailspooler_type=MAILSPOOLER_TYPE.PENDING).count(), 3)
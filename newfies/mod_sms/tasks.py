@@ -17,7 +17,7 @@ from django.conf import settings
 from celery.task import PeriodicTask
 from celery.task import Task
 from celery.decorators import task
-from django_lets_go.only_one_task import only_one
+from mod_utils.lease_lock import lease_lock
 from celery.utils.log import get_task_logger
 from sms.tasks import SendMessage
 from mod_sms.models import SMSCampaign, SMSCampaignSubscriber, SMSMessage
@@ -28,7 +28,6 @@ from django.utils.timezone import utc
 from math import ceil
 
 logger = get_task_logger(__name__)
-LOCK_EXPIRE = 60 * 10 * 1  # Lock expires in 10 minutes
 DIV_MIN = 10  # This will divide the minutes by that value and allow to not wait too long for the calls
 
 
@@ -45,14 +44,21 @@ def get_sms_maxretry(sms_campaign):
 
 
 @task()
-def init_smsrequest(obj_subscriber, obj_sms_campaign):
+def init_smsrequest(subscriber_id):
     """This task outbounds the call
 
     **Attributes**:
 
-        * ``obj_subscriber`` - SMSCampaignSubscriber object
-        * ``user`` - User object
+        * ``subscriber_id`` - SMSCampaignSubscriber ID, its SMSCampaign is
+          read with it
     """
+    try:
+        obj_subscriber = SMSCampaignSubscriber.objects\
+            .select_related('contact', 'sms_campaign', 'sms_campaign__user').get(id=subscriber_id)
+    except SMSCampaignSubscriber.DoesNotExist:
+        logger.error("[SMS_TASK] Cannot find SMSCampaignSubscriber %s" % subscriber_id)
+        return False
+    obj_sms_campaign = obj_subscriber.sms_campaign
     logger.info("[SMS_TASK] init_smsrequest contact:%s" % obj_subscriber.contact.contact)
 
     maxretry = get_sms_maxretry(obj_sms_campaign)
@@ -94,7 +100,7 @@ def init_smsrequest(obj_subscriber, obj_sms_campaign):
 # TODO: Put a priority on this task
 class check_sms_campaign_pendingcall(Task):
 
-    @only_one(ikey="check_sms_campaign_pendingcall", timeout=LOCK_EXPIRE)
+    @lease_lock("check_sms_campaign_pendingcall-{sms_campaign_id}")
     def run(self, sms_campaign_id):
         """This will execute the outbound calls in the sms_campaign
 
@@ -162,7 +168,7 @@ class check_sms_campaign_pendingcall(Task):
 
             # Send sms through init_smsrequest
             init_smsrequest.apply_async(
-                args=[elem_camp_subscriber, obj_sms_campaign],
+                args=[elem_camp_subscriber.id],
                 countdown=second_towait)
 
         return True
@@ -184,7 +190,7 @@ class spool_sms_nocampaign(PeriodicTask):
     # of calls per minute. Cons : new calls might delay 60seconds
     # run_every = timedelta(seconds=60)
 
-    @only_one(ikey="spool_sms_nocampaign", timeout=LOCK_EXPIRE)
+    @lease_lock("spool_sms_nocampaign")
     def run(self, **kwargs):
         # start_from = datetime.utcnow().replace(tzinfo=utc)
         # list_sms = SMSMessage.objects.filter(delivery_date__lte=start_from, status='Unsent', sms_campaign__isnull=True)
@@ -220,8 +226,7 @@ class sms_campaign_running(PeriodicTask):
         for sms_campaign in SMSCampaign.objects.get_running_sms_campaign():
             logger.info("[SMS_TASK] => Found SMS Campaign name %s (id:%s)" % (sms_campaign.name,
                                                                               sms_campaign.id))
-            keytask = 'check_sms_campaign_pendingcall-%d' % (sms_campaign.id)
-            check_sms_campaign_pendingcall.delay(sms_campaign.id, keytask=keytask)
+            check_sms_campaign_pendingcall.delay(sms_campaign.id)
 
 
 # !!! USED
@@ -234,7 +239,7 @@ class SMSImportPhonebook(Task):
 
         SMSImportPhonebook.delay(campaign_id, phonebook_id)
     """
-    @only_one(ikey="import_phonebook", timeout=LOCK_EXPIRE)
+    @lease_lock("sms_import_phonebook-{campaign_id}-{phonebook_id}")
     def run(self, campaign_id, phonebook_id):
         """
         Read all the contact from phonebook_id and insert into subscriber
@@ -314,8 +319,7 @@ def sms_collect_subscriber(campaign_id):
         if not str(phonebook_id) in obj_campaign.imported_phonebook.split(','):
             # Run import
             logger.info("[SMS_TASK] SMS ImportPhonebook %d for campaign = %d" % (phonebook_id, campaign_id))
-            keytask = 'sms_import_phonebook-%d-%d' % (campaign_id, phonebook_id)
-            SMSImportPhonebook().delay(obj_campaign.id, phonebook_id, keytask=keytask)
+            SMSImportPhonebook().delay(obj_campaign.id, phonebook_id)
 
     return True
 
@@ -372,7 +376,7 @@ class sms_campaign_expire_check(PeriodicTask):
     # of calls per minute. Cons : new calls might delay 60seconds
     run_every = timedelta(seconds=60)
 
-    @only_one(ikey="sms_campaign_expire_check", timeout=LOCK_EXPIRE)
+    @lease_lock("sms_campaign_expire_check")
     def run(self, **kwargs):
         logger.info("[SMS_TASK] TASK :: sms_campaign_expire_check")
         for sms_campaign in SMSCampaign.objects.get_expired_sms_campaign():
@@ -391,7 +395,7 @@ class resend_sms_update_smscampaignsubscriber(PeriodicTask):
     """
     run_every = timedelta(seconds=60)
 
-    @only_one(ikey="resend_sms_update_smscampaignsubscriber", timeout=LOCK_EXPIRE)
+    @lease_lock("resend_sms_update_smscampaignsubscriber")
     def run(self, **kwargs):
         logger.warning("[SMS_TASK] TASK :: RESEND sms")
 
@@ -324,9 +324,8 @@ class SMSCeleryTaskTestCase(TestCase):
     def test_init_smsrequest(self):
         """Test that the ``init_smsrequest``
         task runs with no errors, and returns the correct result."""
-        sms_campaign_obj = SMSCampaign.objects.get(pk=1)
         sms_campaign_subscriber_obj = SMSCampaignSubscriber.objects.get(pk=1)
-        result = init_smsrequest.delay(sms_campaign_subscriber_obj, sms_campaign_obj)
+        result = init_smsrequest.delay(sms_campaign_subscriber_obj.id)
         self.assertEqual(result.successful(), True)
 
     def test_check_sms_campaign_pendingcall(self):
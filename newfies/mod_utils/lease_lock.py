@@ -0,0 +1,243 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Redis lease locks of the celery tasks, shared by all the nodes using the
+redis of LOCK_REDIS_URL
+
+A lease lasts LOCK_TTL seconds and is renewed every third of it while the
+task runs, so the lock of a crashed worker is freed after a few seconds.
+Each lease gets a fencing token greater than the tokens of all the previous
+leases of the key, a holder whose lease expired (paused process, lost
+redis connection) finds out with ``lease_is_current`` before a write::
+
+    class pending_call_processing(Task):
+
+        @lease_lock('pending_call_processing-{campaign_id}')
+        def run(self, campaign_id):
+            ...
+            if not lease_is_current():
+                return False
+
+The key is formatted with the arguments of the task, as the ``only_one``
+decorator it replaces a ``keytask`` argument overrides it.
+"""
+
+from django.conf import settings
+from mod_utils.metrics import observe
+from inspect import getcallargs
+from functools import wraps
+from time import time, sleep
+import threading
+import logging
+
+logger = logging.getLogger('newfies.filelog')
+
+LOCK_REDIS_URL = getattr(settings, 'LOCK_REDIS_URL', 'redis://localhost:6379/0')
+LOCK_TTL = getattr(settings, 'LOCK_TTL', 30)
+
+# Set the lease if free, its value is the next fencing token of the key
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_client = None
+_local = threading.local()
+
+
+def get_redis_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.StrictRedis.from_url(LOCK_REDIS_URL)
+    return _client
+
+
+class LeaseLock(object):
+
+    """
+    Lease on a key, renewed in a thread while it is held
+
+    **Attributes**:
+
+        * ``name`` - name of the lock in the metrics, the key without the ids
+        * ``token`` - fencing token of the lease, None when not held
+        * ``lost`` - the lease could not be renewed
+    """
+
+    def __init__(self, key, ttl=LOCK_TTL, name=None, client=None, renew=True):
+        self.key = 'lease_lock:%s' % key
+        self.fence_key = 'lease_fence:%s' % key
+        self.name = name or key
+        self.ttl = ttl
+        self.renew_lease = renew
+        self.client = client or get_redis_client()
+        self.token = None
+        self.lost = False
+        self.timer = None
+        self.acquired_at = None
+        self.renewed_at = None
+
+    def acquire(self, blocking=False, timeout=None):
+        """Return True once the lease is held, wait for it if blocking"""
+        start = time()
+        while True:
+            token = self.client.eval(ACQUIRE_SCRIPT, 2, self.key, self.fence_key, int(self.ttl * 1000))
+            if token:
+                break
+            if not blocking or (timeout is not None and time() - start >= timeout):
+                observe('lock_wait', time() - start, lock=self.name, outcome='busy')
+                return False
+            sleep(0.1)
+        self.token = int(token)
+        self.lost = False
+        self.acquired_at = self.renewed_at = time()
+        observe('lock_wait', self.acquired_at - start, lock=self.name, outcome='acquired')
+        if self.renew_lease:
+            self.schedule_renewal()
+        return True
+
+    def schedule_renewal(self):
+        self.timer = threading.Timer(self.ttl / 3.0, self.renew_loop)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def renew_loop(self):
+        if self.token is None:
+            return
+        if self.renew():
+            self.schedule_renewal()
+        elif time() - self.renewed_at < self.ttl:
+            # redis unreachable, retry while the lease may still be ours
+            self.schedule_renewal()
+        else:
+            self.lost = True
+            logger.error("Lease lock %s lost (token %d)" % (self.key, self.token))
+
+    def renew(self):
+        """Extend the lease, False if it is no longer ours"""
+        try:
+            renewed = self.client.eval(RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000))
+        except Exception as e:
+            logger.warning("Lease lock %s renewal failed: %s" % (self.key, e))
+            return False
+        if not renewed:
+            self.lost = True
+            return False
+        self.renewed_at = time()
+        return True
+
+    def release(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.token is None:
+            return
+        try:
+            self.client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+        finally:
+            observe('lock_hold', time() - self.acquired_at, lock=self.name)
+            self.token = None
+
+    def is_current(self):
+        """Fencing check, False once the lease expired or a newer holder got it"""
+        if self.token is None or self.lost:
+            return False
+        value = self.client.get(self.key)
+        return value is not None and int(value) == self.token
+
+
+def get_lease_stack():
+    stack = getattr(_local, 'lease_stack', None)
+    if stack is None:
+        stack = _local.lease_stack = []
+    return stack
+
+
+def current_lease():
+    """Innermost lease held by the thread"""
+    stack = get_lease_stack()
+    return stack[-1] if stack else None
+
+
+def lease_is_current():
+    """Fencing check of the task holding a lease, True outside of a lease"""
+    lease = current_lease()
+    if lease is None or lease.is_current():
+        return True
+    logger.error("Stale lease lock %s (token %s), stopping" % (lease.key, lease.token))
+    return False
+
+
+def format_lock_key(ikey, func, args, kwargs):
+    """
+    Format the key with the arguments of the call
+
+    >>> def run(self, campaign_id): pass
+    >>> format_lock_key('pending_call_processing-{campaign_id}', run, (None, 12), {})
+    'pending_call_processing-12'
+    """
+    if '{' not in ikey:
+        return ikey
+    while hasattr(func, '__wrapped__'):
+        func = func.__wrapped__
+    return ikey.format(**getcallargs(func, *args, **kwargs))
+
+
+def lease_lock(ikey, ttl=LOCK_TTL):
+    """
+    Run the task only if no other worker holds the lease of the key,
+    return None without running it otherwise
+    """
+    name = ikey.split('{')[0].rstrip('-_')
+
+    def _dec(run_func):
+
+        @wraps(run_func)
+        def _caller(*args, **kwargs):
+            key = kwargs.pop('keytask', None) or format_lock_key(ikey, run_func, args, kwargs)
+            lease = LeaseLock(key, ttl, name=name)
+            if not lease.acquire():
+                logger.debug("Lease lock %s busy, skipping" % key)
+                return None
+            stack = get_lease_stack()
+            stack.append(lease)
+            try:
+                return run_func(*args, **kwargs)
+            finally:
+                stack.pop()
+                lease.release()
+        _caller.__wrapped__ = run_func
+        return _caller
+
+    return _dec
@@ -0,0 +1,347 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Per-stage timing & query instrumentation of the dialer
+
+A span measures the wall time & the number of queries of a stage, tagged
+with its outcome::
+
+    @task(ignore_result=True)
+    @span('init_callrequest')
+    def init_callrequest(callrequest_id, ...):
+        ...
+        tag_span(outcome='bad_phonenumber')
+
+    with span('spool_subscriber') as sp:
+        ...
+        sp.tag(outcome='empty')
+
+The spans are aggregated in the registry of the process and flushed every
+METRICS_FLUSH_INTERVAL seconds to redis, where the /metrics/ endpoint reads
+them in the Prometheus text format, and to statsd if METRICS_STATSD is set.
+With METRICS_ENABLED = False the span decorator returns the function as is.
+"""
+
+from django.conf import settings
+from functools import wraps
+from time import time
+import threading
+import socket
+import atexit
+import logging
+
+logger = logging.getLogger('newfies.filelog')
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', False)
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+METRICS_REDIS_URL = getattr(settings, 'METRICS_REDIS_URL', 'redis://localhost:6379/0')
+METRICS_REDIS_KEY = 'newfies_metrics'
+# (host, port) of the statsd daemon
+METRICS_STATSD = getattr(settings, 'METRICS_STATSD', None)
+METRICS_STATSD_PREFIX = getattr(settings, 'METRICS_STATSD_PREFIX', 'newfies')
+
+# Upper bounds in seconds of the duration histogram
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+# Max durations of a span kept between two flushes for statsd
+MAX_SAMPLES = 100
+
+METRIC_HELP = (
+    ('newfies_span_seconds', 'histogram', 'Duration of the dialer stages'),
+    ('newfies_span_queries_total', 'counter', 'Queries run by the dialer stages'),
+)
+
+_local = threading.local()
+
+
+def get_query_count():
+    """Number of queries run by the thread since the query counter was installed"""
+    return getattr(_local, 'query_count', 0)
+
+
+def install_query_counter():
+    """Count the queries of each thread, spans read the counter on enter & exit"""
+    from django.db.backends.utils import CursorWrapper
+    if getattr(CursorWrapper, 'query_counter_installed', False):
+        return
+    execute = CursorWrapper.execute
+    executemany = CursorWrapper.executemany
+
+    def counted_execute(self, sql, params=None):
+        _local.query_count = getattr(_local, 'query_count', 0) + 1
+        return execute(self, sql, params)
+
+    def counted_executemany(self, sql, param_list):
+        _local.query_count = getattr(_local, 'query_count', 0) + 1
+        return executemany(self, sql, param_list)
+
+    CursorWrapper.execute = counted_execute
+    CursorWrapper.executemany = counted_executemany
+    CursorWrapper.query_counter_installed = True
+
+
+def format_labels(**labels):
+    """
+    Format the labels of a Prometheus sample
+
+    >>> format_labels(span='dial_out', outcome='error')
+    '{outcome="error",span="dial_out"}'
+    """
+    return '{%s}' % ','.join(['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for (name, value) in sorted(labels.items())])
+
+
+def format_bucket(le):
+    return '+Inf' if le == float('inf') else repr(le)
+
+
+class MetricsRegistry(object):
+
+    """
+    Spans observed by the process since the last flush
+
+    **Attributes**:
+
+        * ``pending`` - (name, tags) => count, seconds, queries, buckets & samples
+        * ``exporter_list`` - exporters receiving the pending spans on flush
+    """
+
+    def __init__(self, buckets=SPAN_BUCKETS, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.last_flush = time()
+        self.exporter_list = []
+
+    def observe(self, name, tags, seconds, queries=0):
+        key = (name, tuple(sorted(tags.items())))
+        with self.lock:
+            stat = self.pending.get(key)
+            if stat is None:
+                stat = self.pending[key] = {
+                    'count': 0, 'seconds': 0.0, 'queries': 0,
+                    'buckets': [0] * len(self.buckets), 'samples': []}
+            stat['count'] += 1
+            stat['seconds'] += seconds
+            stat['queries'] += queries
+            for (i, le) in enumerate(self.buckets):
+                if seconds <= le:
+                    stat['buckets'][i] += 1
+            if len(stat['samples']) < MAX_SAMPLES:
+                stat['samples'].append(seconds)
+            flush = time() - self.last_flush >= self.flush_interval
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Hand the pending spans to the exporters"""
+        with self.lock:
+            (pending, self.pending) = (self.pending, {})
+            self.last_flush = time()
+        if not pending:
+            return
+        for exporter in self.exporter_list:
+            try:
+                exporter.export(pending, self.buckets)
+            except Exception as e:
+                logger.warning("Metrics export to %s failed: %s" % (exporter.__class__.__name__, e))
+
+
+class RedisExporter(object):
+
+    """Add the spans to the cumulative samples stored in a redis hash"""
+
+    def __init__(self, url=METRICS_REDIS_URL, key=METRICS_REDIS_KEY):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.key = key
+
+    def export(self, pending, buckets):
+        pipe = self.client.pipeline(transaction=False)
+        for ((name, tags), stat) in pending.items():
+            labels = dict(tags, span=name)
+            pipe.hincrbyfloat(self.key, 'newfies_span_seconds_sum%s' % format_labels(**labels), stat['seconds'])
+            pipe.hincrby(self.key, 'newfies_span_seconds_count%s' % format_labels(**labels), stat['count'])
+            pipe.hincrby(self.key, 'newfies_span_queries_total%s' % format_labels(**labels), stat['queries'])
+            for (le, count) in zip(buckets, stat['buckets']):
+                pipe.hincrby(self.key, 'newfies_span_seconds_bucket%s' %
+                             format_labels(le=format_bucket(le), **labels), count)
+        pipe.execute()
+
+    def collect(self):
+        """Return the samples of all the processes, sample => value"""
+        return self.client.hgetall(self.key)
+
+
+class StatsdExporter(object):
+
+    """Send the spans to statsd over UDP, tags are appended to the metric name"""
+
+    max_packet_size = 512
+
+    def __init__(self, host, port, prefix=METRICS_STATSD_PREFIX):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format(self, pending):
+        line_list = []
+        for ((name, tags), stat) in pending.items():
+            metric = '.'.join([self.prefix, 'span', name] + [str(value) for (tag, value) in tags])
+            rate = float(len(stat['samples'])) / stat['count']
+            for seconds in stat['samples']:
+                if rate < 1:
+                    line_list.append('%s.duration:%.3f|ms|@%.4f' % (metric, seconds * 1000, rate))
+                else:
+                    line_list.append('%s.duration:%.3f|ms' % (metric, seconds * 1000))
+            line_list.append('%s.queries:%d|c' % (metric, stat['queries']))
+        return line_list
+
+    def export(self, pending, buckets):
+        packet = ''
+        for line in self.format(pending):
+            if packet and len(packet) + len(line) + 1 > self.max_packet_size:
+                self.sock.sendto(packet.encode('utf-8'), self.address)
+                packet = ''
+            packet = '%s\n%s' % (packet, line) if packet else line
+        if packet:
+            self.sock.sendto(packet.encode('utf-8'), self.address)
+
+
+registry = MetricsRegistry()
+redis_exporter = None
+
+
+def setup_metrics():
+    """Install the query counter & the exporters of the registry"""
+    global redis_exporter
+    install_query_counter()
+    redis_exporter = RedisExporter()
+    registry.exporter_list.append(redis_exporter)
+    if METRICS_STATSD:
+        registry.exporter_list.append(StatsdExporter(*METRICS_STATSD))
+    atexit.register(registry.flush)
+
+
+def get_span_stack():
+    stack = getattr(_local, 'span_stack', None)
+    if stack is None:
+        stack = _local.span_stack = []
+    return stack
+
+
+class span(object):
+
+    """
+    Measure a stage of the dialer, as a context manager or a decorator
+
+    The outcome tag defaults to 'success', or 'error' if an exception is raised
+    """
+
+    def __init__(self, name, **tags):
+        self.name = name
+        self.tags = tags
+        self.start = None
+        self.query_start = 0
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            get_span_stack().append(self)
+            self.query_start = get_query_count()
+            self.start = time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is None:
+            return False
+        seconds = time() - self.start
+        get_span_stack().pop()
+        if exc_type is not None:
+            self.tags['outcome'] = 'error'
+        self.tags.setdefault('outcome', 'success')
+        registry.observe(self.name, self.tags, seconds, get_query_count() - self.query_start)
+        return False
+
+    def __call__(self, func):
+        if not METRICS_ENABLED:
+            return func
+        (name, tags) = (self.name, self.tags)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **tags):
+                return func(*args, **kwargs)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+
+def observe(name, seconds, **tags):
+    """Record a duration measured outside of a span"""
+    if METRICS_ENABLED:
+        registry.observe(name, tags, seconds)
+
+
+def tag_span(**tags):
+    """Tag the innermost span of the thread"""
+    if METRICS_ENABLED:
+        stack = getattr(_local, 'span_stack', None)
+        if stack:
+            stack[-1].tags.update(tags)
+
+
+def render_prometheus(samples):
+    """
+    Render the samples in the Prometheus text format, grouped by metric
+
+    >>> print(render_prometheus({'newfies_span_queries_total{span="dial_out"}': '3'}))
+    # HELP newfies_span_queries_total Queries run by the dialer stages
+    # TYPE newfies_span_queries_total counter
+    newfies_span_queries_total{span="dial_out"} 3
+    <BLANKLINE>
+    """
+    line_list = []
+    for (metric, metric_type, help_text) in METRIC_HELP:
+        sample_list = sorted([sample for sample in samples
+                              if sample.split('{', 1)[0] in (metric, metric + '_sum', metric + '_count',
+                                                             metric + '_bucket')])
+        if not sample_list:
+            continue
+        line_list.append('# HELP %s %s' % (metric, help_text))
+        line_list.append('# TYPE %s %s' % (metric, metric_type))
+        for sample in sample_list:
+            line_list.append('%s %s' % (sample, samples[sample]))
+    return '\n'.join(line_list) + '\n'
+
+
+def get_metrics_text():
+    """Flush the registry of this process & return the metrics of all the processes"""
+    if not METRICS_ENABLED:
+        return ''
+    registry.flush()
+    samples = {}
+    for (sample, value) in redis_exporter.collect().items():
+        if isinstance(sample, bytes):
+            sample = sample.decode('utf-8')
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        samples[sample] = value
+    return render_prometheus(samples)
+
+
+if METRICS_ENABLED:
+    setup_metrics()
@@ -0,0 +1,212 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Pagination of the large lists (subscribers, contacts, CDRs)
+
+A list sorted on one of its indexed columns is paged with keyset pagination,
+each page seeks after the sort key of the last row of the previous one
+(``?cursor=...``) instead of an OFFSET, other sorts keep the OFFSET pages.
+
+On PostgreSQL a list is counted with the estimate of the planner, the exact
+COUNT(*) only runs below PAGINATION_ESTIMATE_THRESHOLD rows or when asked
+for with ``?exact_count=1``::
+
+    list_page = paginate_list(request, subscriber_list, pag_vars, keyset_fields=('id', 'updated_date'))
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from datetime import datetime
+import base64
+import json
+
+PAGINATION_ESTIMATE_THRESHOLD = getattr(settings, 'PAGINATION_ESTIMATE_THRESHOLD', 100000)
+
+
+def estimate_count(queryset):
+    """
+    Number of rows of the queryset estimated by the PostgreSQL planner,
+    pg_class.reltuples for a whole table, None on the other databases
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    cursor = connection.cursor()
+    if not queryset.query.where:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+    (sql, params) = queryset.order_by().query.sql_with_params()
+    cursor.execute("EXPLAIN (FORMAT JSON) %s" % sql, params)
+    plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_list_count(queryset, exact=False, threshold=PAGINATION_ESTIMATE_THRESHOLD):
+    """Return (count, estimated), the estimate is used above threshold rows"""
+    if not exact:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate > threshold:
+            return (estimate, True)
+    return (QuerySet.count(queryset), False)
+
+
+class EstimatedCountQuerySet(QuerySet):
+
+    """QuerySet counted with get_list_count, for the admin changelists"""
+
+    def count(self):
+        return get_list_count(self)[0]
+
+
+def estimated_count_queryset(queryset):
+    return queryset._clone(klass=EstimatedCountQuerySet)
+
+
+def get_row_value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def encode_cursor(sort_order, row, direction):
+    value = get_row_value(row, sort_order.lstrip('-'))
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    data = json.dumps([sort_order, value, get_row_value(row, 'id'), direction])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort_order, model):
+    """Return (value, id, direction) of the cursor, None if invalid or of another sort"""
+    try:
+        (cursor_sort_order, value, pk, direction) = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+        if cursor_sort_order != sort_order or direction not in ('next', 'previous'):
+            return None
+        return (model._meta.get_field(sort_order.lstrip('-')).to_python(value), int(pk), direction)
+    except Exception:
+        return None
+
+
+class ListPage(object):
+
+    """
+    A page of a list
+
+    **Attributes**:
+
+        * ``object_list`` - rows of the page
+        * ``number`` - page number, for display
+        * ``count`` - rows of the list, estimated if ``count_estimated``
+        * ``keyset`` - the page was sought with keyset pagination
+        * ``next_query`` / ``previous_query`` - query strings of the adjacent pages
+        * ``exact_count_query`` - query string of the page with the exact count
+    """
+
+    def __init__(self, request, object_list, number, count, count_estimated, keyset,
+                 next_cursor=None, previous_cursor=None, has_next=False, has_previous=False):
+        self.object_list = object_list
+        self.number = number
+        self.count = count
+        self.count_estimated = count_estimated
+        self.keyset = keyset
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_query = self.build_query(request, number + 1, next_cursor) if has_next else ''
+        self.previous_query = self.build_query(request, number - 1, previous_cursor) if has_previous else ''
+        self.exact_count_query = self.build_query(request, number, request.GET.get('cursor'), exact_count=1)
+
+    def build_query(self, request, number, cursor=None, **extra):
+        query = request.GET.copy()
+        for key in ('page', 'cursor', 'exact_count'):
+            query.pop(key, None)
+        query['page'] = str(max(number, 1))
+        if cursor:
+            query['cursor'] = cursor
+        for (key, value) in extra.items():
+            query[key] = str(value)
+        return query.urlencode()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate_list(request, queryset, pag_vars, keyset_fields=(), count=None):
+    """
+    Return the ListPage of the queryset for the pagination vars of the request
+
+    **Attributes**:
+
+        * ``pag_vars`` - sort_order, start_page & end_page of get_pagination_vars
+        * ``keyset_fields`` - indexed, not null sort fields paged with keyset pagination
+        * ``count`` - rows of the list when already known, not counted again
+    """
+    sort_order = pag_vars['sort_order']
+    sort_field = sort_order.lstrip('-')
+    page_size = pag_vars['end_page'] - pag_vars['start_page']
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        number = 1
+
+    count_estimated = False
+    if count is None:
+        (count, count_estimated) = get_list_count(queryset, exact=bool(request.GET.get('exact_count')))
+
+    if sort_field not in keyset_fields:
+        row_list = list(queryset.order_by(sort_order)[pag_vars['start_page']:pag_vars['end_page'] + 1])
+        return ListPage(request, row_list[:page_size], number, count, count_estimated, False,
+                        has_next=len(row_list) > page_size, has_previous=pag_vars['start_page'] > 0)
+
+    cursor = decode_cursor(request.GET.get('cursor'), sort_order, queryset.model) \
+        if request.GET.get('cursor') else None
+    if cursor is None:
+        number = 1
+    forward = cursor is None or cursor[2] == 'next'
+    descending = sort_order.startswith('-')
+    lookup = 'lt' if descending == forward else 'gt'
+    prefix = '-' if lookup == 'lt' else ''
+
+    if sort_field == 'id':
+        order_list = [prefix + 'id']
+    else:
+        order_list = [prefix + sort_field, prefix + 'id']
+    page_queryset = queryset.order_by(*order_list)
+    if cursor:
+        (value, pk) = cursor[:2]
+        if sort_field == 'id':
+            seek = Q(**{'id__%s' % lookup: pk})
+        else:
+            seek = Q(**{'%s__%s' % (sort_field, lookup): value}) | Q(**{sort_field: value, 'id__%s' % lookup: pk})
+        page_queryset = page_queryset.filter(seek)
+
+    row_list = list(page_queryset[:page_size + 1])
+    has_more = len(row_list) > page_size
+    row_list = row_list[:page_size]
+    if forward:
+        (has_next, has_previous) = (has_more, cursor is not None)
+    else:
+        row_list.reverse()
+        (has_next, has_previous) = (True, has_more)
+
+    next_cursor = encode_cursor(sort_order, row_list[-1], 'next') if row_list and has_next else None
+    previous_cursor = encode_cursor(sort_order, row_list[0], 'previous') if row_list and has_previous else None
+    return ListPage(request, row_list, number, count, count_estimated, True,
+                    next_cursor, previous_cursor, has_next, has_previous)
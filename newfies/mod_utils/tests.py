@@ -0,0 +1,116 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from mod_utils import metrics
+from mod_utils.lease_lock import LeaseLock, lease_lock, lease_is_current
+from time import sleep
+
+
+class MetricsTestCase(TestCase):
+
+    """Test the spans of the dialer stages"""
+
+    def setUp(self):
+        self.metrics_enabled = metrics.METRICS_ENABLED
+        self.registry = metrics.registry
+        metrics.METRICS_ENABLED = True
+        metrics.registry = metrics.MetricsRegistry(flush_interval=3600)
+        metrics.install_query_counter()
+
+    def tearDown(self):
+        metrics.METRICS_ENABLED = self.metrics_enabled
+        metrics.registry = self.registry
+
+    def test_span(self):
+        """Test the duration, queries & outcome recorded by nested spans"""
+        with metrics.span('init_callrequest'):
+            with metrics.span('dial_out') as sp:
+                User.objects.count()
+                sp.tag(outcome='failure')
+            metrics.tag_span(outcome='no_engine')
+        pending = metrics.registry.pending
+        stat = pending[('dial_out', (('outcome', 'failure'),))]
+        self.assertEqual(stat['count'], 1)
+        self.assertEqual(stat['queries'], 1)
+        self.assertEqual(stat['buckets'][-1], 1)
+        self.assertEqual(pending[('init_callrequest', (('outcome', 'no_engine'),))]['queries'], 1)
+
+        try:
+            with metrics.span('process_callevent'):
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertIn(('process_callevent', (('outcome', 'error'),)), pending)
+
+    def test_export(self):
+        """Test the Prometheus & statsd formats"""
+        metrics.registry.observe('dial_out', {'outcome': 'success'}, 0.02, 3)
+        statsd = metrics.StatsdExporter('127.0.0.1', 8125)
+        self.assertEqual(statsd.format(metrics.registry.pending),
+                         ['newfies.span.dial_out.success.duration:20.000|ms',
+                          'newfies.span.dial_out.success.queries:3|c'])
+        text = metrics.render_prometheus({
+            'newfies_span_seconds_count{outcome="success",span="dial_out"}': '1',
+            'newfies_span_queries_total{outcome="success",span="dial_out"}': '3',
+        })
+        self.assertIn('# TYPE newfies_span_seconds histogram\n'
+                      'newfies_span_seconds_count{outcome="success",span="dial_out"} 1\n', text)
+        self.assertIn('newfies_span_queries_total{outcome="success",span="dial_out"} 3\n', text)
+
+
+class LeaseLockTestCase(TestCase):
+
+    """Test the lease locks of the periodic tasks"""
+
+    def test_lease(self):
+        """Test a lease is exclusive, renewed & fenced"""
+        lease = LeaseLock('test_lease', ttl=1, renew=False)
+        other = LeaseLock('test_lease', ttl=1, renew=False)
+        self.assertTrue(lease.acquire())
+        self.assertFalse(other.acquire())
+        self.assertTrue(lease.is_current())
+        self.assertTrue(lease.renew())
+        token = lease.token
+        lease.release()
+
+        self.assertTrue(other.acquire())
+        self.assertGreater(other.token, token)
+        other.release()
+
+    def test_stale_lease(self):
+        """Test a holder whose lease expired is fenced off"""
+        lease = LeaseLock('test_stale_lease', ttl=0.2, renew=False)
+        self.assertTrue(lease.acquire())
+        sleep(0.3)
+        other = LeaseLock('test_stale_lease', ttl=1, renew=False)
+        self.assertTrue(other.acquire())
+        self.assertFalse(lease.is_current())
+        self.assertFalse(lease.renew())
+        lease.release()
+        self.assertTrue(other.is_current())
+        other.release()
+
+    def test_lease_lock(self):
+        """Test the decorator locks per key"""
+        @lease_lock('test_task-{campaign_id}')
+        def run(campaign_id, nested=None):
+            if nested:
+                return nested(campaign_id)
+            return lease_is_current()
+
+        self.assertTrue(run(1))
+        self.assertEqual(run(1, nested=run), None)
+        self.assertTrue(run(1, nested=lambda campaign_id: run(campaign_id + 1)))
@@ -0,0 +1,70 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
+
+
+def get_task_route(task_name):
+    """
+    Return the queue, routing key & priority of a task from
+    CELERY_TASK_QUEUE & CELERY_QUEUE_PRIORITY, None for the default queue
+    """
+    queue = getattr(settings, 'CELERY_TASK_QUEUE', {}).get(task_name)
+    if not queue:
+        return None
+    route = {
+        'queue': queue,
+        'routing_key': '%s.%s' % (queue, task_name.rsplit('.', 1)[-1]),
+    }
+    priority = getattr(settings, 'CELERY_QUEUE_PRIORITY', {}).get(queue)
+    if priority is not None:
+        route['priority'] = priority
+    return route
+
+
+class QueueRouter(object):
+
+    """Celery router sending each dialer task to the queue of its workload"""
+
+    def route_for_task(self, task, args=None, kwargs=None):
+        return get_task_route(task)
+
+
+def get_worker_argv(role, profile, loglevel='info'):
+    """
+    Return the arguments of the celery worker of a role
+
+    **Attributes**:
+
+        * ``profile`` - queues, concurrency or autoscale, prefetch, time_limit
+          & maxtasksperchild of the worker, see CELERY_WORKER_PROFILE
+    """
+    argv = [
+        '--queues=%s' % ','.join(profile['queues']),
+        '--hostname=%s@%%h' % role,
+        '--loglevel=%s' % loglevel,
+        '--time-limit=%d' % profile.get('time_limit', 300),
+        '--without-mingle',
+    ]
+    if profile.get('autoscale'):
+        argv.append('--autoscale=%s' % profile['autoscale'])
+    else:
+        argv.append('--concurrency=%d' % profile.get('concurrency', 4))
+    if profile.get('maxtasksperchild'):
+        argv.append('--maxtasksperchild=%d' % profile['maxtasksperchild'])
+    if profile.get('prefetch', 4) == 1:
+        # hand a task to a process only when it is free, not when the
+        # process already reserved one behind a long task
+        argv.append('-Ofair')
+    return argv
@@ -243,6 +243,7 @@ INSTALLED_APPS = (
     'django_nvd3',
     'rest_framework',
     'rest_framework.authtoken',
+    'apirest',
     'corsheaders',
     'djangobower',
     'activelink',
@@ -326,6 +327,9 @@ TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 # No of records per page
 # =======================
 PAGE_SIZE = 10
+# Above this number of rows, the large lists (subscribers, contacts, calls)
+# display the estimate of the PostgreSQL planner instead of a COUNT(*)
+PAGINATION_ESTIMATE_THRESHOLD = 100000
 
 # AUTH MODULE SETTINGS
 AUTH_PROFILE_MODULE = 'user_profile.UserProfile'
@@ -346,6 +350,19 @@ LOGIN_URL = '/accounts/login/'
 
 # REST FRAMEWORK
 # ==============
+# Rows of a page of the incremental syncs of the REST API (?cursor=),
+# the page_size parameter is capped at API_CURSOR_MAX_PAGE_SIZE
+API_CURSOR_PAGE_SIZE = 100
+API_CURSOR_MAX_PAGE_SIZE = 1000
+# The syncs list the rows updated over API_CURSOR_LAG seconds ago, the rows of
+# the transactions still running are not passed over by the cursor
+API_CURSOR_LAG = 60
+# The bulk endpoints process the requests of more than BULK_API_SYNC_LIMIT
+# items as jobs, their items & results are kept BULK_JOB_TTL seconds in the cache
+BULK_API_SYNC_LIMIT = 1000
+BULK_API_MAX_ITEMS = 100000
+BULK_JOB_TTL = 86400
+
 REST_FRAMEWORK = {
     # 'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAdminUser',),
     'PAGINATE_BY': 10,
@@ -394,7 +411,10 @@ CELERY_TASK_RESULT_EXPIRES = 18000  # 5 hours.
 # CELERY_REDIS_CONNECT_RETRY = True
 CELERY_TIMEZONE = 'Europe/Madrid'
 CELERY_ENABLE_UTC = True
-CELERY_ACCEPT_CONTENT = ['json', 'pickle']
+# The tasks take ids & primitive values, never model instances
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
 
 REDIS_DB = 0
 # REDIS_CONNECT_RETRY = True
@@ -410,23 +430,106 @@ CELERY_QUEUES = {
 }
 
 CELERY_DEFAULT_QUEUE = 'default'
-# Define list of Queues and their routing keys
+# Define list of Queues and their routing keys, each dialer workload has its
+# own queue so a burst of one of them doesn't delay the others:
+#  - dispatch: campaign heartbeat & originates
+#  - events: hangup events & CDRs
+#  - spool: contacts spooled into subscribers
+#  - alarms: appointment reminders
+#  - sms, mail: SMS campaigns & the mail spooler
+#  - bulk: long running jobs (audio transcode, TTS, imports, reports)
 CELERY_QUEUES = (
     Queue('default', routing_key='task.#'),
-    Queue('sms_tasks', routing_key='mod_sms.#'),
-    Queue('appointment', routing_key='appointment.#'),
+    Queue('dispatch', routing_key='dispatch.#'),
+    Queue('events', routing_key='events.#'),
+    Queue('spool', routing_key='spool.#'),
+    Queue('alarms', routing_key='alarms.#'),
+    Queue('sms', routing_key='sms.#'),
+    Queue('mail', routing_key='mail.#'),
+    Queue('bulk', routing_key='bulk.#'),
 )
 CELERY_DEFAULT_EXCHANGE = 'tasks'
 CELERY_DEFAULT_EXCHANGE_TYPE = 'topic'
 CELERY_DEFAULT_ROUTING_KEY = 'task.default'
 
-# python manage.py celeryd -EB -l info --purge --queue=sms_tasks
-# Define tasks and which queue they will use with their routing key
-CELERY_ROUTES = {
-    'mod_sms.tasks.sms_campaign_running': {
-        'queue': 'sms_tasks',
-        'routing_key': 'mod_sms.sms_campaign_running',
-    },
+# Priority of the tasks of each queue, from 0 to 9. With redis 0 is the
+# highest priority: a worker consuming several queues takes the dispatch &
+# events tasks first. Redis groups the priorities into the steps 0, 3, 6, 9
+CELERY_QUEUE_PRIORITY = {
+    'dispatch': 0,
+    'events': 0,
+    'alarms': 0,
+    'spool': 3,
+    'sms': 3,
+    'mail': 6,
+    'bulk': 9,
+}
+
+# Define tasks and which queue they will use
+CELERY_TASK_QUEUE = {
+    'dialer_campaign.tasks.campaign_running': 'dispatch',
+    'dialer_campaign.tasks.pending_call_processing': 'dispatch',
+    'dialer_cdr.tasks.callrequest_pending': 'dispatch',
+    'dialer_cdr.tasks.init_callrequest': 'dispatch',
+
+    'dialer_cdr.tasks.task_pending_callevent': 'events',
+    'dialer_cdr.tasks.process_callevent': 'events',
+    'dialer_cdr.tasks.update_callrequest': 'events',
+
+    'dialer_campaign.tasks.campaign_spool_contact': 'spool',
+    'dialer_campaign.tasks.campaign_expire_check': 'spool',
+    'dialer_contact.tasks.collect_subscriber': 'spool',
+    'dialer_contact.tasks.contact_outbox_flush': 'spool',
+    'apirest.tasks.bulk_api_job': 'spool',
+    'survey.tasks.survey_template_copy': 'spool',
+
+    'appointment.tasks.event_dispatcher': 'alarms',
+    'appointment.tasks.occurrence_index_refresh': 'alarms',
+    'appointment.tasks.alarm_dispatcher': 'alarms',
+    'appointment.tasks.alarm_queue_reconcile': 'alarms',
+    'appointment.tasks.perform_alarm': 'alarms',
+    'appointment.tasks.alarmrequest_dispatcher': 'alarms',
+
+    'mod_sms.tasks.init_smsrequest': 'sms',
+    'mod_sms.tasks.check_sms_campaign_pendingcall': 'sms',
+    'mod_sms.tasks.spool_sms_nocampaign': 'sms',
+    'mod_sms.tasks.sms_campaign_running': 'sms',
+    'mod_sms.tasks.sms_campaign_spool_contact': 'sms',
+    'mod_sms.tasks.sms_collect_subscriber': 'sms',
+    'mod_sms.tasks.sms_campaign_expire_check': 'sms',
+    'mod_sms.tasks.resend_sms_update_smscampaignsubscriber': 'sms',
+
+    'mod_mailer.tasks.sendmail_batch_task': 'mail',
+    'mod_mailer.tasks.sendmail_task': 'mail',
+    'mod_mailer.tasks.mailspooler_pending': 'mail',
+    'mod_mailer.tasks.mailspooler_release_stale': 'mail',
+    'mod_mailer.tasks.sendmail_pending': 'mail',
+    'mod_mailer.tasks.sendmail_retry_deferred': 'mail',
+
+    'mod_sms.tasks.SMSImportPhonebook': 'bulk',
+    'dialer_audio.tasks.audio_transcode': 'bulk',
+    'survey.tasks.prerender_survey_tts': 'bulk',
+    'survey.tasks.result_cube_update': 'bulk',
+}
+CELERY_ROUTES = ('newfies_dialer.celery_routes.QueueRouter', )
+
+# Worker of each role, start them with "python manage.py celery_worker <role>"
+# so the latency critical queues scale on their own workers, "all" consumes
+# every queue on a single host.
+#  - prefetch: tasks reserved by each process, 1 for the tasks that must
+#    not wait behind a slow one
+#  - concurrency or autoscale (max,min): number of processes
+CELERY_WORKER_PROFILE = {
+    'dispatch': {'queues': ['dispatch'], 'concurrency': 10, 'prefetch': 1},
+    'events': {'queues': ['events'], 'concurrency': 10, 'prefetch': 4},
+    'spool': {'queues': ['spool'], 'concurrency': 4, 'prefetch': 1},
+    'alarms': {'queues': ['alarms'], 'concurrency': 4, 'prefetch': 1},
+    'sms': {'queues': ['sms'], 'concurrency': 4, 'prefetch': 4},
+    'mail': {'queues': ['mail'], 'concurrency': 2, 'prefetch': 4},
+    'bulk': {'queues': ['bulk', 'default'], 'concurrency': 2, 'prefetch': 1,
+             'time_limit': 3600, 'maxtasksperchild': 20},
+    'all': {'queues': ['dispatch', 'events', 'alarms', 'spool', 'sms', 'mail', 'bulk', 'default'],
+            'autoscale': '10,2', 'prefetch': 1},
 }
 
 """
@@ -490,7 +593,24 @@ MAILER_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 # EMAIL_ADMIN will be used for forget password email sent
 EMAIL_ADMIN = 'newfies_admin@localhost.com'
 
+# MAIL SPOOLER
+# ============
+# Number of pending mails claimed every 10 seconds and sent over one connection
+MAILSPOOLER_BATCH_SIZE = 500
+# Max number of mails per second sent by a batch, 0 for no limit
+MAILSPOOLER_MAX_RATE = 0
+# Attempts of a mail failing with a transient SMTP error (4xx) before it is set as FAILURE
+MAILSPOOLER_MAX_ATTEMPT = 5
+# Seconds before a deferred mail, or a mail of a batch that couldn't connect, is sent again
+MAILSPOOLER_RETRY_DELAY = 600
+# Seconds after which a mail left IN_PROCESS by a lost batch is released as PENDING
+MAILSPOOLER_IN_PROCESS_TIMEOUT = 3600
+# To test against a local SMTP stand-in, run "python -m smtpd -n -c DebuggingServer localhost:1025"
+# and set EMAIL_HOST = 'localhost' & EMAIL_PORT = 1025
+MAILSPOOLER_EMAIL_BACKEND = MAILER_EMAIL_BACKEND
+
 # ADD 'dummy','plivo','twilio','esl'
+# 'fake' synthesizes the call events without FreeSWITCH (see load_harness)
 NEWFIES_DIALER_ENGINE = 'esl'
 
 # DIALER
@@ -505,6 +625,26 @@ HEARTBEAT_MIN = 1  # accepted value from 1 to 10
 # Delay outbound call of X seconds
 DELAY_OUTBOUND = 0
 
+# Retries are stored as pending Callrequests, every RETRY_DISPATCH_FREQ seconds
+# up to RETRY_DISPATCH_LIMIT of the due ones are dispatched
+RETRY_DISPATCH_FREQ = 5
+RETRY_DISPATCH_LIMIT = 1000
+# Call events read back by each process_callevent task
+CALLEVENT_BATCH = 50
+
+# The contacts of the phonebooks are imported into the subscribers of the
+# campaigns by chunks of SUBSCRIBER_SYNC_CHUNK contacts, the contacts created
+# in the last SUBSCRIBER_SYNC_LAG seconds are imported again by the next syncs
+# in case the imports still running commit contacts of lower ids
+SUBSCRIBER_SYNC_CHUNK = 10000
+SUBSCRIBER_SYNC_LAG = 60
+
+# The phonebooks of the new contacts are queued in the redis of
+# CONTACT_OUTBOX_REDIS_URL, their contacts are added to the subscribers of the
+# running campaigns every CONTACT_OUTBOX_FREQ seconds
+CONTACT_OUTBOX_REDIS_URL = 'redis://localhost:6379/0'
+CONTACT_OUTBOX_FREQ = 5
+
 # Audio Convertion
 # ================
 
@@ -518,6 +658,10 @@ FREQ_TYPE_VALUE = 8000
 # 0-Keep original, 1-Convert to MP3, 2-Convert to WAV, 3-Convert to OGG
 CONVERT_TYPE_VALUE = 2
 
+# Uploads are converted by the audio_transcode task, with up to
+# AUDIO_TRANSCODE_POOL_SIZE sox processes running at the same time
+AUDIO_TRANSCODE_POOL_SIZE = 4
+
 AUDIO_DEBUG = False
 
 # ESL
@@ -536,6 +680,15 @@ EARLY_MEDIA = "ignore_early_media=true"
 # ==============
 TTS_ENGINE = 'FLITE'  # FLITE, CEPSTRAL, ACAPELA, MSTRANSLATOR
 
+# TTS CACHE
+# Directory of the rendered audio, set it to the lua TTS_DIR
+# (/usr/share/newfies-lua/tts/) to let the calls use the pre-rendered audio
+TTS_CACHE_DIR = os.path.join(MEDIA_ROOT, 'tts')
+# Max size in bytes of the cache, the least recently used audio are removed
+TTS_CACHE_MAX_SIZE = 500 * 1024 * 1024
+# Number of scripts rendered at the same time when a survey is sealed
+TTS_PRERENDER_POOL_SIZE = 4
+
 # ACAPELA SPECIFIC SETTINGS
 ACCOUNT_LOGIN = 'EVAL_XXXX'
 APPLICATION_LOGIN = 'EVAL_XXXXXXX'
@@ -554,6 +707,26 @@ CLIENT_SECRET = 'YYYYYYYYYYYYYY'
 DIALERDEBUG = False
 DIALERDEBUG_PHONENUMBER = 1000
 
+# METRICS
+# =======
+# Duration, queries & outcome of the dialer stages, served on /metrics/ in
+# the Prometheus text format. Each process flushes its spans every
+# METRICS_FLUSH_INTERVAL seconds to redis, and to statsd if METRICS_STATSD is set
+METRICS_ENABLED = False
+METRICS_FLUSH_INTERVAL = 10
+METRICS_REDIS_URL = 'redis://localhost:6379/0'
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+# METRICS_STATSD = ('127.0.0.1', 8125)
+# METRICS_STATSD_PREFIX = 'newfies'
+
+# LEASE LOCKS
+# ===========
+# Redis holding the locks of the periodic tasks, share it between all the
+# nodes running celery workers. A lease lasts LOCK_TTL seconds and is renewed
+# while the task runs, the lock of a crashed worker is freed after LOCK_TTL
+LOCK_REDIS_URL = 'redis://localhost:6379/0'
+LOCK_TTL = 30
+
 
 # Survey in dev
 # =============
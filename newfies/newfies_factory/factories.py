@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import factory
 from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
 from user_profile.models import CalendarUserProfile, CalendarUser
 from calendar_settings.models import CalendarSetting
 from user_profile.models import UserProfile, Manager
@@ -10,6 +11,9 @@ from dialer_settings.models import DialerSetting
 from survey.models import Survey_template, Survey
 from dialer_campaign.constants import AMD_BEHAVIOR
 from sms.models import Gateway as SMSGateway
+from dialer_contact.models import Phonebook, Contact
+from dialer_campaign.models import Campaign, Subscriber
+from dialer_cdr.models import Callrequest, VoIPCall
 
 # label = models.CharField(max_length=80, blank=False, verbose_name=_("label"))
 # callerid = models.CharField(max_length=80, verbose_name=_("Caller ID Number"),
@@ -153,6 +157,85 @@ class SurveyFactory(factory.django.DjangoModelFactory):
     user = factory.SubFactory(UserFactory)
 
 
+class PhonebookFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = Phonebook
+
+    name = factory.Sequence(lambda n: 'phonebook-{0}'.format(n))
+    user = factory.SubFactory(UserFactory)
+
+
+class ContactFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = Contact
+
+    phonebook = factory.SubFactory(PhonebookFactory)
+    contact = factory.Sequence(lambda n: '34650{0:06d}'.format(n))
+    first_name = factory.Sequence(lambda n: 'John {0}'.format(n))
+    last_name = factory.Sequence(lambda n: 'Doe {0}'.format(n))
+    email = factory.Sequence(lambda n: 'contact{0}@example.com'.format(n))
+    country = 'ES'
+    city = 'Barcelona'
+
+
+class CampaignFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = Campaign
+
+    name = factory.Sequence(lambda n: 'campaign-{0}'.format(n))
+    user = factory.SubFactory(UserFactory)
+    aleg_gateway = factory.SubFactory(GatewayFactory)
+    content_type = factory.LazyAttribute(lambda o: ContentType.objects.get_for_model(Survey))
+    object_id = factory.LazyAttribute(lambda o: SurveyFactory(user=o.user).id)
+    frequency = 1000
+
+
+class SubscriberFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = Subscriber
+
+    campaign = factory.SubFactory(CampaignFactory)
+    contact = factory.SubFactory(ContactFactory)
+    duplicate_contact = factory.LazyAttribute(lambda o: o.contact.contact)
+
+
+class CallrequestFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = Callrequest
+
+    subscriber = factory.SubFactory(SubscriberFactory)
+    campaign = factory.LazyAttribute(lambda o: o.subscriber.campaign)
+    user = factory.LazyAttribute(lambda o: o.subscriber.campaign.user)
+    aleg_gateway = factory.LazyAttribute(lambda o: o.subscriber.campaign.aleg_gateway)
+    content_type = factory.LazyAttribute(lambda o: o.subscriber.campaign.content_type)
+    object_id = factory.LazyAttribute(lambda o: o.subscriber.campaign.object_id)
+    phone_number = factory.LazyAttribute(lambda o: o.subscriber.duplicate_contact)
+
+
+class VoIPCallFactory(factory.django.DjangoModelFactory):
+
+    class Meta:
+        model = VoIPCall
+
+    callrequest = factory.SubFactory(CallrequestFactory)
+    user = factory.LazyAttribute(lambda o: o.callrequest.user)
+    used_gateway = factory.LazyAttribute(lambda o: o.callrequest.aleg_gateway)
+    request_uuid = factory.LazyAttribute(lambda o: o.callrequest.request_uuid)
+    callid = factory.Sequence(lambda n: 'callid-{0}'.format(n))
+    callerid = '650123456'
+    phone_number = factory.LazyAttribute(lambda o: o.callrequest.phone_number)
+    duration = 60
+    billsec = 50
+    disposition = 'ANSWER'
+    hangup_cause = 'NORMAL_CLEARING'
+    hangup_cause_q850 = '16'
+
+
 class CalendarSettingFactory(factory.Factory):
 
     class Meta:
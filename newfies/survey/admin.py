@@ -15,7 +15,7 @@
 
 from django.contrib import admin
 from survey.models import Survey, Section, Branching, Survey_template, Section_template, \
-    Branching_template, Result, ResultAggregate
+    Branching_template, Result, ResultAggregate, ResultCube
 from adminsortable.admin import SortableAdmin, SortableTabularInline
 
 
@@ -126,3 +126,17 @@ class ResultAggregateAdmin(admin.ModelAdmin):
     ordering = ('id', )
 
 admin.site.register(ResultAggregate, ResultAggregateAdmin)
+
+
+class ResultCubeAdmin(admin.ModelAdmin):
+
+    """Allows the administrator to view the hourly survey result cube."""
+
+    list_display = ('id', 'survey', 'section', 'response',
+                    'bucket', 'count', 'recording_duration')
+    search_fields = ['survey']
+    list_filter = ['bucket', 'survey']
+    list_display_links = ('id',)
+    ordering = ('id', )
+
+admin.site.register(ResultCube, ResultCubeAdmin)
@@ -0,0 +1,44 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from survey.models import ResultCube
+
+
+class Command(BaseCommand):
+    args = 'survey_id'
+    help = "Rebuild the survey result cube from the survey results, of all the surveys\n" \
+           "or of a single survey\n" \
+           "--------------------------------------------------------------------------\n" \
+           "python manage.py backfill_result_cube --survey_id=1"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--survey_id', default=None, dest='survey_id', help=help),
+    )
+
+    def handle(self, *args, **options):
+        """
+        We will parse and set default values to parameters
+        """
+        survey_id = None
+        if options.get('survey_id'):
+            try:
+                survey_id = int(options.get('survey_id'))
+            except ValueError:
+                print("Invalid survey_id : %s" % options.get('survey_id'))
+                return False
+
+        count = ResultCube.objects.backfill(survey_id)
+        print("Result cube rebuilt from %d results" % count)
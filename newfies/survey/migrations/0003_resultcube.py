@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0002_auto_20150601_1855'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultCube',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('response', models.CharField(max_length=150, verbose_name='response')),
+                ('bucket', models.DateTimeField(verbose_name='hour')),
+                ('count', models.IntegerField(default=0, verbose_name='result count')),
+                ('recording_duration', models.BigIntegerField(default=0, verbose_name='recording duration')),
+                ('section', models.ForeignKey(related_name='result_cube', to='survey.Section')),
+                ('survey', models.ForeignKey(related_name='result_cube', to='survey.Survey')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ResultCubeWatermark',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('last_result_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resultcube',
+            unique_together=set([('survey', 'section', 'response', 'bucket')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='resultcube',
+            index_together=set([('survey', 'bucket')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0003_resultcube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TTSCache',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('engine', models.CharField(max_length=20, verbose_name='TTS engine')),
+                ('voice', models.CharField(default='', max_length=50, verbose_name='voice', blank=True)),
+                ('language', models.CharField(default='', max_length=10, verbose_name='language', blank=True)),
+                ('text_hash', models.CharField(max_length=32, verbose_name='text hash')),
+                ('filename', models.CharField(max_length=200, verbose_name='file name')),
+                ('size', models.IntegerField(default=0, verbose_name='size')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='hit count')),
+                ('last_used', models.DateTimeField(verbose_name='last used', db_index=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'TTS cache',
+                'verbose_name_plural': 'TTS cache',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ttscache',
+            unique_together=set([('engine', 'voice', 'language', 'text_hash')]),
+        ),
+    ]
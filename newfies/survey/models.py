@@ -12,16 +12,18 @@
 # Arezqui Belaid <info@star2billing.com>
 #
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
+from django.utils.timezone import utc
 from dialer_campaign.models import Campaign
 from dialer_cdr.models import Callrequest
 from survey.constants import SECTION_TYPE
 from audiofield.models import AudioFile
 from django_lets_go.language_field import LanguageField
 from adminsortable.models import Sortable
+from datetime import datetime, timedelta
 
 
 class Survey_abstract(models.Model):
@@ -70,9 +72,15 @@ class Survey_template(Survey_abstract):
         verbose_name = _("survey template")
         verbose_name_plural = _("survey templates")
 
+    @transaction.atomic
     def copy_survey_template(self, campaign_id=None):
         """
         copy survey template to survey when starting campaign
+
+        Sections and branching are copied with ``bulk_create``, the old to
+        new section IDs are mapped in memory through ``section_template``
+
+        Return the new survey
         """
         new_survey_obj = Survey.objects.create(
             name=self.name,
@@ -81,28 +89,32 @@ class Survey_template(Survey_abstract):
             user=self.user,
             campaign_id=campaign_id)
 
-        if campaign_id:
-            # updated campaign content_type & object_id with new survey object
-            survey_id = ContentType.objects.get(model='survey').id
-
-            campaign_obj = Campaign.objects.get(id=campaign_id)
-            campaign_obj.content_type_id = survey_id
-            campaign_obj.object_id = new_survey_obj.id
-            campaign_obj.save()
-
         # Copy Sections
-        section_template = Section_template.objects.filter(survey=self)
-        for section_temp in section_template:
-            section_temp.copy_section_template(new_survey_obj)
+        section_template_list = Section_template.objects.filter(survey=self).order_by('id')
+        Section.objects.bulk_create([
+            section_temp.get_copy_section(new_survey_obj.id) for section_temp in section_template_list
+        ])
+        old_new_section_dict = dict(
+            Section.objects.filter(survey=new_survey_obj).values_list('section_template', 'id'))
 
         # Copy Sections Branching
-        for section_temp in section_template:
-            # get the new created section
-            section = Section.objects.get(section_template=section_temp.id, survey=new_survey_obj)
-            # Now add the branching for this section
-            section_temp.copy_section_branching_template(section, new_survey_obj)
+        branching_template_list = Branching_template.objects\
+            .filter(section__survey=self).only('keys', 'section', 'goto')
+        Branching.objects.bulk_create([
+            Branching(
+                keys=branching_temp.keys,
+                section_id=old_new_section_dict[branching_temp.section_id],
+                goto_id=old_new_section_dict.get(branching_temp.goto_id))
+            for branching_temp in branching_template_list
+        ])
 
-        return True
+        if campaign_id:
+            # updated campaign content_type & object_id with new survey object
+            survey_content_type = ContentType.objects.get_for_model(Survey)
+            Campaign.objects.filter(id=campaign_id)\
+                .update(content_type=survey_content_type, object_id=new_survey_obj.id)
+
+        return new_survey_obj
 
 
 class Survey(Survey_abstract):
@@ -132,6 +144,7 @@ class Survey(Survey_abstract):
         else:
             return u"%s" % self.name
 
+    @transaction.atomic
     def create_duplicate_survey(self, campaign_obj, new_campaign):
         """create duplicate survey"""
         original_survey_id = self.id
@@ -141,30 +154,26 @@ class Survey(Survey_abstract):
         self.campaign = new_campaign
         self.save()
 
-        old_new_section_dict = {}
-        section_objs = Section.objects.filter(survey_id=original_survey_id).order_by('order')
+        # make clone of sections, the ids of a single bulk insert follow
+        # the order of the list so both lists can be zipped by id
+        section_objs = list(Section.objects.filter(survey_id=original_survey_id).order_by('id'))
+        old_section_id_list = [section_obj.id for section_obj in section_objs]
         for section_obj in section_objs:
-            old_section_id = section_obj.id
-
-            # make clone of section
             section_obj.pk = None
             section_obj.survey = self
-            section_obj.save()
-
-            old_new_section_dict[old_section_id] = section_obj.id
-
-        for old_section_id, new_section_id in old_new_section_dict.iteritems():
-            branching_objs = Branching.objects.filter(section_id=old_section_id)
-
-            for branching_obj in branching_objs:
-                new_goto_id = None
-                if branching_obj.goto_id is not None:
-                    new_goto_id = old_new_section_dict[branching_obj.goto_id]
-
-                branching_obj.pk = None
-                branching_obj.section_id = new_section_id
-                branching_obj.goto_id = new_goto_id
-                branching_obj.save()
+        Section.objects.bulk_create(section_objs)
+        new_section_id_list = Section.objects.filter(survey=self).order_by('id').values_list('id', flat=True)
+        old_new_section_dict = dict(zip(old_section_id_list, new_section_id_list))
+
+        branching_objs = Branching.objects.filter(section__survey_id=original_survey_id)\
+            .only('keys', 'section', 'goto')
+        Branching.objects.bulk_create([
+            Branching(
+                keys=branching_obj.keys,
+                section_id=old_new_section_dict[branching_obj.section_id],
+                goto_id=old_new_section_dict.get(branching_obj.goto_id))
+            for branching_obj in branching_objs
+        ])
 
         return self.id
 
@@ -340,12 +349,12 @@ class Section_template(Section_abstract):
         verbose_name = _("section template")
         verbose_name_plural = _("section templates")
 
-    def copy_section_template(self, new_survey_obj):
+    def get_copy_section(self, new_survey_id):
         """
-        copy section template to section when starting campaign
+        return an unsaved copy of the section template for the survey new_survey_id
         """
-        Section.objects.create(
-            survey_id=new_survey_obj.id,  # Survey
+        return Section(
+            survey_id=new_survey_id,  # Survey
             section_template=self.id,
             type=self.type,
             question=self.question,
@@ -377,6 +386,12 @@ class Section_template(Section_abstract):
             order=self.order,
             invalid_audiofile_id=self.invalid_audiofile_id,
         )
+
+    def copy_section_template(self, new_survey_obj):
+        """
+        copy section template to section when starting campaign
+        """
+        self.get_copy_section(new_survey_obj.id).save()
         return True
 
     def copy_section_branching_template(self, section, new_survey_obj):
@@ -556,6 +571,189 @@ class ResultAggregate(models.Model):
         return '[%s] %s = %s' % (self.id, self.section, self.response)
 
 
+class ResultCubeManager(models.Manager):
+
+    """ResultCube Manager"""
+
+    def add_result(self, result_list):
+        """
+        Add the results to the hourly buckets of the cube, the counts of
+        the existing buckets are incremented and the missing ones created
+        """
+        bucket_dict = {}
+        for result in result_list:
+            bucket = result.created_date.replace(minute=0, second=0, microsecond=0)
+            key = (result.section.survey_id, result.section_id, result.response, bucket)
+            (count, recording_duration) = bucket_dict.get(key, (0, 0))
+            bucket_dict[key] = (count + 1, recording_duration + (result.recording_duration or 0))
+        if not bucket_dict:
+            return 0
+
+        existing_dict = {}
+        survey_id_list = set(key[0] for key in bucket_dict)
+        bucket_list = set(key[3] for key in bucket_dict)
+        cube_list = self.filter(survey_id__in=survey_id_list, bucket__in=bucket_list)\
+            .values_list('id', 'survey_id', 'section_id', 'response', 'bucket')
+        for (cube_id, survey_id, section_id, response, bucket) in cube_list:
+            existing_dict[(survey_id, section_id, response, bucket)] = cube_id
+
+        bulk_record = []
+        for key, (count, recording_duration) in bucket_dict.items():
+            if key in existing_dict:
+                self.filter(id=existing_dict[key]).update(
+                    count=models.F('count') + count,
+                    recording_duration=models.F('recording_duration') + recording_duration)
+            else:
+                (survey_id, section_id, response, bucket) = key
+                bulk_record.append(ResultCube(
+                    survey_id=survey_id, section_id=section_id, response=response, bucket=bucket,
+                    count=count, recording_duration=recording_duration))
+        self.bulk_create(bulk_record)
+        return len(bucket_dict)
+
+    @transaction.atomic
+    def update_cube(self, limit=10000, lag=60):
+        """
+        Aggregate the results above the watermark into the cube, results
+        younger than ``lag`` seconds are left for the next run so that
+        rows committed out of id order are not skipped
+        """
+        watermark, created = ResultCubeWatermark.objects.select_for_update().get_or_create(id=1)
+        created_before = datetime.utcnow().replace(tzinfo=utc) - timedelta(seconds=lag)
+        result_list = list(Result.objects.select_related('section')
+                           .filter(id__gt=watermark.last_result_id, created_date__lt=created_before)
+                           .order_by('id')[:limit])
+        if not result_list:
+            return 0
+        self.add_result(result_list)
+        watermark.last_result_id = result_list[-1].id
+        watermark.save()
+        return len(result_list)
+
+    @transaction.atomic
+    def backfill(self, survey_id=None, chunk_size=10000):
+        """
+        Rebuild the cube, of a single survey or entirely, from the results
+        below the watermark
+        """
+        watermark, created = ResultCubeWatermark.objects.select_for_update().get_or_create(id=1)
+        result_list = Result.objects.select_related('section')
+        if survey_id:
+            self.filter(survey_id=survey_id).delete()
+            result_list = result_list.filter(section__survey_id=survey_id)
+        else:
+            self.all().delete()
+            watermark.last_result_id = Result.objects.aggregate(max_id=models.Max('id'))['max_id'] or 0
+            watermark.save()
+        result_list = result_list.filter(id__lte=watermark.last_result_id).order_by('id')
+
+        count = 0
+        last_id = 0
+        while True:
+            chunk = list(result_list.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            self.add_result(chunk)
+            count += len(chunk)
+            last_id = chunk[-1].id
+        return count
+
+    def get_survey_result(self, survey_result_kwargs):
+        """
+        Sum the counts and recording durations per section & response,
+        survey_result_kwargs filters on the survey and the bucket
+        """
+        return self.filter(**survey_result_kwargs)\
+            .values('section__question', 'response')\
+            .annotate(count=models.Sum('count'), recording_duration=models.Sum('recording_duration'))\
+            .order_by('section', 'response')
+
+
+class ResultCube(models.Model):
+
+    """
+    This gives survey result count & recording duration per hour, used to
+    display date filtered survey result
+
+    **Attributes**:
+
+        * ``response`` - survey question's response
+        * ``bucket`` - starting hour of the bucket
+        * ``count`` - number of results in the bucket
+        * ``recording_duration`` - sum of the recording durations in the bucket
+
+    **Relationships**:
+
+        * ``survey`` - Foreign key relationship to the Survey model.
+        * ``section`` - Foreign key relationship to the Section model.
+
+    **Name of DB table**: survey_resultcube
+    """
+    survey = models.ForeignKey(Survey, related_name='result_cube')
+    section = models.ForeignKey(Section, related_name='result_cube')
+    response = models.CharField(max_length=150, blank=False,
+                                verbose_name=_("response"))
+    bucket = models.DateTimeField(verbose_name=_("hour"))
+    count = models.IntegerField(default=0, verbose_name=_("result count"))
+    recording_duration = models.BigIntegerField(default=0, verbose_name=_("recording duration"))
+
+    objects = ResultCubeManager()
+
+    class Meta:
+        unique_together = ("survey", "section", "response", "bucket")
+        index_together = [["survey", "bucket"]]
+
+    def __unicode__(self):
+        return '[%s] %s %s = %s' % (self.id, self.bucket, self.section, self.response)
+
+
+class ResultCubeWatermark(models.Model):
+
+    """
+    Last ``survey_result`` id aggregated into the ResultCube
+    """
+    last_result_id = models.BigIntegerField(default=0)
+
+    def __unicode__(self):
+        return '%s' % self.last_result_id
+
+
+class TTSCache(models.Model):
+
+    """This keeps the metadata of the text-to-speech audio files cached on disk
+
+    **Attributes**:
+
+        * ``engine`` - TTS engine (FLITE, ACAPELA, MSTRANSLATOR)
+        * ``voice`` - voice of the engine
+        * ``language`` - language of the text
+        * ``text_hash`` - md5 of the voice, language & text
+        * ``filename`` - audio file name in the TTS cache directory
+        * ``size`` - audio file size in bytes
+        * ``hit_count`` - number of times the audio was served from the cache
+        * ``last_used`` - last time the audio was served, used for the LRU eviction
+
+    **Name of DB table**: survey_ttscache
+    """
+    engine = models.CharField(max_length=20, verbose_name=_("TTS engine"))
+    voice = models.CharField(max_length=50, blank=True, default='', verbose_name=_("voice"))
+    language = models.CharField(max_length=10, blank=True, default='', verbose_name=_("language"))
+    text_hash = models.CharField(max_length=32, verbose_name=_("text hash"))
+    filename = models.CharField(max_length=200, verbose_name=_("file name"))
+    size = models.IntegerField(default=0, verbose_name=_("size"))
+    hit_count = models.IntegerField(default=0, verbose_name=_("hit count"))
+    last_used = models.DateTimeField(db_index=True, verbose_name=_("last used"))
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("engine", "voice", "language", "text_hash")
+        verbose_name = _("TTS cache")
+        verbose_name_plural = _("TTS cache")
+
+    def __unicode__(self):
+        return '[%s] %s' % (self.id, self.filename)
+
+
 def post_save_add_script(sender, **kwargs):
     """A ``post_save`` signal is sent by the Contact model instance whenever
     it is going to save.
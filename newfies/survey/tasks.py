@@ -0,0 +1,103 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from celery.decorators import task
+from celery.task import PeriodicTask
+from celery.utils.log import get_task_logger
+from dialer_campaign.models import Campaign
+from survey.models import Survey_template, Survey, Section, ResultCube
+from survey.tts_cache import prerender_tts
+from mod_utils.lease_lock import lease_lock
+from datetime import timedelta
+
+logger = get_task_logger(__name__)
+
+
+@task(ignore_result=True)
+@lease_lock("survey_template_copy-{campaign_id}")
+def survey_template_copy(survey_template_id, campaign_id=None):
+    """
+    Copy the survey template to a survey and attach it to the campaign,
+    the campaign is not dialed until its content_type becomes survey.
+    The task is queued again by pending_call_processing while the campaign
+    points at the template, a campaign already attached is left as is
+
+    **Attributes**:
+
+        * ``survey_template_id`` - Survey_template ID
+        * ``campaign_id`` - Campaign ID
+    """
+    logger.info("TASK :: survey_template_copy = %d (campaign:%s)" % (survey_template_id, str(campaign_id)))
+    try:
+        survey_template = Survey_template.objects.get(pk=survey_template_id)
+    except Survey_template.DoesNotExist:
+        logger.error("Can't find the survey template %d" % survey_template_id)
+        return False
+
+    if campaign_id and not Campaign.objects.filter(
+            id=campaign_id, content_type__model='survey_template', object_id=survey_template_id).exists():
+        logger.info("Survey template already copied for campaign_id=%d" % campaign_id)
+        return False
+
+    survey = survey_template.copy_survey_template(campaign_id)
+    prerender_survey_tts.delay(survey.id)
+    return True
+
+
+@task(ignore_result=True)
+def prerender_survey_tts(survey_id):
+    """
+    Render into the TTS cache the static scripts of the sections of a
+    sealed survey, scripts with tags depend on the contact and are left
+    to the callflow
+
+    **Attributes**:
+
+        * ``survey_id`` - Survey ID
+    """
+    try:
+        survey = Survey.objects.get(pk=survey_id)
+    except Survey.DoesNotExist:
+        logger.error("Can't find the survey %d" % survey_id)
+        return False
+
+    text_list = []
+    for (script, confirm_script) in Section.objects.filter(survey=survey, audiofile__isnull=True)\
+            .values_list('script', 'confirm_script'):
+        text_list.append(script)
+        text_list.append(confirm_script)
+    text_list = [text for text in text_list if text and '{' not in text]
+
+    count = prerender_tts(text_list, survey.tts_language)
+    logger.info("TASK :: prerender_survey_tts = %d (rendered:%d)" % (survey_id, count))
+    return True
+
+
+class result_cube_update(PeriodicTask):
+
+    """A periodic task that aggregates the new survey results into the
+    hourly ResultCube
+
+    **Usage**:
+
+        result_cube_update.delay()
+    """
+    run_every = timedelta(seconds=60)
+
+    @lease_lock("result_cube_update")
+    def run(self, **kwargs):
+        logger.info("TASK :: result_cube_update")
+        count = ResultCube.objects.update_cube()
+        logger.info("result_cube_update aggregated %d results" % count)
+        return True
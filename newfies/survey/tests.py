@@ -17,9 +17,15 @@ from django.test import TestCase
 from django.http import Http404
 from django_lets_go.utils import BaseAuthenticatedClient
 from django.db.models.signals import post_save
+from survey import tts_cache
+from survey.tts_cache import get_tts_audio, evict_tts_cache, prerender_tts
+from datetime import timedelta
+import tempfile
+import shutil
+import os
 from survey.models import Survey, Survey_template, Section,\
     Section_template, Branching, Branching_template, Result, \
-    ResultAggregate, post_save_add_script
+    ResultAggregate, ResultCube, TTSCache, post_save_add_script
 from survey.forms import SurveyForm, PlayMessageSectionForm,\
     MultipleChoiceSectionForm, RatingSectionForm,\
     CaptureDigitsSectionForm, RecordMessageSectionForm,\
@@ -598,6 +604,45 @@ class SurveyModel(TestCase):
         self.assertEqual(
             self.result_aggregate.__unicode__(), '[1] [1] call transfer = apple')
 
+    def test_copy_survey_template(self):
+        """Test the bulk copy of survey template & the duplicate survey"""
+        survey_template = Survey_template.objects.get(pk=1)
+        section_count = Section_template.objects.filter(survey=survey_template).count()
+        branching_count = Branching_template.objects.filter(section__survey=survey_template).count()
+
+        self.assertTrue(survey_template.copy_survey_template())
+        new_survey = Survey.objects.order_by('-id')[0]
+        self.assertEqual(Section.objects.filter(survey=new_survey).count(), section_count)
+        self.assertEqual(Branching.objects.filter(section__survey=new_survey).count(), branching_count)
+
+        new_survey_id = new_survey.create_duplicate_survey(None, None)
+        self.assertNotEqual(new_survey_id, survey_template.id)
+        self.assertEqual(Section.objects.filter(survey_id=new_survey_id).count(), section_count)
+        self.assertEqual(Branching.objects.filter(section__survey_id=new_survey_id).count(), branching_count)
+        self.assertEqual(Branching.objects.filter(section__survey_id=new_survey_id, goto__isnull=False)
+                         .exclude(goto__survey_id=new_survey_id).count(), 0)
+
+    def test_result_cube(self):
+        """Test the incremental update & the backfill of the result cube"""
+        result_count = Result.objects.count()
+        self.assertEqual(ResultCube.objects.update_cube(lag=0), result_count)
+        # the watermark skips the results already aggregated
+        self.assertEqual(ResultCube.objects.update_cube(lag=0), 0)
+
+        survey_result = ResultCube.objects.get_survey_result({'survey_id': self.section.survey_id})
+        self.assertEqual(survey_result[0]['response'], 'apple')
+        self.assertEqual(survey_result[0]['count'], 1)
+
+        survey_result = ResultCube.objects.get_survey_result({
+            'survey_id': self.section.survey_id,
+            'bucket__lt': self.result.created_date - timedelta(hours=1)})
+        self.assertEqual(len(survey_result), 0)
+
+        self.assertEqual(ResultCube.objects.backfill(), result_count)
+        self.assertEqual(ResultCube.objects.backfill(self.section.survey_id), 1)
+        survey_result = ResultCube.objects.get_survey_result({'survey_id': self.section.survey_id})
+        self.assertEqual(survey_result[0]['count'], 1)
+
     def test_survey_forms(self):
         self.assertEqual(self.survey_template.name, "test_survey")
         #self.assertEqual(self.section_template.survey, self.survey_template)
@@ -679,3 +724,46 @@ class SurveyModel(TestCase):
         self.branching.delete()
         self.result.delete()
         self.result_aggregate.delete()
+
+
+class TTSCacheTestCase(TestCase):
+
+    """Test the TTS cache with a fake engine"""
+
+    def setUp(self):
+        self.render_count = 0
+        self.tts_cache_dir = tts_cache.TTS_CACHE_DIR
+        tts_cache.TTS_CACHE_DIR = tempfile.mkdtemp()
+
+        def synthesize_fake(text, voice, language, audio_file_path):
+            self.render_count += 1
+            audio_file = open(audio_file_path, 'w')
+            audio_file.write('x' * 100)
+            audio_file.close()
+            return True
+        tts_cache.TTS_ENGINE_FUNCTION['FAKE'] = synthesize_fake
+
+    def tearDown(self):
+        shutil.rmtree(tts_cache.TTS_CACHE_DIR)
+        tts_cache.TTS_CACHE_DIR = self.tts_cache_dir
+        del tts_cache.TTS_ENGINE_FUNCTION['FAKE']
+
+    def test_get_tts_audio(self):
+        """Test the cache hit & the LRU eviction"""
+        audio_file_path = get_tts_audio(u'Hello', 'en', engine='FAKE')
+        self.assertTrue(os.path.isfile(audio_file_path))
+        self.assertEqual(get_tts_audio(u'Hello', 'en', engine='FAKE'), audio_file_path)
+        self.assertEqual(self.render_count, 1)
+        self.assertEqual(TTSCache.objects.get().hit_count, 1)
+        self.assertEqual(get_tts_audio(u'World', 'fr', engine='FAKE', synthesize=False), None)
+
+        get_tts_audio(u'World', 'en', engine='FAKE')
+        self.assertEqual(evict_tts_cache(100), 1)
+        self.assertFalse(os.path.isfile(audio_file_path))
+        self.assertEqual(TTSCache.objects.count(), 1)
+
+    def test_prerender_tts(self):
+        """Test the pre-render of the texts missing from the cache"""
+        self.assertEqual(prerender_tts([u'Hello', u'World', u'Hello ', ''], 'en', engine='FAKE'), 2)
+        self.assertEqual(prerender_tts([u'Hello'], 'en', engine='FAKE'), 0)
+        self.assertEqual(self.render_count, 2)
@@ -0,0 +1,248 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils.timezone import utc
+from survey.models import TTSCache
+from survey.function_def import getaudio_acapela, getaudio_mstranslator
+from multiprocessing.pool import ThreadPool
+from datetime import datetime
+import subprocess
+import hashlib
+import shutil
+import logging
+import os
+
+logger = logging.getLogger('newfies.filelog')
+
+# Set TTS_CACHE_DIR to the TTS_DIR of the lua callflow to let the calls use
+# the pre-rendered audio files, the ACAPELA_GENDER & ACAPELA_INTONATION settings
+# must match the lua settings and the language of the survey its ACAPELA_LANG
+# or MSTRANSLATOR_LANG
+TTS_CACHE_DIR = getattr(settings, 'TTS_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'tts'))
+TTS_CACHE_MAX_SIZE = getattr(settings, 'TTS_CACHE_MAX_SIZE', 500 * 1024 * 1024)
+TTS_PRERENDER_POOL_SIZE = getattr(settings, 'TTS_PRERENDER_POOL_SIZE', 4)
+
+TTS_DEFAULT_VOICE = {
+    'FLITE': 'awb',
+    'ACAPELA': '%s_%s' % (getattr(settings, 'ACAPELA_GENDER', ''), getattr(settings, 'ACAPELA_INTONATION', '')),
+    'MSTRANSLATOR': '',
+}
+
+
+def synthesize_flite(text, voice, language, audio_file_path):
+    """
+    Run Flite Text2Speech into audio_file_path, flite has no language
+    """
+    text_file_path = audio_file_path + '.txt'
+    part_file_path = audio_file_path + '.part%d' % os.getpid()
+    text_file = open(text_file_path, "w")
+    text_file.write(text.encode('utf-8'))
+    text_file.close()
+
+    conv = ['flite', '--setf', 'duration_stretch=1.5', '-voice', voice, '-f', text_file_path, '-o', part_file_path]
+    try:
+        response = subprocess.Popen(conv, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        response.communicate()
+    except OSError:
+        logger.error("Flite is not installed")
+        return False
+    finally:
+        os.remove(text_file_path)
+    if not os.path.isfile(part_file_path):
+        return False
+    os.rename(part_file_path, audio_file_path)
+    return True
+
+
+def synthesize_acapela(text, voice, language, audio_file_path):
+    """
+    Run Acapela Text2Speech and move the audio into audio_file_path
+    """
+    shutil.move(os.path.join(settings.MEDIA_ROOT, getaudio_acapela(text, language)), audio_file_path)
+    return True
+
+
+def synthesize_mstranslator(text, voice, language, audio_file_path):
+    """
+    Run Microsoft Speak Text2Speech and move the audio into audio_file_path
+    """
+    shutil.move(os.path.join(settings.MEDIA_ROOT, getaudio_mstranslator(text, language)), audio_file_path)
+    return True
+
+
+# Engine name => function(text, voice, language, audio_file_path)
+TTS_ENGINE_FUNCTION = {
+    'FLITE': synthesize_flite,
+    'ACAPELA': synthesize_acapela,
+    'MSTRANSLATOR': synthesize_mstranslator,
+}
+
+
+def get_tts_key(text, language='en', engine=None, voice=None):
+    """
+    Return the cache key (engine, voice, language, text_hash) & the file name
+    of the text, the files are named as the lua callflow looks them up
+
+    >>> get_tts_key(u'Hello', engine='FLITE')[1]
+    'flite_04630719cfaf7edb5fa0544d23beee2c.wav'
+    >>> get_tts_key(u'Hello', 'EN', engine='ACAPELA', voice='W_NORMAL')[1]
+    'acapela_835c100e507519288f99ff47e50f26df.wav'
+    """
+    engine = (engine or settings.TTS_ENGINE).upper()
+    if engine not in TTS_ENGINE_FUNCTION:
+        engine = 'FLITE'
+    if voice is None:
+        voice = TTS_DEFAULT_VOICE.get(engine, '')
+    if engine == 'FLITE':
+        language = ''
+    language = (language or '').lower()
+    text_hash = hashlib.md5((u'%s%s%s' % (voice, language, text)).encode('utf-8')).hexdigest()
+    filename = '%s_%s.wav' % (engine.lower(), text_hash)
+    return ((engine, voice, language, text_hash), filename)
+
+
+def render_tts_file(engine, voice, language, text, filename):
+    """
+    Synthesize the text into the TTS cache directory without touching the
+    database, so it can run on the pre-render pool
+    """
+    audio_file_path = os.path.join(TTS_CACHE_DIR, filename)
+    if os.path.isfile(audio_file_path):
+        return True
+    if not os.path.isdir(TTS_CACHE_DIR):
+        os.makedirs(TTS_CACHE_DIR)
+    try:
+        return TTS_ENGINE_FUNCTION[engine](text, voice, language, audio_file_path)
+    except Exception as e:
+        logger.error("TTS %s failed to render %s : %s" % (engine, filename, e))
+        return False
+
+
+def render_tts_item(item):
+    """Render a (key, text, filename) item of the pre-render pool"""
+    ((engine, voice, language, text_hash), text, filename) = item
+    return render_tts_file(engine, voice, language, text, filename)
+
+
+def record_tts_cache(key, filename):
+    """
+    Save the metadata of an audio file rendered into the TTS cache directory
+    """
+    (engine, voice, language, text_hash) = key
+    now = datetime.utcnow().replace(tzinfo=utc)
+    size = os.path.getsize(os.path.join(TTS_CACHE_DIR, filename))
+    updated = TTSCache.objects.filter(engine=engine, voice=voice, language=language, text_hash=text_hash)\
+        .update(filename=filename, size=size, last_used=now)
+    if not updated:
+        try:
+            TTSCache.objects.create(engine=engine, voice=voice, language=language, text_hash=text_hash,
+                                    filename=filename, size=size, last_used=now)
+        except IntegrityError:
+            # recorded by a concurrent render
+            pass
+
+
+def evict_tts_cache(max_size=None):
+    """
+    Remove the least recently used audio files until the TTS cache fits in max_size bytes
+    """
+    if max_size is None:
+        max_size = TTS_CACHE_MAX_SIZE
+    total_size = TTSCache.objects.aggregate(total_size=Sum('size'))['total_size'] or 0
+    if total_size <= max_size:
+        return 0
+    evicted_id_list = []
+    for tts_cache in TTSCache.objects.order_by('last_used').only('id', 'filename', 'size').iterator():
+        if total_size <= max_size:
+            break
+        audio_file_path = os.path.join(TTS_CACHE_DIR, tts_cache.filename)
+        if os.path.isfile(audio_file_path):
+            os.remove(audio_file_path)
+        total_size -= tts_cache.size
+        evicted_id_list.append(tts_cache.id)
+    if evicted_id_list:
+        TTSCache.objects.filter(id__in=evicted_id_list).delete()
+    return len(evicted_id_list)
+
+
+def get_tts_audio(text, language='en', engine=None, voice=None, synthesize=True):
+    """
+    Return the path of the audio file of the text from the TTS cache, the
+    text is synthesized on a miss unless synthesize is False
+    """
+    text = (text or '').strip()
+    if not text:
+        return None
+    (key, filename) = get_tts_key(text, language, engine, voice)
+    (engine, voice, language, text_hash) = key
+    audio_file_path = os.path.join(TTS_CACHE_DIR, filename)
+
+    now = datetime.utcnow().replace(tzinfo=utc)
+    cached = TTSCache.objects.filter(engine=engine, voice=voice, language=language, text_hash=text_hash)\
+        .update(hit_count=F('hit_count') + 1, last_used=now)
+    if cached and os.path.isfile(audio_file_path):
+        return audio_file_path
+    if not synthesize:
+        return None
+
+    if not render_tts_file(engine, voice, language, text, filename):
+        return None
+    record_tts_cache(key, filename)
+    evict_tts_cache()
+    return audio_file_path
+
+
+def prerender_tts(text_list, language='en', engine=None, pool_size=None):
+    """
+    Render the texts missing from the TTS cache on a pool, the engines run
+    outside python (subprocess or HTTP) so the pool uses threads, celery
+    workers being daemonic processes they can't fork a process pool
+
+    Return the number of texts rendered
+    """
+    render_dict = {}
+    for text in text_list:
+        text = (text or '').strip()
+        if text:
+            (key, filename) = get_tts_key(text, language, engine)
+            render_dict[key] = (text, filename)
+    if not render_dict:
+        return 0
+
+    cached_filename_list = set(TTSCache.objects
+                               .filter(filename__in=[filename for (text, filename) in render_dict.values()])
+                               .values_list('filename', flat=True))
+    render_list = [(key, text, filename) for key, (text, filename) in render_dict.items()
+                   if filename not in cached_filename_list or
+                   not os.path.isfile(os.path.join(TTS_CACHE_DIR, filename))]
+    if not render_list:
+        return 0
+
+    pool = ThreadPool(pool_size or TTS_PRERENDER_POOL_SIZE)
+    try:
+        result_list = pool.map(render_tts_item, render_list)
+    finally:
+        pool.close()
+        pool.join()
+
+    count = 0
+    for (key, text, filename), rendered in zip(render_list, result_list):
+        if rendered:
+            record_tts_cache(key, filename)
+            count += 1
+    evict_tts_cache()
+    return count
@@ -25,7 +25,7 @@ from django.utils.timezone import utc
 from dialer_cdr.models import VoIPCall
 from dialer_cdr.constants import CALL_DISPOSITION
 from survey.models import Survey_template, Survey, Section_template, Section,\
-    Branching_template, Branching, Result, ResultAggregate
+    Branching_template, Branching, Result, ResultCube
 from survey.forms import SurveyForm, PlayMessageSectionForm,\
     MultipleChoiceSectionForm, RatingSectionForm,\
     CaptureDigitsSectionForm, RecordMessageSectionForm,\
@@ -35,15 +35,13 @@ from survey.forms import SurveyForm, PlayMessageSectionForm,\
 from survey.constants import SECTION_TYPE, SURVEY_COLUMN_NAME, SURVEY_CALL_RESULT_NAME,\
     SEALED_SURVEY_COLUMN_NAME
 from survey.models import post_save_add_script
-from survey.function_def import getaudio_acapela
-from survey.function_def import getaudio_mstranslator
+from survey.tts_cache import get_tts_audio
+from survey.tasks import prerender_survey_tts
 from django_lets_go.common_functions import striplist, ceil_strdate, getvar, unset_session_var,\
     get_pagination_vars
 from mod_utils.helper import Export_choice
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import subprocess
-import hashlib
 import tablib
 import csv
 import os
@@ -506,40 +504,14 @@ def section_script_play(request, id):
 
     **Logic Description**:
 
-        * Create text file from section script
-        * Convert text file into wav file
+        * Get the wav file of the section script from the TTS cache
     """
     section = get_object_or_404(Section_template, pk=id, survey__user=request.user)
 
     if section.script:
-        script_text = section.script
-
-        if settings.TTS_ENGINE == 'ACAPELA':
-            # Acapela
-            audio_file_path = settings.MEDIA_ROOT + '/' + getaudio_acapela(script_text, 'US')
-        elif settings.TTS_ENGINE == 'MSTRANSLATOR':
-            # Microsoft Translator
-            audio_file_path = settings.MEDIA_ROOT + '/' + getaudio_mstranslator(script_text, 'en')
-        else:
-            # Flite
-            script_hexdigest = hashlib.md5(script_text).hexdigest()
-            file_path = '%s/tts/flite_%s' % (settings.MEDIA_ROOT, script_hexdigest)
-            audio_file_path = file_path + '.wav'
-            text_file_path = file_path + '.txt'
-
-            if not os.path.isfile(audio_file_path):
-                # Write text to file
-                text_file = open(text_file_path, "w")
-                text_file.write(script_text)
-                text_file.close()
-
-                # Convert file
-                conv = 'flite --setf duration_stretch=1.5 -voice awb -f %s -o %s' % (text_file_path, audio_file_path)
-                try:
-                    response = subprocess.Popen(conv.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    (filetype, error) = response.communicate()
-                except OSError:
-                    raise Http404
+        audio_file_path = get_tts_audio(section.script, section.survey.tts_language)
+        if audio_file_path is None:
+            raise Http404
 
         if os.path.isfile(audio_file_path):
             response = HttpResponse()
@@ -774,10 +746,8 @@ def survey_cdr_daily_report(all_call_list):
 
 
 def get_survey_result(survey_result_kwargs):
-    """Get survey result report from the selected Survey"""
-    survey_result = ResultAggregate.objects.values('section__question', 'response', 'count')\
-        .filter(**survey_result_kwargs).order_by('section')
-    return survey_result
+    """Get survey result report from the selected Survey, summed from the hourly result cube"""
+    return ResultCube.objects.get_survey_result(survey_result_kwargs)
 
 
 def survey_audio_recording(audio_file):
@@ -895,13 +865,13 @@ def survey_report(request):
 
     if start_date and end_date:
         kwargs['starting_date__range'] = (start_date, end_date)
-        survey_result_kwargs['created_date__range'] = (start_date, end_date)
+        survey_result_kwargs['bucket__range'] = (start_date, end_date)
     if start_date and end_date == '':
         kwargs['starting_date__gte'] = start_date
-        survey_result_kwargs['created_date__gte'] = start_date
+        survey_result_kwargs['bucket__gte'] = start_date
     if start_date == '' and end_date:
         kwargs['starting_date__lte'] = end_date
-        survey_result_kwargs['created_date__lte'] = end_date
+        survey_result_kwargs['bucket__lte'] = end_date
 
     all_call_list = []
     try:
@@ -1263,7 +1233,8 @@ def seal_survey(request, object_id):
         if form.is_valid():
             survey_template = get_object_or_404(Survey_template, pk=object_id, user=request.user)
             survey_template.name = request.POST.get('name', survey_template.name)
-            survey_template.copy_survey_template()
+            survey = survey_template.copy_survey_template()
+            prerender_survey_tts.delay(survey.id)
             request.session['msg'] = '"%s" survey is sealed successfully' % survey_template.name
             return HttpResponseRedirect(redirect_url_to_survey_list)
         else:
@@ -0,0 +1,291 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Microbenchmarks of the dialer hot paths
+
+They are not collected by the test suite, run them with::
+
+    py.test tests/benchmarks.py
+
+The wall time & the number of queries of each benchmark are written to
+``tests/benchmark_results.json`` (or $BENCHMARK_RESULTS) and checked against
+``tests/benchmark_budget.json``. A benchmark fails the run when it runs more
+queries than its budget, or takes longer than its budget time plus
+$BENCHMARK_TIME_TOLERANCE (1.0 by default, twice the budget time) to absorb
+the speed of the machine. A benchmark without budget fails as well.
+Record the budget on the reference machine with::
+
+    BENCHMARK_UPDATE_BUDGET=1 py.test tests/benchmarks.py
+"""
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import utc
+from celery import current_app
+from newfies_factory.factories import UserFactory, PhonebookFactory, ContactFactory, CampaignFactory, \
+    SubscriberFactory, CallrequestFactory, VoIPCallFactory
+from dialer_campaign.constants import CAMPAIGN_STATUS, SUBSCRIBER_STATUS
+from dialer_campaign.models import Subscriber, common_contact_authorization
+from dialer_campaign.tasks import pending_call_processing
+from dialer_contact.models import Contact
+from dialer_cdr.models import Callrequest, VoIPCall
+from dialer_cdr.tasks import get_callevent_callrequest, handle_callevent
+from dialer_cdr.utils import voipcall_save
+from dialer_cdr.views import export_voipcall_report
+from dialer_settings.models import DialerSetting
+from frontend.views import customer_dashboard
+from datetime import datetime
+from time import time
+import json
+import os
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_RESULTS = os.environ.get('BENCHMARK_RESULTS', os.path.join(BENCHMARK_DIR, 'benchmark_results.json'))
+BENCHMARK_BUDGET = os.path.join(BENCHMARK_DIR, 'benchmark_budget.json')
+BENCHMARK_UPDATE_BUDGET = bool(os.environ.get('BENCHMARK_UPDATE_BUDGET'))
+# Fraction of the budget time a benchmark may take over it
+BENCHMARK_TIME_TOLERANCE = float(os.environ.get('BENCHMARK_TIME_TOLERANCE', 1.0))
+
+benchmark_results = {}
+
+
+def load_json(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def save_json(path, data):
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=4, sort_keys=True, separators=(',', ': '))
+        json_file.write('\n')
+
+
+class BenchmarkTestCase(TestCase):
+
+    """
+    Run each benchmark a few rounds, the fastest round is kept and compared
+    to the budget along with the number of queries of the round
+    """
+    rounds = 3
+
+    @classmethod
+    def tearDownClass(cls):
+        results = load_json(BENCHMARK_RESULTS)
+        results.update(benchmark_results)
+        save_json(BENCHMARK_RESULTS, results)
+        if BENCHMARK_UPDATE_BUDGET:
+            budget = load_json(BENCHMARK_BUDGET)
+            for name, result in benchmark_results.items():
+                budget[name] = {'time': result['time'], 'queries': result['queries']}
+            save_json(BENCHMARK_BUDGET, budget)
+        super(BenchmarkTestCase, cls).tearDownClass()
+
+    def benchmark(self, name, func, setup=None, rounds=None, unit=1):
+        """
+        Time func, setup runs before each round out of the timing
+
+        **Attributes**:
+
+            * ``unit`` - number of items processed by func, to report the time per item
+        """
+        time_list = []
+        queries = 0
+        for i in range(rounds or self.rounds):
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as context:
+                start = time()
+                func()
+                time_list.append(time() - start)
+            queries = len(context.captured_queries)
+        time_list.sort()
+        result = {
+            'time': round(time_list[0], 6),
+            'median': round(time_list[len(time_list) // 2], 6),
+            'time_per_unit': round(time_list[0] / unit, 6),
+            'unit': unit,
+            'queries': queries,
+        }
+        benchmark_results[name] = result
+
+        if BENCHMARK_UPDATE_BUDGET:
+            return result
+        budget = load_json(BENCHMARK_BUDGET).get(name)
+        self.assertTrue(budget, "%s has no budget in %s" % (name, BENCHMARK_BUDGET))
+        self.assertLessEqual(result['queries'], budget['queries'],
+                             "%s ran %d queries, budget %d" % (name, result['queries'], budget['queries']))
+        max_time = budget['time'] * (1 + BENCHMARK_TIME_TOLERANCE)
+        self.assertLessEqual(result['time'], max_time,
+                             "%s took %.4fs, budget %.4fs (%.4fs with tolerance)"
+                             % (name, result['time'], budget['time'], max_time))
+        return result
+
+
+class DialerBenchmark(BenchmarkTestCase):
+
+    """Benchmarks of the dialer hot paths, the data come from newfies_factory"""
+
+    no_subscriber = 1000
+    no_callevent = 100
+    no_voipcall = 1000
+    no_import_row = 100000
+    no_iteration = 10000
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.factory = RequestFactory()
+        self.campaign = CampaignFactory(user=self.user, status=CAMPAIGN_STATUS.START, has_been_started=True)
+        self.phonebook = PhonebookFactory(user=self.user)
+        self.campaign.phonebook.add(self.phonebook)
+
+    def create_subscriber(self, count):
+        """Create the contacts & the subscribers of the campaign in bulk"""
+        Contact.objects.bulk_create(ContactFactory.build_batch(count, phonebook=self.phonebook))
+        Subscriber.objects.bulk_create([
+            SubscriberFactory.build(campaign=self.campaign, contact=contact)
+            for contact in Contact.objects.filter(phonebook=self.phonebook)
+        ])
+        return list(Subscriber.objects.filter(campaign=self.campaign))
+
+    def create_callrequest(self, count):
+        return [CallrequestFactory(subscriber=subscriber) for subscriber in self.create_subscriber(count)]
+
+    def create_voipcall(self, count):
+        Callrequest.objects.bulk_create([
+            CallrequestFactory.build(subscriber=subscriber) for subscriber in self.create_subscriber(count)
+        ])
+        VoIPCall.objects.bulk_create([
+            VoIPCallFactory.build(callrequest=callrequest)
+            for callrequest in Callrequest.objects.filter(campaign=self.campaign).select_related('subscriber')
+        ])
+
+    def test_pending_call_processing(self):
+        """pending_call_processing for 1000 subscribers, the init_callrequest are published not run"""
+        self.create_subscriber(self.no_subscriber)
+
+        def setup():
+            Callrequest.objects.filter(campaign=self.campaign).delete()
+            Subscriber.objects.filter(campaign=self.campaign).update(status=SUBSCRIBER_STATUS.PENDING)
+
+        always_eager = current_app.conf.CELERY_ALWAYS_EAGER
+        current_app.conf.CELERY_ALWAYS_EAGER = False
+        try:
+            self.benchmark('pending_call_processing', lambda: pending_call_processing().run(self.campaign.id),
+                           setup=setup, unit=self.no_subscriber)
+        finally:
+            current_app.conf.CELERY_ALWAYS_EAGER = always_eager
+        self.assertEqual(Callrequest.objects.filter(campaign=self.campaign).count(), self.no_subscriber)
+
+    def test_process_callevent(self):
+        """process_callevent per call event"""
+        now = datetime.utcnow().replace(tzinfo=utc)
+        record_list = [
+            (i, 'CHANNEL_HANGUP_COMPLETE', '', callrequest.request_uuid, 'call-uuid-%d' % i,
+             callrequest.aleg_gateway_id, callrequest.id, 0, '650123456', callrequest.phone_number,
+             60, 50, 'NORMAL_CLEARING', '16', now, 1, now, 'person', 'aleg')
+            for i, callrequest in enumerate(self.create_callrequest(self.no_callevent))
+        ]
+
+        def run():
+            callrequest_list = get_callevent_callrequest(record_list)
+            for record in record_list:
+                handle_callevent(record, callrequest_list[record[0]])
+
+        self.benchmark('process_callevent', run, setup=lambda: VoIPCall.objects.all().delete(),
+                       unit=self.no_callevent)
+        self.assertEqual(VoIPCall.objects.count(), self.no_callevent)
+
+    def test_voipcall_save(self):
+        """voipcall_save per CDR"""
+        callrequest_list = self.create_callrequest(self.no_callevent)
+
+        def run():
+            for callrequest in callrequest_list:
+                voipcall_save(callrequest, callrequest.request_uuid, hangup_cause='NORMAL_CLEARING',
+                              hangup_cause_q850='16', callerid='650123456', phonenumber=callrequest.phone_number,
+                              call_uuid=callrequest.request_uuid, duration=60, billsec=50)
+
+        self.benchmark('voipcall_save', run, setup=lambda: VoIPCall.objects.all().delete(),
+                       unit=self.no_callevent)
+
+    def test_contact_import(self):
+        """contact_import of 100k rows"""
+        csv_data = ''.join([
+            '34650%06d|Doe|John|john@example.com|contact|1|address|city|state|ES|unit|{"age":"32"}\n' % i
+            for i in range(self.no_import_row)
+        ])
+        self.client.login(username=self.user.username, password='1234')
+
+        def run():
+            csv_file = SimpleUploadedFile('contacts.csv', csv_data.encode('utf-8'), content_type='text/csv')
+            response = self.client.post('/contact_import/', {'phonebook': self.phonebook.id, 'csv_file': csv_file})
+            self.assertEqual(response.status_code, 200)
+
+        self.benchmark('contact_import', run, setup=lambda: Contact.objects.filter(phonebook=self.phonebook).delete(),
+                       rounds=1, unit=self.no_import_row)
+        self.assertEqual(Contact.objects.filter(phonebook=self.phonebook).count(), self.no_import_row)
+
+    def test_replace_tag(self):
+        """Contact.replace_tag"""
+        contact = ContactFactory.build(additional_vars={'age': '32', 'title': 'doctor'})
+        text = 'Hello {first_name} {last_name}, {title} of {age} calling {phone_number} from {city}'
+
+        def run():
+            for i in range(self.no_iteration):
+                contact.replace_tag(text)
+
+        self.benchmark('replace_tag', run, unit=self.no_iteration)
+
+    def test_common_contact_authorization(self):
+        """common_contact_authorization with a whitelist & a blacklist"""
+        dialersetting = DialerSetting(whitelist='^34', blacklist='^3465')
+        phonenumber_list = ['3465%07d' % i for i in range(self.no_iteration // 2)] + \
+            ['4420%07d' % i for i in range(self.no_iteration // 2)]
+
+        def run():
+            for phonenumber in phonenumber_list:
+                common_contact_authorization(dialersetting, phonenumber)
+
+        self.benchmark('common_contact_authorization', run, unit=self.no_iteration)
+
+    def test_customer_dashboard(self):
+        """customer_dashboard of a campaign with 1000 CDRs"""
+        self.create_voipcall(self.no_voipcall)
+
+        def run():
+            request = self.factory.get('/dashboard/')
+            request.user = self.user
+            request.session = {}
+            response = customer_dashboard(request)
+            self.assertEqual(response.status_code, 200)
+
+        self.benchmark('customer_dashboard', run)
+
+    def test_export_voipcall_report(self):
+        """export_voipcall_report of 1000 CDRs in each format"""
+        self.create_voipcall(self.no_voipcall)
+        for format_type in ('csv', 'json', 'xls'):
+            def run():
+                request = self.factory.get('/export_voipcall_report/?format=%s' % format_type)
+                request.user = self.user
+                request.session = {'voipcall_record_kwargs': {'user_id': self.user.id}}
+                response = export_voipcall_report(request)
+                self.assertEqual(response.status_code, 200)
+
+            self.benchmark('export_voipcall_report_%s' % format_type, run, unit=self.no_voipcall)
@@ -0,0 +1,276 @@
+#
+# Newfies-Dialer License
+# http://www.newfies-dialer.org
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Copyright (C) 2011-2015 Star2Billing S.L.
+#
+# The primary maintainer of this project is
+# Arezqui Belaid <info@star2billing.com>
+#
+
+"""
+Fake FreeSWITCH speaking the inbound event socket protocol, to test and
+benchmark the originate path without FreeSWITCH
+
+Usage::
+
+    server = FakeESLServer(latency=0.01, failure_rate=0.1).start()
+    with self.settings(ESL_HOSTNAME=server.host, ESL_PORT=server.port):
+        dial_out(dial_command, callrequest_id)
+    server.stop()
+
+Start several servers to test the routing on multiple nodes, ``stats``
+counts the connections & commands received by each of them.
+"""
+
+from dialer_cdr.fake_dialer import FAKE_DIALER_PROFILE, synthesize_call, write_call_event
+from django.db import connection
+from random import random
+from uuid import uuid1
+import threading
+import time
+import re
+try:
+    import SocketServer as socketserver
+    from urllib import quote
+except ImportError:
+    import socketserver
+    from urllib.parse import quote
+
+ORIGINATE_VARS = re.compile(r'\{([^}]*)\}')
+
+
+def parse_originate_vars(originate):
+    """
+    Return the channel variables of an originate command
+
+    >>> sorted(parse_originate_vars("originate {callrequest_id=1,leg_type=1}user/1000 &park").items())
+    [('callrequest_id', '1'), ('leg_type', '1')]
+    """
+    channel_vars = {}
+    match = ORIGINATE_VARS.search(originate)
+    if match:
+        for item in match.group(1).split(','):
+            if '=' in item:
+                (name, value) = item.split('=', 1)
+                channel_vars[name.strip()] = value.strip().strip("'")
+    return channel_vars
+
+
+class FakeESLHandler(socketserver.StreamRequestHandler):
+
+    """One inbound event socket connection"""
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.write_lock = threading.Lock()
+        self.server.count('connection')
+
+    def send(self, headers, body=None):
+        """Send a message, the Content-Length is computed from the body"""
+        if body is not None:
+            body = body.encode('utf-8')
+            headers = [('Content-Length', len(body))] + headers
+        data = ''.join(['%s: %s\n' % (name, value) for (name, value) in headers]).encode('utf-8') + b'\n'
+        with self.write_lock:
+            self.wfile.write(data + (body or b''))
+            self.wfile.flush()
+
+    def reply(self, reply_text, headers=()):
+        self.send([('Content-Type', 'command/reply'), ('Reply-Text', reply_text)] + list(headers))
+
+    def send_event(self, event_name, headers, body=None):
+        """Send an event in the plain format, the header values are url encoded"""
+        event = ''.join(['%s: %s\n' % (name, quote(str(value)))
+                         for (name, value) in [('Event-Name', event_name)] + headers])
+        if body:
+            event += 'Content-Length: %d\n\n%s' % (len(body), body)
+        self.send([('Content-Type', 'text/event-plain')], event)
+
+    def read_command(self):
+        """Read the lines of a command up to the empty line"""
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return None
+            line = line.decode('utf-8').rstrip('\r\n')
+            if not line:
+                if lines:
+                    return '\n'.join(lines)
+                continue
+            lines.append(line)
+
+    def handle(self):
+        self.send([('Content-Type', 'auth/request')])
+        authenticated = False
+        while True:
+            command = self.read_command()
+            if command is None:
+                break
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            if not authenticated:
+                if command == 'auth %s' % self.server.password:
+                    authenticated = True
+                    self.reply('+OK accepted')
+                    continue
+                self.server.count('auth_failure')
+                self.reply('-ERR invalid')
+                break
+
+            if command.startswith('event '):
+                self.server.subscribe(self)
+                self.reply('+OK event listener enabled plain')
+            elif command.startswith('api bgapi ') or command.startswith('bgapi '):
+                self.server.count('bgapi')
+                job_uuid = str(uuid1())
+                if command.startswith('api '):
+                    self.send([('Content-Type', 'api/response')], '+OK Job-UUID: %s\n' % job_uuid)
+                else:
+                    self.reply('+OK Job-UUID: %s' % job_uuid, [('Job-UUID', job_uuid)])
+                job = command.split(' ', 2 if command.startswith('api ') else 1)[-1]
+                timer = threading.Timer(self.server.call_latency, self.server.run_job, [job, job_uuid])
+                timer.daemon = True
+                timer.start()
+            elif command.startswith('api '):
+                self.server.count('api')
+                self.send([('Content-Type', 'api/response')], self.server.run_api(command[4:]))
+            elif command == 'exit':
+                self.reply('+OK bye')
+                break
+            else:
+                self.reply('-ERR command not found')
+        self.server.unsubscribe(self)
+
+
+class FakeESLServer(socketserver.ThreadingTCPServer):
+
+    """
+    Fake FreeSWITCH event socket
+
+    **Attributes**:
+
+        * ``latency`` - seconds to wait before replying to a command
+        * ``call_latency`` - seconds before the events of a bgapi job are sent
+        * ``failure_rate`` - ratio of originate failing with NORMAL_TEMPORARY_FAILURE
+        * ``profile`` - outcome distribution of the calls, see fake_dialer
+        * ``call_event`` - write the call_event rows as listener.lua does
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, password='ClueCon', latency=0, call_latency=0,
+                 failure_rate=0, profile=None, call_event=False):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), FakeESLHandler)
+        (self.host, self.port) = self.server_address[:2]
+        self.password = password
+        self.latency = latency
+        self.call_latency = call_latency
+        self.failure_rate = failure_rate
+        self.profile = profile or FAKE_DIALER_PROFILE
+        self.call_event = call_event
+        self.stats = {'connection': 0, 'auth_failure': 0, 'api': 0, 'bgapi': 0,
+                      'originate': 0, 'originate_failure': 0}
+        self.lock = threading.Lock()
+        self.subscriber_list = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def subscribe(self, handler):
+        with self.lock:
+            if handler not in self.subscriber_list:
+                self.subscriber_list.append(handler)
+
+    def unsubscribe(self, handler):
+        with self.lock:
+            if handler in self.subscriber_list:
+                self.subscriber_list.remove(handler)
+
+    def broadcast(self, event_name, headers, body=None):
+        with self.lock:
+            subscriber_list = list(self.subscriber_list)
+        for handler in subscriber_list:
+            try:
+                handler.send_event(event_name, headers, body)
+            except Exception:
+                self.unsubscribe(handler)
+
+    def run_api(self, command):
+        """Body of the api/response of a command"""
+        if command.startswith('originate'):
+            (call, channel_vars) = self.originate(command)
+            self.hangup(call, channel_vars)
+            if call['hangup_cause'] in ('NORMAL_CLEARING', 'ALLOTTED_TIMEOUT'):
+                return '+OK %s\n' % call['call_uuid']
+            return '-ERR %s\n' % call['hangup_cause']
+        if command == 'status':
+            return 'UP 0 years, 0 days\nFreeSWITCH (Version fake) is ready\n'
+        return '+OK\n'
+
+    def run_job(self, job, job_uuid):
+        """Send the BACKGROUND_JOB event of a bgapi job"""
+        if not job.startswith('originate'):
+            self.broadcast('BACKGROUND_JOB', [('Job-UUID', job_uuid), ('Job-Command', job.split(' ')[0])],
+                           self.run_api(job))
+            return
+        (call, channel_vars) = self.originate(job)
+        if call['hangup_cause'] in ('NORMAL_CLEARING', 'ALLOTTED_TIMEOUT'):
+            body = '+OK %s\n' % call['call_uuid']
+        else:
+            body = '-ERR %s\n' % call['hangup_cause']
+        self.broadcast('BACKGROUND_JOB', [('Job-UUID', job_uuid), ('Job-Command', 'originate')], body)
+        self.hangup(call, channel_vars, job_uuid)
+
+    def originate(self, command):
+        """Simulate the call of an originate, return the call & its channel variables"""
+        self.count('originate')
+        channel_vars = parse_originate_vars(command)
+        call = {'call_uuid': str(uuid1()), 'duration': 0, 'billsec': 0, 'amd_status': 'person'}
+        if random() < self.failure_rate:
+            self.count('originate_failure')
+            call.update({'hangup_cause': 'NORMAL_TEMPORARY_FAILURE', 'hangup_cause_q850': '41'})
+        else:
+            (call['hangup_cause'], call['hangup_cause_q850'], call['amd_status'], call['duration'],
+             call['billsec']) = synthesize_call(self.profile, int(channel_vars.get('originate_timeout') or 45))
+        return (call, channel_vars)
+
+    def hangup(self, call, channel_vars, job_uuid=''):
+        """Send the CHANNEL_HANGUP_COMPLETE of the call"""
+        self.broadcast('CHANNEL_HANGUP_COMPLETE', [
+            ('Unique-ID', call['call_uuid']),
+            ('variable_hangup_cause', call['hangup_cause']),
+            ('variable_hangup_cause_q850', call['hangup_cause_q850']),
+            ('variable_amd_status', call['amd_status']),
+            ('variable_duration', call['duration']),
+            ('variable_billsec', call['billsec']),
+            ('variable_callrequest_id', channel_vars.get('callrequest_id', '')),
+            ('variable_legtype', 'aleg'),
+        ])
+        if self.call_event:
+            write_call_event(job_uuid, call['call_uuid'], channel_vars.get('used_gateway_id') or None,
+                             channel_vars.get('callrequest_id') or None,
+                             channel_vars.get('dialout_phone_number', ''),
+                             channel_vars.get('origination_caller_id_number', ''),
+                             call['duration'], call['billsec'], call['hangup_cause'],
+                             call['hangup_cause_q850'], call['amd_status'])
+            # the job runs in its own thread, so its own DB connection
+            connection.close()